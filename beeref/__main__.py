@@ -66,6 +66,7 @@ class BeeRefMainWindow(QtWidgets.QMainWindow):
     def closeEvent(self, event):
         geom = self.saveGeometry()
         self.view.settings.setValue('MainWindow/geometry', geom)
+        self.view.on_close()
         event.accept()
 
     def __del__(self):
@@ -115,7 +116,8 @@ def main():
     app = BeeRefApplication(sys.argv)
     palette = create_palette_from_dict(constants.COLORS)
     app.setPalette(palette)
-    bee = BeeRefMainWindow(app)  # NOQA:F841
+    bee = BeeRefMainWindow(app)
+    bee.view.offer_recovery()
 
     signal.signal(signal.SIGINT, handle_sigint)
     # Repeatedly run python-noop to give the interpreter time to
@@ -284,7 +284,7 @@ actions = ActionList([
         id='show_color_gamut',
         text='Show &Color Gamut',
         callback='on_action_show_color_gamut',
-        group='active_when_single_image',
+        group='active_when_image_selection',
     ),
     Action(
         id='sample_color',
@@ -30,22 +30,24 @@ class InsertItems(QtGui.QUndoCommand):
             self.ignore_first_redo = False
             return
 
-        self.scene.deselect_all_items()
-        if self.position:
-            self.old_positions = []
-            rect = self.scene.itemsBoundingRect(items=self.items)
+        with self.scene.batch():
+            self.scene.deselect_all_items()
+            if self.position:
+                self.old_positions = []
+                rect = self.scene.itemsBoundingRect(items=self.items)
+                for item in self.items:
+                    self.old_positions.append(item.pos())
+                    item.setPos(item.pos() + self.position - rect.center())
             for item in self.items:
-                self.old_positions.append(item.pos())
-                item.setPos(item.pos() + self.position - rect.center())
-        for item in self.items:
-            self.scene.addItem(item)
-            item.setSelected(True)
-            item.bring_to_front()
+                self.scene.addItem(item)
+                item.setSelected(True)
+                item.bring_to_front()
 
     def undo(self):
-        self.scene.deselect_all_items()
-        for item in self.items:
-            self.scene.removeItem(item)
+        with self.scene.batch():
+            self.scene.deselect_all_items()
+            for item in self.items:
+                self.scene.removeItem(item)
         if self.position:
             for item, pos in zip(self.items, self.old_positions):
                 item.setPos(pos)
@@ -58,14 +60,16 @@ class DeleteItems(QtGui.QUndoCommand):
         self.items = items
 
     def redo(self):
-        for item in self.items:
-            self.scene.removeItem(item)
+        with self.scene.batch():
+            for item in self.items:
+                self.scene.removeItem(item)
 
     def undo(self):
-        self.scene.deselect_all_items()
-        for item in self.items:
-            item.setSelected(True)
-            self.scene.addItem(item)
+        with self.scene.batch():
+            self.scene.deselect_all_items()
+            for item in self.items:
+                item.setSelected(True)
+                self.scene.addItem(item)
 
 
 class MoveItemsBy(QtGui.QUndoCommand):
@@ -117,6 +117,11 @@ class BeeSettings(QtCore.QSettings):
             'default': True,
             'cast': bool,
         },
+        'Save/autosave_interval': {
+            'default': 5,
+            'cast': int,
+            'validate': lambda x: 0 <= x <= 120,
+        },
         'Items/image_storage_format': {
             'default': 'best',
             'validate': lambda x: x in ('png', 'jpg', 'best'),
@@ -136,7 +141,17 @@ class BeeSettings(QtCore.QSettings):
             'cast': int,
             'validate': lambda x: x >= 0,
             'post_save_callback': QtGui.QImageReader.setAllocationLimit,
-        }
+        },
+        'Items/pixmap_memory_budget': {
+            'default': 2048,
+            'cast': int,
+            'validate': lambda x: x >= 0,
+        },
+        'Items/color_sample_size': {
+            'default': 1,
+            'cast': int,
+            'validate': lambda x: x >= 1,
+        },
     }
 
     def __init__(self):
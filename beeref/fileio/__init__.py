@@ -14,67 +14,106 @@
 # along with BeeRef.  If not, see <https://www.gnu.org/licenses/>.
 
 import logging
+import os.path
 
-from PyQt6 import QtCore
+from PyQt6 import QtCore, QtGui
 
 from beeref import commands
 from beeref.fileio.errors import BeeFileIOError
-from beeref.fileio.image import load_image
-from beeref.fileio.sql import SQLiteIO, is_bee_file
-from beeref.items import BeePixmapItem
+from beeref.fileio.image import encoded_image_data, load_image
+from beeref.fileio.snapshot import SceneSnapshot
+from beeref.fileio.sql import SQLiteIO, is_bee_file, remove_bee_file
+from beeref.items import BeePixmapItem, BeeTiledPixmapItem
+from beeref.utils import parallel_map
 
 
 __all__ = [
     'is_bee_file',
+    'remove_bee_file',
     'load_bee',
     'save_bee',
     'load_images',
     'ThreadedLoader',
     'BeeFileIOError',
+    'SceneSnapshot',
+    'encoded_image_data',
 ]
 
 logger = logging.getLogger(__name__)
 
 
-def load_bee(filename, scene, worker=None):
-    """Load BeeRef native file."""
+def load_bee(filename, scene, lazy=False, worker=None):
+    """Load BeeRef native file.
+
+    :param lazy: Only decode images once they are needed
+    """
     logger.info(f'Loading from file {filename}...')
-    io = SQLiteIO(filename, scene, readonly=True, worker=worker)
+    io = SQLiteIO(filename, scene, readonly=True, worker=worker, lazy=lazy)
     return io.read()
 
 
-def save_bee(filename, scene, create_new=False, worker=None):
-    """Save BeeRef native file."""
+def save_bee(filename, scene, create_new=False, wal=False,
+             keep_source_data=False, worker=None):
+    """Save BeeRef native file.
+
+    :param scene: The scene, or a ``SceneSnapshot`` of it when saving
+        in a worker thread
+    :param wal: Use SQLite's write-ahead log while saving, so that the
+        file can still be read from in the meantime
+    :param keep_source_data: Don't read the images back from the file
+        when needed, e.g. because the file is removed later on
+    """
     logger.info(f'Saving to file {filename}...')
     logger.debug(f'Create new: {create_new}')
-    io = SQLiteIO(filename, scene, create_new, worker=worker)
+    io = SQLiteIO(filename, scene, create_new, worker=worker, wal=wal,
+                  keep_source_data=keep_source_data)
     io.write()
     logger.info('End save')
 
 
+def load_image_or_data(path):
+    """Loads an image like ``load_image``, unless it is a local file
+    too big to be decoded as a whole. Then only its encoded data is
+    read, and the returned image is ``None``.
+    """
+
+    if isinstance(path, str) or path.isLocalFile():
+        filename = path if isinstance(path, str) else path.toLocalFile()
+        filename = os.path.normpath(filename)
+        if BeeTiledPixmapItem.needs_tiling(QtGui.QImageReader(filename)):
+            logger.debug(f'Image needs tiling: {filename}')
+            with open(filename, 'rb') as f:
+                return (None, filename, f.read())
+    return load_image(path)
+
+
 def load_images(filenames, pos, scene, worker):
     """Add images to existing scene."""
 
     errors = []
     items = []
     worker.begin_processing.emit(len(filenames))
-    for i, filename in enumerate(filenames):
-        logger.info(f'Loading image from file {filename}')
-        img, filename = load_image(filename)
+    # Decode images in parallel while we add them to the scene:
+    results = parallel_map(load_image_or_data, filenames)
+    for i, (img, filename, data) in enumerate(results):
+        logger.info(f'Loaded image from file {filename}')
         worker.progress.emit(i)
-        if img.isNull():
+        if img is None:
+            item = BeeTiledPixmapItem(data, filename)
+        elif img.isNull():
             logger.info(f'Could not load file {filename}')
             errors.append(filename)
             continue
-
-        item = BeePixmapItem(img, filename)
+        else:
+            item = BeePixmapItem(img, filename)
+            item.source_data = data
         item.set_pos_center(pos)
-        scene.add_item_later({'item': item, 'type': 'pixmap'}, selected=True)
-        items.append(item)
+        itemdata = {'item': item, 'type': 'pixmap'}
+        if scene.add_item_later(itemdata, selected=True, worker=worker):
+            items.append(item)
         if worker.canceled:
             break
-        # Give main thread time to process items:
-        worker.msleep(10)
+    results.close()
 
     scene.undo_stack.push(
         commands.InsertItems(scene, items, ignore_first_redo=True))
@@ -23,11 +23,36 @@ from PyQt6 import QtCore, QtGui
 from .errors import BeeFileIOError
 from beeref import constants, widgets
 from beeref.items import BeePixmapItem
+from beeref.utils import image_to_bytes, parallel_map
 
 
 logger = logging.getLogger(__name__)
 
 
+def encode_image(image):
+    """Encode an image as returned by ``BeePixmapItem.image_for_export``.
+
+    Doesn't touch any item, so it can run in any thread.
+
+    :return: Tuple of ``(data, imgformat)``
+    """
+
+    img, imgformat = image
+    return (image_to_bytes(img, imgformat), imgformat)
+
+
+def create_and_encode_image(source):
+    """Create and encode an image via a callable as returned by
+    ``BeePixmapItem.export_image_source``.
+
+    Doesn't touch any item, so it can run in any thread.
+
+    :return: Tuple of ``(data, imgformat)``
+    """
+
+    return encode_image(source())
+
+
 class ExporterRegistry(dict):
 
     DEFAULT_TYPE = 0
@@ -162,6 +187,15 @@ class SceneToSVGExporter(SceneExporterBase):
 
     TYPE = 'svg'
 
+    def __init__(self, scene):
+        super().__init__(scene)
+        self.items = sorted(self.scene.items(), key=lambda x: x.zValue())
+        # Exporting runs in a worker thread, so get hold of the images
+        # on the main thread:
+        self.image_sources = [
+            item.export_image_source(apply_grayscale=True, apply_crop=True)
+            for item in self.items if item.TYPE == 'pixmap']
+
     def get_user_input(self, parent):
         self.size = self.default_size
         return True
@@ -197,8 +231,21 @@ class SceneToSVGExporter(SceneExporterBase):
         rect = self.scene.itemsBoundingRect()
         offset = rect.topLeft() - QtCore.QPointF(self.margin, self.margin)
 
-        for i, item in enumerate(sorted(self.scene.items(),
-                                        key=lambda x: x.zValue())):
+        # Encode images in parallel while we build the tree:
+        images = parallel_map(create_and_encode_image, self.image_sources)
+        try:
+            return self.build_svg(svg, offset, images, worker)
+        finally:
+            images.close()
+
+    def build_svg(self, svg, offset, images, worker):
+        """Adds an element for each item to the given svg tree.
+
+        :param images: Iterator over the encoded images of the pixmap
+            items, in the order of ``self.items``
+        """
+
+        for i, item in enumerate(self.items):
             # z order in SVG specified via the order of elements in the tree
             pos = item.pos() - offset
             anchor = pos
@@ -213,9 +260,7 @@ class SceneToSVGExporter(SceneExporterBase):
             if item.TYPE == 'pixmap':
                 width = item.width * item.scale()
                 height = item.height * item.scale()
-                pixmap, imgformat = item.pixmap_to_bytes(
-                    apply_grayscale=True,
-                    apply_crop=True)
+                pixmap, imgformat = next(images)
                 pixmap = base64.b64encode(pixmap).decode('ascii')
                 element = ET.Element(
                     'image',
@@ -287,6 +332,10 @@ class ImagesToDirectoryExporter(ExporterBase):
         self.scene = scene
         self.dirname = dirname
         self.items = list(self.scene.items_by_type(BeePixmapItem.TYPE))
+        # Exporting runs in a worker thread, so get hold of the images
+        # on the main thread:
+        self.image_sources = [item.export_image_source()
+                              for item in self.items]
         self.max_save_id = 0
         for item in self.items:
             if item.save_id:
@@ -302,15 +351,33 @@ class ImagesToDirectoryExporter(ExporterBase):
         self.emit_begin_processing(worker, self.num_total)
         self.emit_progress(worker, self.start_from)
 
-        for i, item in enumerate(
-                self.items[self.start_from:], start=self.start_from):
+        items = self.items[self.start_from:]
+        # Encode images in parallel while we write them:
+        images = parallel_map(create_and_encode_image,
+                              self.image_sources[self.start_from:])
+        try:
+            existing = self.write_images(zip(items, images), worker)
+        finally:
+            images.close()
+        if existing:
+            # Only ask once we are done encoding, so that the export
+            # can be restarted right away
+            self.emit_user_input_required(worker, existing)
+
+    def write_images(self, images, worker):
+        """Write the given ``(item, (data, imgformat))`` tuples to files.
+
+        :return: The path of an existing file if we need to ask the
+            user what to do about it, else ``None``
+        """
+
+        for i, (item, (pixmap, imgformat)) in enumerate(
+                images, start=self.start_from):
             if worker and worker.canceled:
                 logger.debug('Export canceled')
                 worker.finished.emit(self.dirname, [])
                 return
 
-            pixmap, imgformat = item.pixmap_to_bytes()
-
             if item.save_id:
                 filename = item.get_filename_for_export(imgformat)
             else:
@@ -329,8 +396,7 @@ class ImagesToDirectoryExporter(ExporterBase):
                 logger.debug(f'File already exists: {path}')
                 if self.handle_existing is None:
                     self.start_from = i
-                    self.emit_user_input_required(worker, str(path))
-                    return
+                    return str(path)
                 else:
                     if self.handle_existing == 'skip':
                         self.handle_existing = None
@@ -34,64 +34,98 @@ def exif_rotated_image(path=None):
     orientation EXIF data.
     """
 
+    return read_image(path)[0]
+
+
+def read_image(path=None):
+    """Reads an image and transforms it according to the source's
+    orientation EXIF data.
+
+    :return: A tuple of the QImage and the file's encoded data. The
+        data is ``None`` if the image had to be transformed, since it
+        then no longer matches the QImage.
+    """
+
     img = QtGui.QImage(path)
     if img.isNull():
-        return img
+        return (img, None)
 
     with open(path, 'rb') as f:
-        try:
-            exifimg = exif.Image(f)
-        except (plum.exceptions.UnpackError, NotImplementedError):
-            logger.exception(f'Exif parser failed on image: {path}')
-            return img
+        data = f.read()
+
+    try:
+        exifimg = exif.Image(data)
+    except (plum.exceptions.UnpackError, NotImplementedError):
+        logger.exception(f'Exif parser failed on image: {path}')
+        return (img, data)
 
     try:
         if 'orientation' in exifimg.list_all():
             orientation = exifimg.orientation
         else:
-            return img
+            return (img, data)
     except (NotImplementedError, ValueError):
         logger.exception(f'Exif failed reading orientation of image: {path}')
-        return img
+        return (img, data)
 
     transform = QtGui.QTransform()
 
     if orientation == exif.Orientation.TOP_RIGHT:
-        return img.mirrored(horizontal=True, vertical=False)
+        return (img.mirrored(horizontal=True, vertical=False), None)
     if orientation == exif.Orientation.BOTTOM_RIGHT:
         transform.rotate(180)
-        return img.transformed(transform)
+        return (img.transformed(transform), None)
     if orientation == exif.Orientation.BOTTOM_LEFT:
-        return img.mirrored(horizontal=False, vertical=True)
+        return (img.mirrored(horizontal=False, vertical=True), None)
     if orientation == exif.Orientation.LEFT_TOP:
         transform.rotate(90)
-        return img.transformed(transform).mirrored(
-            horizontal=True, vertical=False)
+        return (img.transformed(transform).mirrored(
+            horizontal=True, vertical=False), None)
     if orientation == exif.Orientation.RIGHT_TOP:
         transform.rotate(90)
-        return img.transformed(transform)
+        return (img.transformed(transform), None)
     if orientation == exif.Orientation.RIGHT_BOTTOM:
         transform.rotate(270)
-        return img.transformed(transform).mirrored(
-            horizontal=True, vertical=False)
+        return (img.transformed(transform).mirrored(
+            horizontal=True, vertical=False), None)
     if orientation == exif.Orientation.LEFT_BOTTOM:
         transform.rotate(270)
-        return img.transformed(transform)
+        return (img.transformed(transform), None)
+
+    return (img, data)
+
+
+def encoded_image_data(mimedata):
+    """Returns encoded image data from clipboard or drag and drop
+    data if available in a format that we can store as is, otherwise
+    ``None``."""
 
-    return img
+    for mimetype in ('image/png', 'image/jpeg'):
+        if mimedata.hasFormat(mimetype):
+            data = mimedata.data(mimetype).data()
+            if data:
+                return data
 
 
 def load_image(path):
+    """Loads an image from a filename or URL.
+
+    :return: A tuple of the QImage, the normalised filename or URL
+        and the original encoded data, if it matches the QImage.
+    """
+
     if isinstance(path, str):
         path = os.path.normpath(path)
-        return (exif_rotated_image(path), path)
+        img, data = read_image(path)
+        return (img, path, data)
     if path.isLocalFile():
         path = os.path.normpath(path.toLocalFile())
-        return (exif_rotated_image(path), path)
+        img, data = read_image(path)
+        return (img, path, data)
 
     url = bytes(path.toEncoded()).decode()
     domain = '.'.join(parse.urlparse(url).netloc.split(".")[-2:])
-    img = exif_rotated_image()
+    img, data = read_image()
     if domain == 'pinterest.com':
         try:
             page_data = request.urlopen(url).read()
@@ -109,5 +143,5 @@ def load_image(path):
             with open(fname, 'wb') as f:
                 f.write(imgdata)
                 logger.debug(f'Temporarily saved in: {fname}')
-            img = exif_rotated_image(fname)
-    return (img, url)
+            img, data = read_image(fname)
+    return (img, url, data)
@@ -0,0 +1,190 @@
+# This file is part of BeeRef.
+#
+# BeeRef is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BeeRef is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with BeeRef.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Decoding of lazily loaded images and other image processing in the
+background."""
+
+from functools import partial
+import logging
+
+from PyQt6 import QtCore, QtGui, sip
+
+from beeref.utils import to_grayscale
+
+
+logger = logging.getLogger(__name__)
+
+
+class LazyDecoder(QtCore.QObject):
+    """Decodes images of lazily loaded items in a thread pool and
+    hands the results back to the items in the main thread."""
+
+    decoded = QtCore.pyqtSignal(object, QtGui.QImage, int)
+    tile_decoded = QtCore.pyqtSignal(object, QtGui.QImage, object)
+    grayscale_converted = QtCore.pyqtSignal(object, QtGui.QImage, object)
+    previews_created = QtCore.pyqtSignal(object, object, object)
+
+    def __init__(self):
+        super().__init__()
+        self.pool = QtCore.QThreadPool()
+        self.queued = set()
+        self.decoded.connect(self.on_decoded)
+        self.tile_decoded.connect(self.on_tile_decoded)
+        self.grayscale_converted.connect(self.on_grayscale_converted)
+        self.previews_created.connect(self.on_previews_created)
+
+    def decode_later(self, item, factor=1):
+        """Schedule decoding of the given item's image, unless it has
+        already been decoded or is already scheduled.
+
+        :param factor: Decode the preview downscaled by this factor
+            instead of the full image
+        """
+
+        if not item.pixmap_pending or (item, factor) in self.queued:
+            return
+        if factor == 1:
+            if not item.may_decode():
+                return
+            source = item.blob_source
+        elif factor in item.previews:
+            return
+        else:
+            source = item.preview_sources[factor]
+
+        logger.trace(f'Scheduling decode for {item} with factor {factor}')
+        self.queued.add((item, factor))
+        self.pool.start(partial(self.decode, item, source, factor))
+
+    def decode(self, item, source, factor):
+        """Runs in the thread pool."""
+
+        img = QtGui.QImage()
+        try:
+            img.loadFromData(source())
+        except Exception:
+            # The item is only touched in the main thread, which
+            # reports the failure
+            logger.exception('Reading image data failed')
+        self.decoded.emit(item, img, factor)
+
+    def take_result(self, item, key):
+        """Whether the result of the given scheduled task is still
+        wanted. Tasks that were already running when the decoder got
+        cleared (e.g. because the scene got cleared) finish anyway, but
+        their items are gone, so their results are dropped."""
+
+        if key not in self.queued:
+            logger.debug(f'Dropping result of cleared task {key[1:]}')
+            return False
+        self.queued.discard(key)
+        return not sip.isdeleted(item)
+
+    def on_decoded(self, item, img, factor):
+        if not self.take_result(item, (item, factor)):
+            return
+        if factor == 1:
+            item.set_decoded_image(img)
+        else:
+            item.set_preview_image(factor, img)
+
+    def decode_tile_later(self, item, key):
+        """Schedule decoding of a tile of a tiled item's image, unless
+        it is already scheduled.
+
+        :param key: The tile's key as used by the item
+        """
+
+        if (item, key) in self.queued:
+            return
+        logger.trace(f'Scheduling decode for {item} with tile {key}')
+        self.queued.add((item, key))
+        self.pool.start(partial(
+            self.decode_tile, item, item.tile_source(key), key))
+
+    def decode_tile(self, item, source, key):
+        """Runs in the thread pool."""
+
+        try:
+            img = source()
+        except Exception:
+            logger.exception(f'Reading tile {key} failed')
+            img = QtGui.QImage()
+        self.tile_decoded.emit(item, img, key)
+
+    def on_tile_decoded(self, item, img, key):
+        if not self.take_result(item, (item, key)):
+            return
+        item.set_tile(key, img)
+
+    def convert_grayscale_later(self, item):
+        """Schedule converting the given item's image to grayscale,
+        unless it is already scheduled."""
+
+        key = item.pixmap_key()
+        if (item, 'grayscale', key) in self.queued:
+            return
+        logger.trace(f'Scheduling grayscale conversion for {item}')
+        self.queued.add((item, 'grayscale', key))
+        self.pool.start(partial(
+            self.convert_grayscale, item, item.pixmap().toImage(), key))
+
+    def convert_grayscale(self, item, img, key):
+        """Runs in the thread pool."""
+
+        self.grayscale_converted.emit(item, to_grayscale(img), key)
+
+    def on_grayscale_converted(self, item, img, key):
+        if not self.take_result(item, (item, 'grayscale', key)):
+            return
+        item.set_grayscale_image(img, key)
+
+    def create_previews_later(self, item):
+        """Schedule creating the downscaled versions of the given item's
+        decoded image, unless it is already scheduled."""
+
+        key = item.pixmap_key()
+        if (item, 'previews', key) in self.queued:
+            return
+        logger.trace(f'Scheduling creating previews for {item}')
+        self.queued.add((item, 'previews', key))
+        self.pool.start(partial(
+            self.create_previews,
+            item,
+            partial(item.create_thumbnails_from_image,
+                    item.pixmap().toImage()),
+            key))
+
+    def create_previews(self, item, source, key):
+        """Runs in the thread pool."""
+
+        self.previews_created.emit(item, source(), key)
+
+    def on_previews_created(self, item, previews, key):
+        if not self.take_result(item, (item, 'previews', key)):
+            return
+        item.set_previews(previews, key)
+
+    def clear(self):
+        """Drop all scheduled decodes that haven't started yet, and the
+        results of those that are still running."""
+
+        self.pool.clear()
+        self.queued.clear()
+
+    def wait(self):
+        """Block until running decodes are done."""
+
+        self.pool.waitForDone()
@@ -1,4 +1,4 @@
-USER_VERSION = 2
+USER_VERSION = 5
 APPLICATION_ID = 2060242126
 
 
@@ -13,7 +13,8 @@ SCHEMA = [
         scale REAL DEFAULT 1,
         rotation REAL DEFAULT 0,
         flip INTEGER DEFAULT 1,
-        data JSON
+        data JSON,
+        blob_id INTEGER
     )
     """,
     """
@@ -24,12 +25,33 @@ SCHEMA = [
         mtime INT default current_timestamp,
         sz INT,
         data BLOB,
+        hash TEXT,
+        FOREIGN KEY (item_id)
+          REFERENCES items (id)
+             ON DELETE CASCADE
+             ON UPDATE NO ACTION
+    )
+    """,
+    """
+    CREATE TABLE thumbnails (
+        item_id INTEGER NOT NULL,
+        factor INTEGER NOT NULL,
+        data BLOB,
+        PRIMARY KEY (item_id, factor),
         FOREIGN KEY (item_id)
           REFERENCES items (id)
              ON DELETE CASCADE
              ON UPDATE NO ACTION
     )
     """,
+    """
+    CREATE TABLE color_gamuts (
+        hash TEXT PRIMARY KEY,
+        data JSON
+    )
+    """,
+    "CREATE INDEX items_blob_id ON items (blob_id)",
+    "CREATE INDEX sqlar_hash ON sqlar (hash)",
 ]
 
 
@@ -38,4 +60,36 @@ MIGRATIONS = {
         "ALTER TABLE items ADD COLUMN data JSON",
         "UPDATE items SET data = json_object('filename', filename)",
     ],
+    3: [
+        """
+        CREATE TABLE thumbnails (
+            item_id INTEGER NOT NULL,
+            factor INTEGER NOT NULL,
+            data BLOB,
+            PRIMARY KEY (item_id, factor),
+            FOREIGN KEY (item_id)
+              REFERENCES items (id)
+                 ON DELETE CASCADE
+                 ON UPDATE NO ACTION
+        )
+        """,
+    ],
+    4: [
+        # Several items can share the same image. The blob_id points
+        # to the item whose sqlar and thumbnail entries hold the image.
+        "ALTER TABLE items ADD COLUMN blob_id INTEGER",
+        "UPDATE items SET blob_id = id WHERE type = 'pixmap'",
+        "CREATE INDEX items_blob_id ON items (blob_id)",
+        "ALTER TABLE sqlar ADD COLUMN hash TEXT",
+        "CREATE INDEX sqlar_hash ON sqlar (hash)",
+    ],
+    5: [
+        # Colour gamuts of the images, by the hash of the image
+        """
+        CREATE TABLE color_gamuts (
+            hash TEXT PRIMARY KEY,
+            data JSON
+        )
+        """,
+    ],
 }
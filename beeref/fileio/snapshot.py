@@ -0,0 +1,197 @@
+# This file is part of BeeRef.
+#
+# BeeRef is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BeeRef is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with BeeRef.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Snapshots of the scene's state for saving in a worker thread.
+
+Snapshots are taken on the main thread. Saving then only touches the
+snapshot, so that the user can keep changing the scene in the
+meantime. Once saving is done, the results (the ids of the items in
+the bee file etc.) are written back to the items on the main thread.
+"""
+
+import json
+import logging
+
+from PyQt6 import QtGui, QtWidgets
+
+from beeref.items import BeeErrorItem, BeePixmapItem, BeeTiledPixmapItem
+from beeref.utils import image_to_bytes
+
+
+logger = logging.getLogger(__name__)
+
+
+class ItemSnapshot:
+    """The state of an item as needed for saving it."""
+
+    def __init__(self, item):
+        self.item = item
+        self.TYPE = item.TYPE
+        self.name = str(item)
+        self.save_id = getattr(item, 'save_id', None)
+        self.saved_row = item.saved_row
+        self.row = (item.pos().x(), item.pos().y(), item.zValue(),
+                    item.scale(), item.rotation(), item.flip(),
+                    json.dumps(item.get_extra_save_data()))
+
+    def __str__(self):
+        return self.name
+
+    def apply(self):
+        self.item.save_id = self.save_id
+        self.item.saved_row = self.saved_row
+
+
+class PixmapItemSnapshot(ItemSnapshot):
+    """The state of an image item as needed for saving it.
+
+    The image is implicitly shared with the item's pixmap, so taking
+    the snapshot doesn't copy any image data.
+    """
+
+    SOURCE_FORMATS = BeePixmapItem.SOURCE_FORMATS
+
+    # These only depend on attributes the snapshot provides as well:
+    get_source_data = BeePixmapItem.get_source_data
+    get_imgformat = BeePixmapItem.get_imgformat
+    get_filename_for_export = BeePixmapItem.get_filename_for_export
+
+    def __init__(self, item):
+        super().__init__(item)
+        self.settings = item.settings
+        self.filename = item.filename
+        self.blob_hash = item.blob_hash
+        self.source_data = item.source_data
+        self.pixmap_pending = item.pixmap_pending
+        self.TILED = item.TILED
+        self.blob_source = item.blob_source
+        self.preview_sources = dict(item.preview_sources)
+        # New blob source and preview sources to hand to the item:
+        self.lazy_sources = None
+        # Where to read the original image data from once it's saved:
+        self.saved_source = None
+        self.image_key = self.get_image_key(item)
+        self.color_gamut = item._color_gamut
+        # Previews of images whose decoded data has been dropped
+        self.previews = {}
+        if self.pixmap_pending:
+            self.previews = {factor: pixmap.toImage()
+                             for factor, pixmap in item.previews.items()}
+        if self.pixmap_pending or self.TILED:
+            self.image = None
+        else:
+            self.image = item.pixmap().toImage()
+
+    @staticmethod
+    def get_image_key(item):
+        # Don't decode lazily loaded images just for this
+        return QtWidgets.QGraphicsPixmapItem.pixmap(item).cacheKey()
+
+    def get_image(self):
+        if self.image is None:
+            logger.debug(f'Decoding pending image for {self}')
+            data = self.source_data if self.TILED else self.blob_source()
+            self.image = QtGui.QImage.fromData(data)
+        if self.image.isNull():
+            # Don't replace the image in the file with an empty one
+            raise ValueError(f'No image data for {self}')
+        return self.image
+
+    def pixmap_to_bytes(self):
+        img = self.get_image()
+        imgformat = self.get_imgformat(img)
+        return (image_to_bytes(img, imgformat), imgformat)
+
+    def create_thumbnails(self):
+        if self.TILED:
+            return BeeTiledPixmapItem.create_thumbnails_from_data(
+                self.source_data)
+        if self.pixmap_pending and self.previews:
+            return sorted(self.previews.items())
+        return BeePixmapItem.create_thumbnails_from_image(self.get_image())
+
+    def apply(self):
+        super().apply()
+        if self.image_key == self.get_image_key(self.item):
+            self.item.blob_hash = self.blob_hash
+        if self.lazy_sources and self.item.blob_source is self.blob_source:
+            self.item.blob_source = self.lazy_sources[0]
+            self.item.set_preview_sources(self.lazy_sources[1])
+        if (self.saved_source
+                and self.item.source_data is not None
+                and self.item.source_data is self.source_data):
+            # Images dropped in the meantime read from the file as well
+            self.item.blob_source = self.saved_source
+            self.item.source_data = None
+        # Don't keep the image data alive longer than the item does:
+        self.source_data = None
+        self.image = None
+        self.previews = {}
+
+
+class ErrorItemSnapshot:
+    """Error items aren't saved, but their entries in the bee file need
+    to be kept."""
+
+    TYPE = BeeErrorItem.TYPE
+
+    def __init__(self, item):
+        self.original_save_id = item.original_save_id
+
+
+class SceneSnapshot:
+    """The state of a scene as needed for saving it.
+
+    Provides the parts of the scene's interface that are used for
+    saving, returning item snapshots instead of items.
+    """
+
+    def __init__(self, scene):
+        self.items = []
+        for item in scene.items_for_save():
+            if isinstance(item, BeePixmapItem):
+                self.items.append(PixmapItemSnapshot(item))
+            else:
+                self.items.append(ItemSnapshot(item))
+        self.error_items = [
+            ErrorItemSnapshot(item)
+            for item in scene.items_by_type(BeeErrorItem.TYPE)]
+        # Whether the snapshot has been saved successfully:
+        self.saved = False
+        self.applied = False
+
+    def items_for_save(self):
+        return self.items
+
+    def items_by_type(self, typ):
+        return [item for item in self.items + self.error_items
+                if item.TYPE == typ]
+
+    def clear_save_ids(self):
+        for item in self.items:
+            item.save_id = None
+            item.saved_row = None
+
+    def apply(self):
+        """Write the results of saving back to the items. Needs to be
+        called from the main thread. Does nothing if saving didn't
+        succeed or the results have already been applied."""
+
+        if not self.saved or self.applied:
+            return
+        logger.debug('Applying save results to scene')
+        self.applied = True
+        for item in self.items:
+            item.apply()
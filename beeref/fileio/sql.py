@@ -23,24 +23,31 @@ https://www.sqlite.org/appfileformat.html
 https://www.sqlite.org/sqlar.html
 """
 
+from functools import partial
+import hashlib
 import json
 import logging
 import os
 import pathlib
-import shutil
 import sqlite3
-import tempfile
+import threading
+import weakref
 
 from PyQt6 import QtGui
 
-from beeref import constants
-from beeref.items import BeePixmapItem, BeeErrorItem
+from beeref.utils import image_reader, image_to_bytes, parallel_map
+from beeref.items import BeePixmapItem, BeeErrorItem, BeeTiledPixmapItem
 from .errors import BeeFileIOError, IMG_LOADING_ERROR_MSG
 from .schema import SCHEMA, USER_VERSION, MIGRATIONS, APPLICATION_ID
+from .snapshot import SceneSnapshot
 
 
 logger = logging.getLogger(__name__)
 
+# The id of the item whose sqlar and thumbnail entries hold an item's
+# image. Items that hold their own image don't need to set blob_id.
+BLOB_ID = 'coalesce(items.blob_id, items.id)'
+
 
 def is_bee_file(path):
     """Check whether the file at the given path is a bee file."""
@@ -48,6 +55,16 @@ def is_bee_file(path):
     return os.path.splitext(path)[1] == '.bee'
 
 
+def remove_bee_file(path):
+    """Remove a bee file along with any journal files SQLite might
+    have left next to it, so that they won't be applied to a new file
+    of the same name."""
+
+    for suffix in ('', '-journal', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
 def handle_sqlite_errors(func):
     def wrapper(self, *args, **kwargs):
         try:
@@ -71,15 +88,122 @@ def handle_sqlite_errors(func):
     return wrapper
 
 
+class LazyBlob:
+    """Fetches the image data of a single item from a bee file on demand.
+
+    Used as blob source for images that are loaded lazily. Can be
+    called from any thread since every call uses its own connection.
+
+    :param blob_hash: The image's hash, if known. Item ids change when
+        items get deleted or the file is saved anew, so the image is
+        looked up by its hash if possible.
+    """
+
+    # All blobs still in use, see ``detach_removed``:
+    _instances = weakref.WeakSet()
+    _instances_lock = threading.Lock()
+
+    def __init__(self, filename, save_id, factor=1, blob_hash=None):
+        self.filename = filename
+        self.save_id = save_id
+        self.factor = factor
+        self.blob_hash = blob_hash
+        self.data = None
+        with self._instances_lock:
+            self._instances.add(self)
+
+    def __call__(self):
+        if self.data is not None:
+            return self.data
+
+        if self.blob_hash:
+            where = 'item_id=(SELECT item_id FROM sqlar WHERE hash=?)'
+            key = self.blob_hash
+        else:
+            where = 'item_id=?'
+            key = self.save_id
+        uri = pathlib.Path(self.filename).resolve().as_uri()
+        connection = sqlite3.connect(f'{uri}?mode=ro', uri=True)
+        try:
+            if self.factor == 1:
+                row = connection.execute(
+                    f'SELECT data FROM sqlar WHERE {where}',
+                    (key,)).fetchone()
+            else:
+                row = connection.execute(
+                    f'SELECT data FROM thumbnails '
+                    f'WHERE {where} AND factor=?',
+                    (key, self.factor)).fetchone()
+        finally:
+            connection.close()
+        if row is None:
+            raise BeeFileIOError(
+                msg=f'No image data for item {self.save_id}',
+                filename=self.filename)
+        return row[0]
+
+    def detach(self):
+        """Keep the image data in memory so that it stays available
+        when the file gets overwritten."""
+
+        self.data = self()
+
+    @classmethod
+    def detach_removed(cls, filename, blob_ids, blob_hashes):
+        """Detach the blobs still in use (e.g. by deleted items that can
+        be restored via undo) whose images are about to be removed from
+        the given file.
+
+        :param blob_ids: Ids of the items holding the removed images
+        :param blob_hashes: Hashes of the removed images
+        """
+
+        path = pathlib.Path(filename).resolve()
+        with cls._instances_lock:
+            blobs = list(cls._instances)
+        for blob in blobs:
+            if blob.data is not None:
+                continue
+            if blob.blob_hash:
+                removed = blob.blob_hash in blob_hashes
+            else:
+                removed = blob.save_id in blob_ids
+            if removed and pathlib.Path(blob.filename).resolve() == path:
+                logger.debug(f'Detaching removed image {blob.save_id}')
+                try:
+                    blob.detach()
+                except Exception:
+                    logger.exception('Detaching removed image failed')
+
+
 class SQLiteIO:
 
+    #: Memory-map up to this many bytes of the file when reading
+    MMAP_SIZE = 2**30
+
+    #: Vacuum the file when at least this fraction of it is unused
+    VACUUM_THRESHOLD = 0.25
+
     def __init__(self, filename, scene, create_new=False, readonly=False,
-                 worker=None):
+                 worker=None, lazy=False, wal=False, keep_source_data=False):
+        """
+        :param scene: The scene to read into or to save. When saving
+            from a worker thread, this needs to be a ``SceneSnapshot``
+            taken beforehand on the main thread, which needs to be
+            applied afterwards on the main thread.
+        :param keep_source_data: Keep the original image data of saved
+            images in memory instead of reading it back from the file
+            when needed, e.g. because the file will be removed again
+        """
         self.scene = scene
         self.create_new = create_new
         self.filename = filename
         self.readonly = readonly
         self.worker = worker
+        self.lazy = lazy
+        self.wal = wal
+        self.keep_source_data = keep_source_data
+        self.snapshot = None
         self.retry = False
 
     def __del__(self):
@@ -91,24 +215,29 @@ class SQLiteIO:
             delattr(self, '_connection')
         if hasattr(self, '_cursor'):
             delattr(self, '_cursor')
-        if hasattr(self, '_tmpdir'):
-            self._tmpdir.cleanup()
-            delattr(self, '_tmpdir')
 
     def _establish_connection(self):
-        if (self.create_new
-                and not self.readonly
-                and os.path.exists(self.filename)):
-            os.remove(self.filename)
+        if self.create_new and not self.readonly:
+            remove_bee_file(self.filename)
 
         if self.create_new:
-            self.scene.clear_save_ids()
+            (self.snapshot or self.scene).clear_save_ids()
 
         uri = pathlib.Path(self.filename).resolve().as_uri()
         if self.readonly:
-            uri = f'{uri}?mode=rw'
+            uri = f'{uri}?mode=ro'
         self._connection = sqlite3.connect(uri, uri=True)
         self._cursor = self.connection.cursor()
+        if self.readonly:
+            # Don't migrate older file versions when reading, they are
+            # interpreted by the reader directly. Migration will happen
+            # on the next save.
+            self.ex('PRAGMA mmap_size=%s' % self.MMAP_SIZE)
+            return
+        if self.wal:
+            # Lets lazily loaded images be read from the file while
+            # we are writing to it
+            self.ex('PRAGMA journal_mode=WAL')
         if not self.create_new:
             try:
                 self._migrate()
@@ -127,20 +256,6 @@ class SQLiteIO:
             logger.debug('Version ok; no migrations necessary')
             return
 
-        if self.readonly:
-            try:
-                # See whether file is writable so we can migrate it directly
-                self.ex('PRAGMA application_id=%s' % APPLICATION_ID)
-            except sqlite3.Error:
-                logger.debug('File not writable; use temporary copy instead')
-                self._connection.close()
-                self._tmpdir = tempfile.TemporaryDirectory(
-                    prefix=constants.APPNAME)
-                tmpname = os.path.join(self._tmpdir.name, 'mig.bee')
-                shutil.copyfile(self.filename, tmpname)
-                self._connection = sqlite3.connect(tmpname)
-                self._cursor = self.connection.cursor()
-
         self.ex('BEGIN TRANSACTION')
         for i in range(version, USER_VERSION):
             logger.debug(f'Migrating from version {i} to {i + 1}...')
@@ -189,61 +304,201 @@ class SQLiteIO:
 
     @handle_sqlite_errors
     def read(self):
+        # Files of older versions haven't been migrated, so we need to
+        # take care of their schema here:
+        version = self.fetchone('PRAGMA user_version')[0]
+        logger.debug(f'Found bee file version: {version}')
+        if version >= 4:
+            blob_id, blob_hash = BLOB_ID, 'hash'
+        else:
+            blob_id, blob_hash = 'items.id', 'null'
+        if version >= 2:
+            itemdata = 'items.data'
+        else:
+            itemdata = "json_object('filename', filename)"
+
+        # Don't fetch the image data yet, so that we don't need to
+        # keep all of it in memory at once. It will be fetched
+        # one by one while decoding, or on demand when loading lazily.
         rows = self.fetchall(
             'SELECT items.id, type, x, y, z, scale, rotation, flip, '
-            'items.data, sqlar.data '
-            'FROM sqlar JOIN items on sqlar.item_id = items.id')
+            f'{itemdata}, {blob_id}, {blob_hash} '
+            f'FROM items JOIN sqlar on sqlar.item_id = {blob_id}')
         # Avoid OUTER JOIN for performance reasons; fetch text items
         # separately instead
         rows.extend(self.fetchall(
             'SELECT items.id, type, x, y, z, scale, rotation, flip, '
-            ' items.data, null as data '
+            f'{itemdata}, null as blob_id, null as hash '
             'FROM items '
             'WHERE items.type = "text"'))
+        if self.lazy and version >= 3:
+            thumbnails = self.fetch_thumbnail_factors()
+        else:
+            thumbnails = {}
+        if version >= 5:
+            gamuts = self.fetch_color_gamuts()
+        else:
+            gamuts = {}
         if self.worker:
             self.worker.begin_processing.emit(len(rows))
 
-        for i, row in enumerate(rows):
-            data = {
-                'save_id': row[0],
-                'type': row[1],
-                'x': row[2],
-                'y': row[3],
-                'z': row[4],
-                'scale': row[5],
-                'rotation': row[6],
-                'flip': row[7],
-                'data': json.loads(row[8]),
-            }
-
-            if data['type'] == 'pixmap':
+        # Decode images in parallel while we create the items:
+        results = parallel_map(self.decode_item_image,
+                               self.iter_item_data(rows))
+        for i, (data, blob, img) in enumerate(results):
+            blob_id = data.pop('blob_id')
+            blob_hash = data.pop('blob_hash')
+            if data['type'] == 'pixmap' and self.is_lazy_item(data):
                 item = BeePixmapItem(QtGui.QImage())
-                item.pixmap_from_bytes(row[9])
+                item.set_lazy_source(
+                    LazyBlob(self.filename, blob_id, blob_hash=blob_hash))
+                item.set_preview_sources({
+                    factor: LazyBlob(self.filename, blob_id, factor,
+                                     blob_hash)
+                    for factor in thumbnails.get(blob_id, [])})
+                item.blob_hash = blob_hash
+                data['item'] = item
+            elif data['type'] == 'pixmap' and img is None:
+                item = BeeTiledPixmapItem(blob)
+                item.blob_hash = blob_hash
+                data['item'] = item
+            elif data['type'] == 'pixmap':
+                item = BeePixmapItem(img)
+                item.blob_hash = blob_hash
                 if item.pixmap().isNull():
                     item = data['data']['text'] = (
                         f'Image could not be loaded: {item.filename}\n'
                         + IMG_LOADING_ERROR_MSG)
                     data['type'] = BeeErrorItem.TYPE
                 data['item'] = item
+            if data['type'] == 'pixmap' and blob_hash in gamuts:
+                data['item'].set_color_gamut(gamuts[blob_hash])
 
-            self.scene.add_item_later(data)
+            self.scene.add_item_later(data, worker=self.worker)
 
             if self.worker:
                 logger.trace(f'Emit progress: {i}')
                 self.worker.progress.emit(i)
                 if self.worker.canceled:
+                    results.close()
                     self.worker.finished.emit('', [])
                     return
-                # Give main thread time to process items:
-                self.worker.msleep(10)
         if self.worker:
             self.worker.finished.emit(self.filename, [])
 
+    def iter_item_data(self, rows):
+        """Yields the item data of the given rows along with the
+        encoded image that still needs to be decoded, if any.
+
+        Image data is only fetched when the next item is requested,
+        so memory use is bounded by the number of items in flight.
+        """
+
+        for row in rows:
+            data = {
+                'save_id': row[0],
+                'type': row[1],
+                'x': row[2],
+                'y': row[3],
+                'z': row[4],
+                'scale': row[5],
+                'rotation': row[6],
+                'flip': row[7],
+                'data': json.loads(row[8]),
+                'blob_id': row[9],
+                'blob_hash': row[10],
+                # So that unchanged items don't get written again:
+                'saved_row': tuple(row[2:9]),
+            }
+            blob = None
+            if data['type'] == 'pixmap' and not self.is_lazy_item(data):
+                blob = self.fetchone(
+                    'SELECT data FROM sqlar WHERE item_id=?',
+                    (data['blob_id'],))[0]
+            yield data, blob
+
+    @staticmethod
+    def decode_item_image(args):
+        """Decodes the encoded image yielded by ``iter_item_data``.
+
+        Called from the decoding thread pool, so must not touch the
+        database or the scene.
+
+        :return: Tuple of the item data, the encoded image and the
+            decoded image. The decoded image is ``None`` for images
+            that are too big to be decoded as a whole.
+        """
+
+        data, blob = args
+        img = None
+        if (blob is not None
+                and not BeeTiledPixmapItem.needs_tiling(image_reader(blob))):
+            img = QtGui.QImage.fromData(blob)
+        return data, blob, img
+
+    def is_lazy_item(self, data):
+        """Whether the given pixmap item can be loaded lazily.
+
+        Lazily loaded items need to know their size before their
+        image is decoded, which we can only get from the crop. Tiled
+        images are never decoded as a whole, so they aren't loaded
+        lazily.
+        """
+
+        return (self.lazy
+                and 'crop' in data['data']
+                and not data['data'].get('tiled'))
+
+    def fetch_thumbnail_factors(self):
+        """Returns a dict mapping item ids to the downscale factors of
+        their thumbnails."""
+
+        thumbnails = {}
+        for item_id, factor in self.fetchall(
+                'SELECT item_id, factor FROM thumbnails'):
+            thumbnails.setdefault(item_id, []).append(factor)
+        return thumbnails
+
+    def fetch_color_gamuts(self):
+        """Returns a dict mapping image hashes to the colour gamuts of
+        the images, see ``BeePixmapItem.color_gamut``."""
+
+        return {blob_hash: {(hue, sat): count
+                            for hue, sat, count in json.loads(data)}
+                for blob_hash, data in self.fetchall(
+                    'SELECT hash, data FROM color_gamuts')}
+
+    def detach_lazy_items(self):
+        """Make sure images that haven't been decoded yet, or might
+        need decoding again later, don't lose their image data when we
+        overwrite the file they come from."""
+
+        path = pathlib.Path(self.filename).resolve()
+        for item in self.snapshot.items_by_type(BeePixmapItem.TYPE):
+            if not item.blob_source:
+                continue
+            # The sources are shared with the items, so detaching
+            # them here takes effect for the items as well:
+            sources = [item.blob_source] + list(item.preview_sources.values())
+            for source in sources:
+                if (isinstance(source, LazyBlob)
+                        and pathlib.Path(source.filename).resolve() == path):
+                    logger.debug(f'Detaching lazy image data for {item}')
+                    source.detach()
+
     @handle_sqlite_errors
     def write(self):
         if self.readonly:
             raise sqlite3.OperationalError(
                 'Attempt to write to a readonly database')
+        if isinstance(self.scene, SceneSnapshot):
+            self.snapshot = self.scene
+        else:
+            # We are on the main thread, so we can take care of the
+            # snapshot ourselves
+            self.snapshot = SceneSnapshot(self.scene)
+        if self.create_new and os.path.exists(self.filename):
+            self.detach_lazy_items()
         try:
             self.create_schema_on_new()
             self.write_data()
@@ -261,59 +516,332 @@ class SQLiteIO:
                 self.write()
 
     def write_data(self):
-        to_delete = {row[0] for row in self.fetchall('SELECT id from ITEMS')}
+        # Maps ids of existing items to the ids holding their images:
+        existing = dict(self.fetchall(f'SELECT id, {BLOB_ID} from ITEMS'))
         # We don't want to touch existing items that are displayed as errors:
         keep = {item.original_save_id
-                for item in self.scene.items_by_type(BeeErrorItem.TYPE)}
+                for item in self.snapshot.items_by_type(BeeErrorItem.TYPE)}
         logger.debug(f'Not saving error items: {keep}')
-        to_delete = to_delete - keep
+        to_delete = set(existing) - keep
+
+        have_thumbnails = set(self.fetch_thumbnail_factors().keys())
 
-        to_save = list(self.scene.items_for_save())
+        to_save = list(self.snapshot.items_for_save())
+        saved = []
+        self.detach_removed_images(existing, to_delete, to_save)
         if self.worker:
             self.worker.begin_processing.emit(len(to_save))
+
+        # Encode new images in parallel while we write to the file:
+        known_hashes = {row[0] for row in self.fetchall(
+            'SELECT hash FROM sqlar WHERE hash IS NOT NULL')}
+        to_insert = [item for item in to_save
+                     if item.save_id not in existing]
+        encoded = parallel_map(
+            partial(self.encode_image, known_hashes=known_hashes), to_insert)
+
         for i, item in enumerate(to_save):
-            logger.debug(f'Saving {item} with id {item.save_id}')
-            if item.save_id:
-                self.update_item(item)
-                to_delete.remove(item.save_id)
+            if item.save_id in existing:
+                to_delete.discard(item.save_id)
+                row = item.row
+                if row != item.saved_row:
+                    logger.debug(f'Updating {item} with id {item.save_id}')
+                    self.update_item(item, row)
+                    saved.append((item, row))
+                blob_id = existing[item.save_id]
+                self.release_source_data(item, blob_id)
+                if (hasattr(item, 'create_thumbnails')
+                        and not item.pixmap_pending
+                        and blob_id not in have_thumbnails):
+                    # Item from an older bee file. Only add thumbnails
+                    # if we don't need to decode the image just for that.
+                    self.insert_thumbnails(item, blob_id)
+                    have_thumbnails.add(blob_id)
             else:
-                self.insert_item(item)
+                logger.debug(f'Inserting {item}')
+                row = item.row
+                self.insert_item(item, row, next(encoded))
+                saved.append((item, row))
             if self.worker:
                 self.worker.progress.emit(i)
                 if self.worker.canceled:
                     break
+        encoded.close()
+        self.insert_color_gamuts(to_save)
         self.delete_items(to_delete)
-        self.ex('VACUUM')
         self.connection.commit()
+        # Only mark items as saved once they are actually in the file:
+        for item, row in saved:
+            item.saved_row = row
+        self.snapshot.saved = True
+        if self.snapshot is not self.scene:
+            self.snapshot.apply()
+        logger.debug(f'Saved {len(saved)} changed items')
+        self.vacuum_if_needed()
+        if self.wal:
+            self.leave_wal_mode()
         if self.worker:
             self.worker.finished.emit(self.filename, [])
 
+    def leave_wal_mode(self):
+        """Move everything from the write-ahead log back into the file
+        itself, so that the file can be read on its own again (e.g.
+        from read-only locations)."""
+
+        try:
+            self.ex('PRAGMA journal_mode=DELETE')
+        except sqlite3.OperationalError:
+            # Someone is still reading from the file; SQLite will
+            # clean up the log once the last connection is closed.
+            logger.debug('Could not leave WAL mode, file is in use')
+
+    def vacuum_if_needed(self):
+        """Shrink the file when a large part of it has become unused,
+        for example after deleting many images.
+
+        Vacuuming rewrites the whole file, so we don't want to do it
+        on every save.
+        """
+
+        free = self.fetchone('PRAGMA freelist_count')[0]
+        total = self.fetchone('PRAGMA page_count')[0]
+        if total and free / total >= self.VACUUM_THRESHOLD:
+            logger.debug(f'Vacuuming: {free} of {total} pages unused')
+            self.ex('VACUUM')
+
     def delete_items(self, to_delete):
-        to_delete = [(pk,) for pk in to_delete]
-        self.exmany('DELETE FROM items WHERE id=?', to_delete)
-        self.exmany('DELETE FROM sqlar WHERE item_id=?', to_delete)
-        self.connection.commit()
+        for pk in to_delete:
+            # Images can be shared by several items. If other items
+            # still use this item's image, hand it over to one of them:
+            heir = self.fetchone(
+                'SELECT min(id) FROM items WHERE blob_id=? AND id!=?',
+                (pk, pk))[0]
+            if heir is None:
+                self.ex('DELETE FROM sqlar WHERE item_id=?', (pk,))
+                self.ex('DELETE FROM thumbnails WHERE item_id=?', (pk,))
+            else:
+                logger.debug(f'Handing over image of item {pk} to {heir}')
+                self.ex('UPDATE sqlar SET item_id=? WHERE item_id=?',
+                        (heir, pk))
+                self.ex('UPDATE thumbnails SET item_id=? WHERE item_id=?',
+                        (heir, pk))
+                self.ex('UPDATE items SET blob_id=? WHERE blob_id=?',
+                        (heir, pk))
+            self.ex('DELETE FROM items WHERE id=?', (pk,))
+        if to_delete:
+            # Colour gamuts of images that aren't in the file anymore:
+            self.ex('DELETE FROM color_gamuts WHERE hash NOT IN '
+                    '(SELECT hash FROM sqlar WHERE hash IS NOT NULL)')
+
+    def insert_color_gamuts(self, items):
+        """Store the colour gamuts of images that don't have their gamut
+        stored yet, so that it doesn't need to be calculated again. The
+        gamut is stored once per image, no matter how many items share
+        the image."""
+
+        missing = {row[0] for row in self.fetchall(
+            'SELECT hash FROM sqlar WHERE hash IS NOT NULL '
+            'AND hash NOT IN (SELECT hash FROM color_gamuts)')}
+        gamuts = {}
+        for item in items:
+            gamut = getattr(item, 'color_gamut', None)
+            if gamut is not None and item.blob_hash in missing:
+                gamuts[item.blob_hash] = gamut
+        logger.debug(f'Saving {len(gamuts)} color gamuts')
+        self.exmany(
+            'INSERT INTO color_gamuts (hash, data) VALUES (?, ?)',
+            [(blob_hash, json.dumps([[hue, sat, count] for (hue, sat), count
+                                     in sorted(gamut.items())]))
+             for blob_hash, gamut in gamuts.items()])
+
+    def insert_item(self, item, row, encoded=None):
+        """Insert a new item.
+
+        :param encoded: The item's encoded image as returned by
+            ``encode_image``, if it has been encoded beforehand
+        """
 
-    def insert_item(self, item):
         self.ex(
             'INSERT INTO items (type, x, y, z, scale, rotation, flip, '
             'data) '
             'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
-            (item.TYPE, item.pos().x(), item.pos().y(), item.zValue(),
-             item.scale(), item.rotation(), item.flip(),
-             json.dumps(item.get_extra_save_data())))
+            (item.TYPE,) + row)
         item.save_id = self.cursor.lastrowid
 
         if hasattr(item, 'pixmap_to_bytes'):
-            pixmap, imgformat = item.pixmap_to_bytes()
-            name = item.get_filename_for_export(imgformat)
-            self.ex(
-                'INSERT INTO sqlar (item_id, name, mode, sz, data) '
-                'VALUES (?, ?, ?, ?, ?)',
-                (item.save_id, name, 0o644, len(pixmap), pixmap))
-        self.connection.commit()
+            blob_id = self.insert_blob(item, encoded)
+            self.ex('UPDATE items SET blob_id=? WHERE id=?',
+                    (blob_id, item.save_id))
+            self.relink_lazy_sources(item, blob_id)
+            self.release_source_data(item, blob_id)
+
+    def detach_removed_images(self, existing, to_delete, to_save):
+        """Images that are only used by items we are about to delete
+        will be removed from the file. Items that are still around
+        (e.g. in the undo stack) keep their image data in memory.
+
+        Needs to happen before writing anything, so that reading the
+        image data isn't blocked by our own changes.
+
+        :param existing: Dict mapping the ids of the items in the file
+            to the ids of the items holding their images
+        """
+
+        kept = {existing[item.save_id] for item in to_save
+                if item.save_id in existing}
+        kept.update(existing[pk] for pk in set(existing) - to_delete)
+        removed = {existing[pk] for pk in to_delete} - kept
+        if not removed:
+            return
+        hashes = {row[0] for row in self.fetchall(
+            'SELECT hash FROM sqlar WHERE item_id IN (%s) '
+            'AND hash IS NOT NULL' % ','.join('?' * len(removed)),
+            tuple(removed))}
+        LazyBlob.detach_removed(self.filename, removed, hashes)
+
+    def release_source_data(self, item, blob_id):
+        """Once the original data of an image is stored in the file, it
+        doesn't need to be kept in memory anymore; it can be read back
+        from the file when needed. Takes effect when the snapshot is
+        applied. Tiled images need their data all the time, though."""
+
+        if (self.keep_source_data
+                or item.TYPE != BeePixmapItem.TYPE
+                or item.TILED
+                or item.source_data is None
+                or item.blob_hash
+                != hashlib.sha256(item.source_data).hexdigest()):
+            # Images stored in a different format keep their original
+            return
+        logger.debug(f'Reading image of {item} from file from now on')
+        item.saved_source = LazyBlob(
+            self.filename, blob_id, blob_hash=item.blob_hash)
+
+    def relink_lazy_sources(self, item, blob_id):
+        """Images from older bee files are looked up by the id of the
+        item they were loaded for, which copies of the item share. Once
+        a copy has its own image in the file, look it up by hash
+        instead, so that it doesn't lose its image when the original
+        item gets deleted. Takes effect when the snapshot is applied."""
+
+        source = item.blob_source
+        if not (isinstance(source, LazyBlob) and not source.blob_hash
+                and source.data is None and item.blob_hash):
+            return
+        logger.debug(f'Looking up image of {item} by hash from now on')
+        factors = [row[0] for row in self.fetchall(
+            'SELECT factor FROM thumbnails WHERE item_id=?', (blob_id,))]
+        item.lazy_sources = (
+            LazyBlob(self.filename, blob_id, blob_hash=item.blob_hash),
+            {factor: LazyBlob(self.filename, blob_id, factor, item.blob_hash)
+             for factor in factors})
+
+    def find_blob(self, blob_hash):
+        """Returns the id of the item holding the image with the given
+        hash, or ``None`` if there is no such image."""
+
+        row = self.fetchone(
+            'SELECT item_id FROM sqlar WHERE hash=?', (blob_hash,))
+        return row and row[0]
+
+    @classmethod
+    def encode_image(cls, item, known_hashes=frozenset()):
+        """Encode the item's image and thumbnails for storing them.
+
+        Only works on item snapshots, so that it can run in any thread
+        and doesn't need the database connection.
+
+        :param known_hashes: Hashes of images that are already stored
+            and thus don't need encoding
+        :return: Tuple of ``(data, imgformat, hash, thumbnails)``, or
+            ``None`` if the image doesn't need to be encoded
+        """
+
+        if (not hasattr(item, 'pixmap_to_bytes')
+                or item.blob_hash in known_hashes):
+            return None
 
-    def update_item(self, item):
+        # Avoid re-encoding the image if we can:
+        data, imgformat = (item.get_source_data()
+                           or item.pixmap_to_bytes())
+        blob_hash = hashlib.sha256(data).hexdigest()
+        if blob_hash in known_hashes:
+            return (data, imgformat, blob_hash, None)
+        return (data, imgformat, blob_hash, cls.encode_thumbnails(item))
+
+    @staticmethod
+    def encode_thumbnails(item):
+        """Downscaled versions of the item's image for faster display
+        when zoomed out.
+
+        :return: List of ``(factor, data)`` tuples
+        """
+
+        rows = []
+        if item.pixmap_pending and item.preview_sources:
+            # Copy existing thumbnails instead of decoding the image
+            for factor, source in item.preview_sources.items():
+                try:
+                    rows.append((factor, source()))
+                except Exception:
+                    logger.exception(f'Reading thumbnail failed for {item}')
+        else:
+            for factor, img in item.create_thumbnails():
+                imgformat = 'png' if img.hasAlphaChannel() else 'jpg'
+                rows.append((factor, image_to_bytes(img, imgformat)))
+        return rows
+
+    def insert_blob(self, item, encoded=None):
+        """Store the item's image unless the same image is already
+        in the file.
+
+        :param encoded: The item's encoded image as returned by
+            ``encode_image``, if it has been encoded beforehand
+        :return: The id of the item holding the image
+        """
+
+        if item.blob_hash:
+            # Duplicates of saved images don't even need encoding:
+            blob_id = self.find_blob(item.blob_hash)
+            if blob_id:
+                logger.debug(f'Image of {item} already stored: {blob_id}')
+                return blob_id
+
+        data, imgformat, item.blob_hash, thumbnails = (
+            encoded or self.encode_image(item))
+        blob_id = self.find_blob(item.blob_hash)
+        if blob_id:
+            logger.debug(f'Image of {item} already stored: {blob_id}')
+            return blob_id
+
+        name = item.get_filename_for_export(imgformat)
+        self.ex(
+            'INSERT INTO sqlar (item_id, name, mode, sz, data, hash) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (item.save_id, name, 0o644, len(data), data, item.blob_hash))
+        self.insert_thumbnails(item, thumbnails=thumbnails)
+        return item.save_id
+
+    def insert_thumbnails(self, item, blob_id=None, thumbnails=None):
+        """Store downscaled versions of the item's image for faster
+        display when zoomed out.
+
+        :param blob_id: The id of the item holding the image, if it's
+            not the item itself
+        :param thumbnails: The encoded thumbnails as returned by
+            ``encode_thumbnails``, if they have been encoded beforehand
+        """
+
+        blob_id = blob_id or item.save_id
+        if thumbnails is None:
+            thumbnails = self.encode_thumbnails(item)
+        logger.debug(f'Saving {len(thumbnails)} thumbnails for {item}')
+        self.exmany(
+            'INSERT OR REPLACE INTO thumbnails (item_id, factor, data) '
+            'VALUES (?, ?, ?)',
+            [(blob_id, factor, data) for factor, data in thumbnails])
+
+    def update_item(self, item, row):
         """Update item data.
 
         We only update the item data, not the pixmap data, as pixmap
@@ -323,8 +851,4 @@ class SQLiteIO:
             'UPDATE items SET x=?, y=?, z=?, scale=?, rotation=?, flip=?, '
             'data=? '
             'WHERE id=?',
-            (item.pos().x(), item.pos().y(), item.zValue(), item.scale(),
-             item.rotation(), item.flip(),
-             json.dumps(item.get_extra_save_data()),
-             item.save_id))
-        self.connection.commit()
+            row + (item.save_id,))
@@ -17,10 +17,13 @@
 text).
 """
 
-from collections import defaultdict
-from functools import cached_property
+from collections import Counter, defaultdict, OrderedDict
+from functools import partial
+import itertools
 import logging
+import math
 import os.path
+import time
 
 from PyQt6 import QtCore, QtGui, QtWidgets
 from PyQt6.QtCore import Qt
@@ -29,12 +32,22 @@ from beeref import commands
 from beeref.config import BeeSettings
 from beeref.constants import COLORS
 from beeref.selection import SelectableMixin
+from beeref.utils import (
+    image_format,
+    image_reader,
+    image_to_bytes,
+    sample_image,
+    to_grayscale,
+)
 
 
 logger = logging.getLogger(__name__)
 
 item_registry = {}
 
+# Tells which images have been drawn most recently:
+paint_counter = itertools.count(1)
+
 
 def register_item(cls):
     item_registry[cls.TYPE] = cls
@@ -70,6 +83,10 @@ def sort_by_filename(items):
 class BeeItemMixin(SelectableMixin):
     """Base for all items added by the user."""
 
+    #: The item's values as last saved to the bee file, to find out
+    #: whether the item needs saving again
+    saved_row = None
+
     def set_pos_center(self, pos):
         """Sets the position using the item's center as the origin point."""
 
@@ -96,6 +113,7 @@ class BeeItemMixin(SelectableMixin):
 
     def update_from_data(self, **kwargs):
         self.save_id = kwargs.get('save_id', self.save_id)
+        self.saved_row = kwargs.get('saved_row', self.saved_row)
         self.setPos(kwargs.get('x', self.pos().x()),
                     kwargs.get('y', self.pos().y()))
         self.setZValue(kwargs.get('z', self.zValue()))
@@ -111,9 +129,58 @@ class BeePixmapItem(BeeItemMixin, QtWidgets.QGraphicsPixmapItem):
 
     TYPE = 'pixmap'
     CROP_HANDLE_SIZE = 15
+    PLACEHOLDER_COLOR = QtGui.QColor(128, 128, 128, 80)
+    # Downscaled versions of the image for when we are zoomed out:
+    THUMBNAIL_FACTORS = (4, 16, 64)
+    THUMBNAIL_MIN_SIZE = 32
+    # Items smaller than this on screen (in pixels) are drawn as a
+    # rectangle in the image's average colour:
+    IMPOSTOR_SIZE = 4
+
+    # Images loaded lazily from bee files only know where to get
+    # their image data from until they are decoded:
+    blob_source = None
+    pixmap_pending = False
+    # The image's original encoded data, if known. Formats we can
+    # store in bee files as is, mapped to their file extension:
+    source_data = None
+    SOURCE_FORMATS = {'png': 'png', 'jpeg': 'jpg'}
+    # Hash of the image data as stored in bee files, to find duplicates:
+    blob_hash = None
+    # Whether the image is decoded in tiles, see BeeTiledPixmapItem:
+    TILED = False
+    # When the item has last been drawn, see ``paint_counter``:
+    last_painted = 0
+    # Hue/saturation histogram, see ``color_gamut``:
+    _color_gamut = None
+    # The image to sample colours from, see ``sample_color_at``:
+    _sample_image = None
+    # When to try again decoding an image whose data couldn't be read:
+    _decode_retry_at = 0
+    # How many seconds to wait before trying again:
+    DECODE_RETRY_INTERVAL = 10
+    # How many pixels to decode at most for the colour gamut:
+    GAMUT_MAX_PIXELS = 4000000
+    # Look at every n-th row/column, so that roughly this many
+    # rows/columns are considered for the colour gamut:
+    GAMUT_SAMPLE_SIZE = 1000
+    # How many distinct colours to look at one by one at most:
+    GAMUT_MAX_COLORS = 250000
+    # Channel values with the lowest 1 or 2 bits dropped (rounded to
+    # the middle of the dropped range), for images with more distinct
+    # colours than that:
+    GAMUT_LEVELS = tuple(
+        bytes(value >> shift << shift | 1 << shift >> 1
+              for value in range(256))
+        for shift in (1, 2))
 
     def __init__(self, image, filename=None, **kwargs):
         super().__init__(QtGui.QPixmap.fromImage(image))
+        self.previews = {}
+        self.preview_sources = {}
+        self._grayscale_previews = {}
+        self._previews_created = False
+        self._average_color = None
         self.save_id = None
         self.filename = filename
         self.reset_crop()
@@ -122,6 +189,7 @@ class BeePixmapItem(BeeItemMixin, QtWidgets.QGraphicsPixmapItem):
         self.crop_mode = False
         self.init_selectable()
         self.settings = BeeSettings()
+        self._grayscale_pixmap = None
         self.grayscale = False
 
     @classmethod
@@ -136,9 +204,323 @@ class BeePixmapItem(BeeItemMixin, QtWidgets.QGraphicsPixmapItem):
         return item
 
     def __str__(self):
-        size = self.pixmap().size()
+        if self.pixmap_pending:
+            size = self.crop.size().toSize()
+        else:
+            size = self.image_size()
         return (f'Image "{self.filename}" {size.width()} x {size.height()}')
 
+    def pixmap(self):
+        """The item's pixmap. Images that have been loaded lazily will
+        be decoded on first access."""
+
+        if self.pixmap_pending:
+            self.load_pending_pixmap()
+        return super().pixmap()
+
+    def image_size(self):
+        """The size of the whole, uncropped image."""
+
+        return self.pixmap().size()
+
+    def pixmap_memory(self):
+        """The memory used by the decoded full resolution image (and
+        its grayscale version) and the encoded image data kept in
+        memory in bytes."""
+
+        memory = self.encoded_memory()
+        if self.pixmap_pending:
+            return memory
+        pixmaps = (QtWidgets.QGraphicsPixmapItem.pixmap(self),
+                   self._grayscale_pixmap)
+        for pm in pixmaps:
+            if pm is not None:
+                memory += pm.width() * pm.height() * pm.depth() // 8
+        return memory
+
+    def encoded_memory(self):
+        """The memory used by encoded image data that is kept in memory
+        instead of being read from a file when needed, in bytes."""
+
+        memory = len(self.source_data) if self.source_data else 0
+        # Lazily loaded images detached from their file:
+        data = getattr(self.blob_source, 'data', None)
+        if isinstance(data, bytes) and data is not self.source_data:
+            memory += len(data)
+        return memory
+
+    def drop_pixmap(self):
+        """Free the memory of the decoded full resolution image.
+        Until it is needed again, the item is drawn from its previews
+        like a lazily loaded image.
+
+        :return: Whether the image could be dropped. This is only
+            possible if we still have its encoded data or know where
+            to get it from.
+        """
+
+        if self.pixmap_pending or self.TILED or self.crop_mode:
+            return False
+        if self.blob_source:
+            source = self.blob_source
+        elif self.source_data:
+            source = partial(bytes, self.source_data)
+        else:
+            return False
+
+        logger.debug(f'Dropping decoded image of {self}')
+        self.create_previews()
+        self.set_lazy_source(source)
+        QtWidgets.QGraphicsPixmapItem.setPixmap(self, QtGui.QPixmap())
+        self._grayscale_pixmap = None
+        self.release_sample_buffer()
+        self.update()
+        return True
+
+    def set_lazy_source(self, blob_source):
+        """Defer decoding the image until it is actually needed.
+
+        Until then, the item uses its crop rectangle as placeholder
+        size, so it needs to be set separately.
+
+        :param blob_source: Callable returning the encoded image data
+        """
+
+        self.blob_source = blob_source
+        self.pixmap_pending = True
+
+    def set_preview_sources(self, preview_sources):
+        """Set where to get downscaled versions of a lazily loaded
+        image from.
+
+        :param preview_sources: Dict mapping downscale factors to
+            callables returning the encoded image data
+        """
+
+        self.preview_sources = preview_sources
+
+    def set_preview_image(self, factor, img):
+        """Set a downscaled version of the image once it has been
+        decoded."""
+
+        if img.isNull():
+            logger.warning(f'Could not decode preview {factor} for {self}')
+            self.preview_sources.pop(factor, None)
+            return
+        self.previews[factor] = QtGui.QPixmap.fromImage(img)
+        self.update()
+
+    def create_thumbnails(self):
+        """Create downscaled versions of the image for displaying it
+        when zoomed out.
+
+        :return: List of ``(factor, QImage)`` tuples
+        """
+
+        return self.create_thumbnails_from_image(self.pixmap().toImage())
+
+    def create_previews(self):
+        """Create the downscaled versions of a decoded image for
+        drawing it when zoomed out, unless that has been done already."""
+
+        if self._previews_created or self.pixmap_pending:
+            return
+        logger.debug(f'Creating previews for {self}')
+        self.set_previews(self.create_thumbnails())
+
+    def request_previews(self):
+        """Make sure the previews get created. Happens in the background
+        if the item is in a scene, since scaling down large images takes
+        a while."""
+
+        if self._previews_created or self.pixmap_pending:
+            return
+        if self.scene():
+            self.scene().create_previews_later(self)
+        else:
+            self.create_previews()
+
+    def set_previews(self, previews, key=None):
+        """Set the downscaled versions of a decoded image once they have
+        been created.
+
+        :param previews: List of ``(factor, QImage)`` tuples
+        :param key: The ``pixmap_key`` of the image the previews have
+            been created from. If the image has changed in the
+            meantime, the previews are discarded.
+        """
+
+        if key is not None and key != self.pixmap_key():
+            logger.debug(f'Discarding outdated previews of {self}')
+            return
+        self._previews_created = True
+        for factor, img in previews:
+            self.previews[factor] = QtGui.QPixmap.fromImage(img)
+        self.update()
+
+    def clear_previews(self):
+        """Forget all downscaled versions of the image, e.g. when the
+        image has changed."""
+
+        self.previews = {}
+        self.preview_sources = {}
+        self._grayscale_previews = {}
+        self._previews_created = False
+        self._average_color = None
+
+    def average_color(self):
+        """The image's average colour, used for drawing it when it is
+        tiny on screen. ``None`` if there is no image data yet."""
+
+        if self._average_color is None:
+            pm = self.get_smallest_pixmap()
+            if pm is None:
+                return
+            img = pm.toImage().scaled(
+                1,
+                1,
+                Qt.AspectRatioMode.IgnoreAspectRatio,
+                Qt.TransformationMode.SmoothTransformation)
+            self._average_color = img.pixelColor(0, 0)
+
+        color = QtGui.QColor(self._average_color)
+        if self.grayscale:
+            gray = QtGui.qGray(color.rgb())
+            color.setRgb(gray, gray, gray, color.alpha())
+        return color
+
+    def get_smallest_pixmap(self):
+        """The smallest version of the image that is available without
+        decoding anything, or ``None``."""
+
+        if self.previews:
+            return self.previews[max(self.previews)]
+        if self.pixmap_pending:
+            return None
+        if not self._previews_created and self.scene():
+            # Scaling down the whole image would block the UI, so wait
+            # for the previews instead
+            self.request_previews()
+            return None
+        return self.pixmap()
+
+    def is_impostor_size(self, scale):
+        """Whether the item is so small on screen that drawing its
+        average colour looks the same as drawing the image.
+
+        :param scale: Screen pixels per image pixel
+        """
+
+        size = max(self.crop.width(), self.crop.height())
+        return size * scale < self.IMPOSTOR_SIZE
+
+    @classmethod
+    def create_thumbnails_from_image(cls, img, size=None):
+        """Create downscaled versions of the given image. Doesn't touch
+        any item, so it can be used from any thread.
+
+        :param size: The original image's size, if ``img`` is already
+            a downscaled version of it
+        :return: List of ``(factor, QImage)`` tuples
+        """
+
+        thumbnails = []
+        size = size or img.size()
+        for factor in cls.THUMBNAIL_FACTORS:
+            width = round(size.width() / factor)
+            height = round(size.height() / factor)
+            if max(width, height) < cls.THUMBNAIL_MIN_SIZE:
+                break
+            # Scaling down from the previous level is much cheaper
+            # than scaling down from the original each time
+            img = img.scaled(
+                width,
+                height,
+                Qt.AspectRatioMode.IgnoreAspectRatio,
+                Qt.TransformationMode.SmoothTransformation)
+            thumbnails.append((factor, img))
+        return thumbnails
+
+    def get_lod_factor(self, scale):
+        """The largest downscale factor available for this image that
+        still provides enough detail at the given on-screen scale.
+
+        :param scale: Screen pixels per image pixel
+        """
+
+        best = 1
+        for factor in set(self.previews) | set(self.preview_sources):
+            if factor * scale <= 1 and factor > best:
+                best = factor
+        return best
+
+    def get_best_preview(self, factor):
+        """The decoded preview that comes closest to the given downscale
+        factor, preferring more detailed ones. ``None`` if there is no
+        decoded preview."""
+
+        finer = [f for f in self.previews if f <= factor]
+        if finer:
+            return max(finer)
+        if self.previews:
+            return min(self.previews)
+
+    def draw_preview(self, painter, factor):
+        pm = self.previews[factor]
+        if self.grayscale:
+            if factor not in self._grayscale_previews:
+                self._grayscale_previews[factor] = self.to_grayscale(pm)
+            pm = self._grayscale_previews[factor]
+        source = QtCore.QRectF(
+            self.crop.x() / factor,
+            self.crop.y() / factor,
+            self.crop.width() / factor,
+            self.crop.height() / factor)
+        painter.drawPixmap(self.crop, pm, source)
+
+    def load_pending_pixmap(self):
+        """Decode a lazily loaded image in the current thread."""
+
+        if not self.may_decode():
+            return
+        logger.debug(f'Decoding pending image for {self}')
+        img = QtGui.QImage()
+        try:
+            img.loadFromData(self.blob_source())
+        except Exception:
+            logger.exception(f'Reading image data failed for {self}')
+        self.set_decoded_image(img)
+
+    def may_decode(self):
+        """Whether to try decoding the lazily loaded image. After
+        reading its data failed, we wait a while before trying again."""
+
+        return time.monotonic() >= self._decode_retry_at
+
+    def set_decoded_image(self, img):
+        """Set the pixmap of a lazily loaded image once it has been
+        decoded. Other than ``setPixmap``, this keeps the crop.
+
+        If the image couldn't be decoded, the item stays pending, so
+        that it keeps its blob source and decoding is tried again
+        later.
+        """
+
+        if not self.pixmap_pending:
+            # Has already been decoded in the meantime
+            return
+        if img.isNull():
+            logger.warning(f'Could not decode image for {self}')
+            self._decode_retry_at = (
+                time.monotonic() + self.DECODE_RETRY_INTERVAL)
+            return
+        self.pixmap_pending = False
+        self.prepareGeometryChange()
+        super().setPixmap(QtGui.QPixmap.fromImage(img))
+        # Re-apply grayscale now that we have actual image data:
+        self._grayscale_pixmap = None
+        self.grayscale = self.grayscale
+
     @property
     def crop(self):
         return self._crop
@@ -156,58 +538,79 @@ class BeePixmapItem(BeeItemMixin, QtWidgets.QGraphicsPixmapItem):
 
     @grayscale.setter
     def grayscale(self, value):
-        logger.debug('Setting grayscale for {self} to {value}')
+        logger.debug(f'Setting grayscale for {self} to {value}')
         self._grayscale = value
-        if value is True:
-            # Using the grayscale image format to convert to grayscale
-            # loses an image's tranparency. So the straightworward
-            # following method gives us an ugly black replacement:
-            # img = img.convertToFormat(QtGui.QImage.Format.Format_Grayscale8)
-
-            # Instead, we will fill the background with the current
-            # canvas colour, so the issue is only visible if the image
-            # overlaps other images. The way we do it here only works
-            # as long as the canvas colour is itself grayscale,
-            # though.
-            img = QtGui.QImage(
-                self.pixmap().size(), QtGui.QImage.Format.Format_Grayscale8)
-            img.fill(QtGui.QColor(*COLORS['Scene:Canvas']))
-            painter = QtGui.QPainter(img)
-            painter.drawPixmap(0, 0, self.pixmap())
-            painter.end()
-            self._grayscale_pixmap = QtGui.QPixmap.fromImage(img)
-
-            # Alternative methods that have their own issues:
-            #
-            # 1. Use setAlphaChannel of the resulting grayscale
-            # image. How do we get the original alpha channel? Using
-            # the whole original image also takes color values into
-            # account, not just their alpha values.
-            #
-            # 2. QtWidgets.QGraphicsColorizeEffect() with black colour
-            # on the GraphicsItem. This applys to everything the paint
-            # method does, so the selection outline/handles will also
-            # be gray. setGraphicsEffect is only available on some
-            # widgets, so we can't apply it selectively.
-            #
-            # 3. Going through every pixel and doing it manually — bad
-            # performance.
-        else:
-            self._grayscale_pixmap = None
+        self.release_sample_buffer()
+        # The grayscale version is kept when switching back to colour,
+        # so that toggling grayscale again (e.g. on undo) is instant.
+        # Pending images get converted once they have been decoded.
+        if (value is True
+                and self._grayscale_pixmap is None
+                and not self.pixmap_pending):
+            if self.scene():
+                # The colour version is shown until this is done:
+                self.scene().convert_grayscale_later(self)
+            else:
+                self.get_grayscale_pixmap()
 
         self.update()
 
-    def sample_color_at(self, pos):
+    def pixmap_key(self):
+        """Identifies the current image, see ``set_grayscale_image``."""
+
+        return QtWidgets.QGraphicsPixmapItem.pixmap(self).cacheKey()
+
+    def set_grayscale_image(self, img, key=None):
+        """Set the grayscale version of the image once it has been
+        converted.
+
+        :param key: The ``pixmap_key`` of the image the grayscale
+            version has been converted from. If the image has changed
+            in the meantime, the result is discarded.
+        """
+
+        if key is not None and key != self.pixmap_key():
+            logger.debug(f'Discarding outdated grayscale image of {self}')
+            return
+        self._grayscale_pixmap = QtGui.QPixmap.fromImage(img)
+        self.update()
+
+    def get_grayscale_pixmap(self):
+        """The grayscale version of the image. Converts it right away if
+        that hasn't been done yet."""
+
+        if self._grayscale_pixmap is None:
+            self.set_grayscale_image(to_grayscale(self.pixmap().toImage()))
+        return self._grayscale_pixmap
+
+    def to_grayscale(self, pixmap):
+        """Returns a grayscale version of the given pixmap."""
+
+        return QtGui.QPixmap.fromImage(to_grayscale(pixmap.toImage()))
+
+    def sample_color_at(self, pos, size=1):
+        """The colour at the given scene position.
+
+        The image to sample from is kept until ``release_sample_buffer``
+        is called, so that sampling doesn't need to copy the image on
+        every mouse move.
+
+        :param size: Average over a square of this many pixels
+        """
+
+        if self._sample_image is None:
+            if self.grayscale:
+                pm = self.get_grayscale_pixmap()
+            else:
+                pm = self.pixmap()
+            self._sample_image = pm.toImage()
+
         ipos = self.mapFromScene(pos)
-        if self.grayscale:
-            pm = self._grayscale_pixmap
-        else:
-            pm = self.pixmap()
-        img = pm.toImage()
+        return sample_image(
+            self._sample_image, int(ipos.x()), int(ipos.y()), size)
 
-        color = img.pixelColor(int(ipos.x()), int(ipos.y()))
-        if color.alpha():
-            return color
+    def release_sample_buffer(self):
+        self._sample_image = None
 
     def bounding_rect_unselected(self):
         if self.crop_mode:
@@ -238,39 +641,122 @@ class BeePixmapItem(BeeItemMixin, QtWidgets.QGraphicsPixmapItem):
         """Determines the format for storing this image."""
 
         formt = self.settings.valueOrDefault('Items/image_storage_format')
+        formt = BeePixmapItem.choose_imgformat(img, formt)
+        logger.debug(f'Found format {formt} for {self}')
+        return formt
+
+    @staticmethod
+    def choose_imgformat(img, formt):
+        """Resolves the storage format setting ``formt`` for the given
+        image."""
 
         if formt == 'best':
             # Images with alpha channel and small images are stored as png
             if (img.hasAlphaChannel()
                     or (img.height() < 500 and img.width() < 500)):
-                formt = 'png'
-            else:
-                formt = 'jpg'
-
-        logger.debug(f'Found format {formt} for {self}')
+                return 'png'
+            return 'jpg'
         return formt
 
+    def image_for_export(self, apply_grayscale=False, apply_crop=False):
+        """The image as it is to be exported, along with the format
+        to store it in.
+
+        :return: Tuple of ``(QImage, imgformat)``
+        """
+
+        return self.export_image_source(apply_grayscale, apply_crop)()
+
+    def export_image_source(self, apply_grayscale=False, apply_crop=False):
+        """Returns a callable creating the image as it is to be
+        exported, see ``image_for_export``.
+
+        Needs to be called from the main thread. The callable doesn't
+        touch the item, so it can be called from any thread. Lazily
+        loaded images are only decoded when it is called.
+        """
+
+        grayscale = apply_grayscale and self.grayscale
+        if grayscale and self._grayscale_pixmap is not None:
+            image = self._grayscale_pixmap.toImage()
+            grayscale = False
+        elif self.pixmap_pending:
+            image = self.blob_source
+        else:
+            image = QtWidgets.QGraphicsPixmapItem.pixmap(self).toImage()
+        return partial(
+            self.create_export_image,
+            image,
+            crop=self.crop.toRect() if apply_crop else None,
+            grayscale=grayscale,
+            formt=self.settings.valueOrDefault('Items/image_storage_format'))
+
+    @classmethod
+    def create_export_image(cls, image, crop, grayscale, formt):
+        """Runs in any thread, see ``export_image_source``.
+
+        :param image: QImage or callable returning the encoded image data
+        :return: Tuple of ``(QImage, imgformat)``
+        """
+
+        if callable(image):
+            img = QtGui.QImage()
+            try:
+                img.loadFromData(image())
+            except Exception:
+                logger.exception('Reading image data for export failed')
+        else:
+            img = image
+        if crop is not None:
+            img = img.copy(crop)
+        if grayscale:
+            img = to_grayscale(img)
+        return (img, cls.choose_imgformat(img, formt))
+
     def pixmap_to_bytes(self, apply_grayscale=False, apply_crop=False):
         """Convert the pixmap data to PNG bytestring."""
-        barray = QtCore.QByteArray()
-        buffer = QtCore.QBuffer(barray)
-        buffer.open(QtCore.QIODevice.OpenModeFlag.WriteOnly)
-        if apply_grayscale and self.grayscale:
-            pm = self._grayscale_pixmap
-        else:
-            pm = self.pixmap()
+        img, imgformat = self.image_for_export(apply_grayscale, apply_crop)
+        return (image_to_bytes(img, imgformat), imgformat)
 
-        if apply_crop:
-            pm = pm.copy(self.crop.toRect())
+    def get_source_data(self):
+        """Returns the image's original encoded data and its format
+        if it can be stored as is, so that we don't need to re-encode
+        it. Otherwise returns ``None``.
+        """
 
-        img = pm.toImage()
-        imgformat = self.get_imgformat(img)
-        img.save(buffer, imgformat.upper(), quality=90)
-        return (barray.data(), imgformat)
+        formt = self.settings.valueOrDefault('Items/image_storage_format')
+        if formt != 'best' and not self.TILED:
+            # The user wants all images in a specific format. Tiled
+            # images are too big to be re-encoded, though.
+            return None
+
+        data = self.source_data
+        if data is None and self.blob_source:
+            try:
+                data = self.blob_source()
+            except Exception:
+                logger.exception(f'Reading image data failed for {self}')
+        if not data:
+            return None
+
+        imgformat = self.SOURCE_FORMATS.get(image_format(data))
+        if imgformat:
+            logger.debug(f'Using original {imgformat} data for {self}')
+            return (data, imgformat)
 
     def setPixmap(self, pixmap):
         super().setPixmap(pixmap)
+        self.pixmap_pending = False
+        self._grayscale_pixmap = None
+        self._color_gamut = None
+        self.release_sample_buffer()
+        # The original data doesn't match the new pixmap anymore:
+        self.source_data = None
+        self.blob_source = None
+        self.blob_hash = None
+        self.clear_previews()
         self.reset_crop()
+        self.grayscale = self.grayscale
 
     def pixmap_from_bytes(self, data):
         """Set image pimap from a bytestring."""
@@ -278,9 +764,29 @@ class BeePixmapItem(BeeItemMixin, QtWidgets.QGraphicsPixmapItem):
         pixmap.loadFromData(data)
         self.setPixmap(pixmap)
 
-    def create_copy(self):
+    def create_image_copy(self):
+        """A new item with the same image, but none of the other
+        properties copied."""
+
         item = BeePixmapItem(QtGui.QImage(), self.filename)
-        item.setPixmap(self.pixmap())
+        if self.pixmap_pending:
+            # No need to decode the image just for making a copy
+            item.set_lazy_source(self.blob_source)
+            item.set_preview_sources(dict(self.preview_sources))
+            item.previews = dict(self.previews)
+        else:
+            item.setPixmap(self.pixmap())
+            # The copy can share the already created previews
+            item.previews = dict(self.previews)
+            item._previews_created = self._previews_created
+            item._grayscale_pixmap = self._grayscale_pixmap
+        return item
+
+    def create_copy(self):
+        item = self.create_image_copy()
+        item.source_data = self.source_data
+        item.blob_hash = self.blob_hash
+        item.set_color_gamut(self._color_gamut)
         item.setPos(self.pos())
         item.setZValue(self.zValue())
         item.setScale(self.scale())
@@ -292,47 +798,118 @@ class BeePixmapItem(BeeItemMixin, QtWidgets.QGraphicsPixmapItem):
         item.crop = self.crop
         return item
 
-    @cached_property
+    @property
     def color_gamut(self):
-        logger.debug(f'Calculating color gamut for {self}')
-        gamut = defaultdict(int)
-        img = self.pixmap().toImage()
+        """Histogram of the image's hues and saturations as dict mapping
+        ``(hue, saturation)`` tuples to pixel counts. Calculated when
+        first needed unless it has been calculated in the background
+        or loaded from the bee file."""
+
+        if not self.has_color_gamut():
+            self.set_color_gamut(
+                self.color_gamut_from_image(self.gamut_image()))
+        return self._color_gamut
+
+    def has_color_gamut(self):
+        return self._color_gamut is not None
+
+    def set_color_gamut(self, gamut):
+        self._color_gamut = gamut
+
+    def gamut_image(self):
+        """The image to calculate the colour gamut from."""
+
+        return self.gamut_image_source()()
+
+    def gamut_image_source(self):
+        """Returns a callable returning the image to calculate the
+        colour gamut from.
+
+        Needs to be called from the main thread. The callable doesn't
+        touch the item, so it can be called from any thread. Lazily
+        loaded images are only decoded when it is called.
+        """
+
+        if self.pixmap_pending:
+            return partial(self.gamut_image_from_data, self.blob_source)
+        return partial(
+            QtGui.QImage, QtWidgets.QGraphicsPixmapItem.pixmap(self).toImage())
+
+    @classmethod
+    def gamut_image_from_data(cls, source):
+        """Decode the image for calculating its colour gamut. Large
+        images are decoded downscaled, since the colour gamut only looks
+        at a limited number of pixels anyway.
+
+        :param source: Callable returning the encoded image data
+        """
+
+        try:
+            reader = image_reader(source())
+        except Exception:
+            logger.exception('Reading image data for color gamut failed')
+            return QtGui.QImage()
+        size = reader.size()
+        pixels = size.width() * size.height()
+        if pixels > cls.GAMUT_MAX_PIXELS:
+            factor = math.sqrt(pixels / cls.GAMUT_MAX_PIXELS)
+            reader.setScaledSize(QtCore.QSize(
+                math.ceil(size.width() / factor),
+                math.ceil(size.height() / factor)))
+        return reader.read()
+
+    @classmethod
+    def color_gamut_from_image(cls, img):
+        """Calculate the colour gamut of the given image, see
+        ``color_gamut``. Safe to call outside of the main thread."""
+
+        logger.debug(f'Calculating color gamut for {img.size()}')
+        img = img.convertToFormat(QtGui.QImage.Format.Format_ARGB32)
+        if img.isNull():
+            return {}
+        ptr = img.constBits()
+        ptr.setsize(img.sizeInBytes())
+        # One 0xAARRGGBB value per pixel, since 32 bit formats have no
+        # padding at the end of the lines:
+        pixels = memoryview(ptr).cast('I')
+        width = img.width()
         # Don't evaluate every pixel for larger images:
-        step = max(1, int(max(img.width(), img.height()) / 1000))
+        step = max(1, int(max(width, img.height()) / cls.GAMUT_SAMPLE_SIZE))
         logger.debug(f'Considering every {step}. row/column')
+        data = b''.join(
+            pixels[start:start + width:step].tobytes()
+            for start in range(0, len(pixels), width * step))
+
+        # Counting the distinct pixel values is done in C, so only
+        # distinct colours need to be looked at one by one. Only images
+        # with lots of noise need their colours reduced for that:
+        counts = Counter(memoryview(data).cast('I'))
+        for levels in cls.GAMUT_LEVELS:
+            if len(counts) <= cls.GAMUT_MAX_COLORS:
+                break
+            logger.debug(f'Reducing {len(counts)} distinct colors')
+            counts = Counter(memoryview(data.translate(levels)).cast('I'))
 
-        # Not actually faster than solution below :(
-        # ptr = img.bits()
-        # size = img.sizeInBytes()
-        # pixelsize = int(img.sizeInBytes() / img.width() / img.height())
-        # ptr.setsize(size)
-        # for pixel in batched(ptr, n=pixelsize):
-        #     r, g, b, alpha = tuple(map(ord, pixel))
-        #     if 5 < alpha and 5 < r < 250 and 5 < g < 250 and 5 < b < 250:
-        #         # Only consider pixels that aren't close to
-        #         # transparent, white or black
-        #         rgb = QtGui.QColor(r, g, b)
-        #         gamut[rgb.hue(), rgb.saturation()] += 1
-
-        for i in range(0, img.width(), step):
-            for j in range(0, img.height(), step):
-                rgb = img.pixelColor(i, j)
-                rgbtuple = (rgb.red(), rgb.blue(), rgb.green())
-                if (5 < rgb.alpha()
-                        and min(rgbtuple) < 250 and max(rgbtuple) > 5):
-                    # Only consider pixels that aren't close to
-                    # transparent, white or black
-                    gamut[rgb.hue(), rgb.saturation()] += 1
+        gamut = defaultdict(int)
+        color = QtGui.QColor()
+        for value, count in counts.items():
+            alpha = value >> 24
+            rgb = ((value >> 16) & 0xff, (value >> 8) & 0xff, value & 0xff)
+            if alpha > 5 and min(rgb) < 250 and max(rgb) > 5:
+                # Only consider pixels that aren't close to
+                # transparent, white or black
+                color.setRgb(*rgb)
+                gamut[color.hue(), color.saturation()] += count
 
         logger.debug(f'Got {len(gamut)} color gamut values')
-        return gamut
+        return dict(gamut)
 
     def copy_to_clipboard(self, clipboard):
         clipboard.setPixmap(self.pixmap())
 
     def reset_crop(self):
         self.crop = QtCore.QRectF(
-            0, 0, self.pixmap().size().width(), self.pixmap().size().height())
+            QtCore.QPointF(0, 0), QtCore.QSizeF(self.image_size()))
 
     @property
     def crop_handle_size(self):
@@ -447,18 +1024,26 @@ class BeePixmapItem(BeeItemMixin, QtWidgets.QGraphicsPixmapItem):
         painter.drawRect(rect)
 
     def paint(self, painter, option, widget):
-        if abs(painter.combinedTransform().m11()) < 2:
+        self.last_painted = next(paint_counter)
+        transform = painter.combinedTransform()
+        if abs(transform.m11()) < 2:
             # We want image smoothing, but only for images where we
             # are not zoomed in a lot. This is to ensure that for
             # example icons and pixel sprites can be viewed correctly.
             painter.setRenderHint(painter.RenderHint.SmoothPixmapTransform)
+        scale = math.hypot(transform.m11(), transform.m12())
+        impostor = (not self.crop_mode
+                    and self.is_impostor_size(scale)
+                    and self.average_color())
 
         if self.crop_mode:
             self.paint_debug(painter, option, widget)
 
             # Darken image outside of cropped area
-            painter.drawPixmap(0, 0, self.pixmap())
-            path = QtWidgets.QGraphicsPixmapItem.shape(self)
+            self.draw_uncropped_image(painter, option, scale)
+            path = QtGui.QPainterPath()
+            path.addRect(QtCore.QRectF(
+                QtCore.QPointF(0, 0), QtCore.QSizeF(self.image_size())))
             path.addRect(self.crop_temp)
             color = QtGui.QColor(0, 0, 0)
             color.setAlpha(100)
@@ -470,11 +1055,52 @@ class BeePixmapItem(BeeItemMixin, QtWidgets.QGraphicsPixmapItem):
             for handle in self.crop_handles():
                 self.draw_crop_rect(painter, handle())
             self.draw_crop_rect(painter, self.crop_temp)
+        elif impostor:
+            painter.fillRect(self.crop, impostor)
+            self.paint_selectable(painter, option, widget)
+        elif self.pixmap_pending:
+            factor = self.get_lod_factor(scale)
+            if self.scene():
+                self.scene().decode_later(self, factor)
+            preview_factor = self.get_best_preview(factor)
+            if preview_factor:
+                self.draw_preview(painter, preview_factor)
+            else:
+                # Draw a placeholder until the image has been decoded
+                painter.fillRect(self.crop, self.PLACEHOLDER_COLOR)
+            self.paint_selectable(painter, option, widget)
         else:
-            pm = self._grayscale_pixmap if self.grayscale else self.pixmap()
-            painter.drawPixmap(self.crop, pm, self.crop)
+            self.draw_image(painter, option, scale)
             self.paint_selectable(painter, option, widget)
 
+    def draw_image(self, painter, option, scale):
+        """Draw the cropped image of a decoded item.
+
+        :param scale: Screen pixels per image pixel
+        """
+
+        zoomed_out = scale * min(self.THUMBNAIL_FACTORS) <= 1
+        if zoomed_out:
+            self.request_previews()
+        factor = self.get_lod_factor(scale)
+        if factor in self.previews:
+            self.draw_preview(painter, factor)
+        else:
+            pm = self.pixmap()
+            if self.grayscale and self._grayscale_pixmap is not None:
+                pm = self._grayscale_pixmap
+            if zoomed_out and not self._previews_created:
+                # Smoothly scaling down the whole image is slow, so
+                # draw it unsmoothed until the previews are there
+                painter.setRenderHint(
+                    painter.RenderHint.SmoothPixmapTransform, False)
+            painter.drawPixmap(self.crop, pm, self.crop)
+
+    def draw_uncropped_image(self, painter, option, scale):
+        """Draw the whole image for crop mode."""
+
+        painter.drawPixmap(0, 0, self.pixmap())
+
     def enter_crop_mode(self):
         logger.debug(f'Entering crop mode on {self}')
         self.prepareGeometryChange()
@@ -552,31 +1178,31 @@ class BeePixmapItem(BeeItemMixin, QtWidgets.QGraphicsPixmapItem):
         if handle == self.crop_handle_bottomleft:
             topleft = QtCore.QPointF(0, self.crop_temp.top())
             bottomright = QtCore.QPointF(
-                self.crop_temp.right(), self.pixmap().size().height())
+                self.crop_temp.right(), self.image_size().height())
         if handle == self.crop_handle_bottomright:
             topleft = self.crop_temp.topLeft()
             bottomright = QtCore.QPointF(
-                self.pixmap().size().width(), self.pixmap().size().height())
+                self.image_size().width(), self.image_size().height())
         if handle == self.crop_handle_topright:
             topleft = QtCore.QPointF(self.crop_temp.left(), 0)
             bottomright = QtCore.QPointF(
-                self.pixmap().size().width(), self.crop_temp.bottom())
+                self.image_size().width(), self.crop_temp.bottom())
         if handle == self.crop_edge_top:
             topleft = QtCore.QPointF(0, 0)
             bottomright = QtCore.QPointF(
-                self.pixmap().size().width(), self.crop_temp.bottom())
+                self.image_size().width(), self.crop_temp.bottom())
         if handle == self.crop_edge_bottom:
             topleft = QtCore.QPointF(0, self.crop_temp.top())
             bottomright = QtCore.QPointF(
-                self.pixmap().size().width(), self.pixmap().size().height())
+                self.image_size().width(), self.image_size().height())
         if handle == self.crop_edge_left:
             topleft = QtCore.QPointF(0, 0)
             bottomright = QtCore.QPointF(
-                self.crop_temp.right(), self.pixmap().size().height())
+                self.crop_temp.right(), self.image_size().height())
         if handle == self.crop_edge_right:
             topleft = QtCore.QPointF(self.crop_temp.left(), 0)
             bottomright = QtCore.QPointF(
-                self.pixmap().size().width(), self.pixmap().size().height())
+                self.image_size().width(), self.image_size().height())
 
         point.setX(min(bottomright.x(), max(topleft.x(), point.x())))
         point.setY(min(bottomright.y(), max(topleft.y(), point.y())))
@@ -633,6 +1259,348 @@ class BeePixmapItem(BeeItemMixin, QtWidgets.QGraphicsPixmapItem):
             super().mouseReleaseEvent(event)
 
 
+class BeeTiledPixmapItem(BeePixmapItem):
+    """Class for images that are too big to be decoded as a whole.
+
+    The image is kept in its encoded form. Only the tiles that are
+    visible get decoded, and only in the resolution needed for the
+    current zoom level. Tiled images are saved to bee files like any
+    other image.
+    """
+
+    TILED = True
+    TILE_SIZE = 1024
+    # Images with a longer side than this are tiled even if they don't
+    # exceed the allocation limit:
+    TILING_MIN_SIZE = 16384
+    # How many decoded tiles to keep in memory:
+    MAX_TILES = 96
+
+    def __init__(self, data, filename=None, **kwargs):
+        # Needs to be known before the image is set up:
+        self._image_size = image_reader(data).size()
+        self.tiles = OrderedDict()
+        self._grayscale_tiles = {}
+        self.tile_factors = [1]
+        while (self.TILE_SIZE * self.tile_factors[-1]
+               < max(self._image_size.width(), self._image_size.height())):
+            self.tile_factors.append(self.tile_factors[-1] * 2)
+        super().__init__(QtGui.QImage(), filename, **kwargs)
+        self.source_data = data
+        # Gives us the exposed rect when painting:
+        flags = QtWidgets.QGraphicsItem.GraphicsItemFlag
+        self.setFlag(flags.ItemUsesExtendedStyleOption)
+
+    @classmethod
+    def needs_tiling(cls, reader):
+        """Whether the image of the given ``QImageReader`` is too big to
+        be decoded as a whole, and can be decoded in tiles instead."""
+
+        size = reader.size()
+        if not size.isValid():
+            return False
+        if (reader.format().data().decode() not in cls.SOURCE_FORMATS
+                or not reader.supportsOption(
+                    QtGui.QImageIOHandler.ImageOption.ClipRect)
+                or reader.transformation()
+                != QtGui.QImageIOHandler.Transformation.TransformationNone):
+            # We need to be able to decode parts of the image, and to
+            # store the image as is
+            return False
+        limit = QtGui.QImageReader.allocationLimit() * 1024 * 1024
+        return (max(size.width(), size.height()) > cls.TILING_MIN_SIZE
+                or 0 < limit < size.width() * size.height() * 4)
+
+    def pixmap(self):
+        """Decodes the whole image. Only to be used where there is no
+        way around it, e.g. for copying to the clipboard."""
+
+        logger.debug(f'Decoding whole tiled image for {self}')
+        return QtGui.QPixmap.fromImage(self.read_image(self.source_data))
+
+    @staticmethod
+    def read_image(data, rect=None):
+        """Decodes the given area of the image, or the whole image.
+        The result is downscaled if needed to stay within Qt's
+        allocation limit, since decoding would fail otherwise.
+        """
+
+        reader = image_reader(data)
+        if rect is None:
+            rect = QtCore.QRect(QtCore.QPoint(0, 0), reader.size())
+        else:
+            reader.setClipRect(rect)
+        limit = QtGui.QImageReader.allocationLimit() * 1024 * 1024
+        size_in_bytes = rect.width() * rect.height() * 4
+        if 0 < limit < size_in_bytes:
+            # Decoders like JPEG's can only downscale by powers of two
+            # without decoding in full size first:
+            factor = 2 ** math.ceil(math.log2(
+                math.sqrt(size_in_bytes / limit)))
+            logger.warning(f'Image too big, decoding downscaled by {factor}')
+            reader.setScaledSize(QtCore.QSize(
+                math.ceil(rect.width() / factor),
+                math.ceil(rect.height() / factor)))
+        img = reader.read()
+        if img.isNull():
+            logger.error(f'Decoding image failed: {reader.errorString()}')
+        return img
+
+    def image_size(self):
+        return QtCore.QSize(self._image_size)
+
+    def get_extra_save_data(self):
+        data = super().get_extra_save_data()
+        # Tiled images mustn't be loaded lazily, since that would
+        # decode the whole image:
+        data['tiled'] = True
+        return data
+
+    @BeePixmapItem.grayscale.setter
+    def grayscale(self, value):
+        logger.debug(f'Setting grayscale for {self} to {value}')
+        # Tiles are converted to grayscale when they are drawn
+        self._grayscale = value
+        self._grayscale_pixmap = None
+        self.release_sample_buffer()
+        self.update()
+
+    def create_thumbnails(self):
+        return self.create_thumbnails_from_data(self.source_data)
+
+    def gamut_image_source(self):
+        # No need to decode the whole image, since the colour gamut
+        # only looks at a limited number of pixels anyway:
+        size = self.image_size()
+        factor = min(
+            (f for f in self.tile_factors
+             if size.width() * size.height() / f**2 <= self.GAMUT_MAX_PIXELS),
+            default=self.tile_factors[-1])
+        return partial(
+            self.read_tile,
+            self.source_data,
+            QtCore.QRect(QtCore.QPoint(0, 0), size),
+            factor)
+
+    @classmethod
+    def create_thumbnails_from_data(cls, data):
+        """Create downscaled versions of the encoded image without
+        decoding it in full size first.
+
+        :return: List of ``(factor, QImage)`` tuples
+        """
+
+        reader = image_reader(data)
+        size = reader.size()
+        factor = min(cls.THUMBNAIL_FACTORS)
+        reader.setScaledSize(QtCore.QSize(
+            round(size.width() / factor), round(size.height() / factor)))
+        return cls.create_thumbnails_from_image(reader.read(), size)
+
+    def get_lod_factor(self, scale):
+        return max(f for f in self.tile_factors if f * scale <= 1 or f == 1)
+
+    def get_smallest_pixmap(self):
+        return self.tiles.get((self.tile_factors[-1], 0, 0))
+
+    def tile_rect(self, key):
+        """The area of the image covered by the given tile."""
+
+        factor, col, row = key
+        span = self.TILE_SIZE * factor
+        return QtCore.QRect(col * span, row * span, span, span).intersected(
+            QtCore.QRect(QtCore.QPoint(0, 0), self._image_size))
+
+    def tile_keys(self, factor, rect):
+        """The keys of all tiles with the given downscale factor that
+        intersect the given rect.
+
+        :return: List of ``(factor, column, row)`` tuples
+        """
+
+        rect = rect.intersected(QtCore.QRectF(
+            QtCore.QPointF(0, 0), QtCore.QSizeF(self._image_size)))
+        if rect.isEmpty():
+            return []
+        span = self.TILE_SIZE * factor
+        cols = range(int(rect.left() // span),
+                     math.ceil(rect.right() / span))
+        rows = range(int(rect.top() // span),
+                     math.ceil(rect.bottom() / span))
+        return [(factor, col, row) for row in rows for col in cols]
+
+    def tile_source(self, key):
+        """A callable that decodes the given tile. Doesn't touch the
+        item, so it can be called from any thread."""
+
+        return partial(self.read_tile,
+                       self.source_data,
+                       self.tile_rect(key),
+                       key[0])
+
+    @staticmethod
+    def read_tile(data, rect, factor):
+        reader = image_reader(data)
+        reader.setClipRect(rect)
+        reader.setScaledSize(QtCore.QSize(
+            math.ceil(rect.width() / factor),
+            math.ceil(rect.height() / factor)))
+        return reader.read()
+
+    def get_tile(self, key, decode=True):
+        """The decoded tile for the given key, or ``None`` if it hasn't
+        been decoded yet.
+
+        :param decode: Schedule decoding of missing tiles
+        """
+
+        tile = self.tiles.get(key)
+        if tile is None:
+            if decode and self.scene():
+                self.scene().decode_tile_later(self, key)
+            return None
+        self.tiles.move_to_end(key)
+        if self.grayscale:
+            if key not in self._grayscale_tiles:
+                self._grayscale_tiles[key] = self.to_grayscale(tile)
+            tile = self._grayscale_tiles[key]
+        return tile
+
+    def set_tile(self, key, img):
+        """Set a tile once it has been decoded."""
+
+        if img.isNull():
+            logger.warning(f'Could not decode tile {key} for {self}')
+        self.tiles[key] = QtGui.QPixmap.fromImage(img)
+        # Forget the tiles that haven't been drawn for the longest
+        # time. The coarsest ones serve as fallback and are kept.
+        for old in list(self.tiles):
+            if len(self.tiles) <= self.MAX_TILES:
+                break
+            if old[0] != self.tile_factors[-1]:
+                del self.tiles[old]
+                self._grayscale_tiles.pop(old, None)
+        self.update()
+
+    def pixmap_memory(self):
+        """The memory used by the decoded tiles and the encoded image
+        data in bytes."""
+
+        return self.encoded_memory() + sum(
+            pm.width() * pm.height() * pm.depth() // 8
+            for pm in itertools.chain(self.tiles.values(),
+                                      self._grayscale_tiles.values()))
+
+    def drop_pixmap(self):
+        """Free the memory of the decoded tiles. The coarsest ones serve
+        as fallback and are kept. The others get decoded again once
+        they are needed.
+
+        :return: Whether any tiles have been dropped
+        """
+
+        keys = [key for key in self.tiles if key[0] != self.tile_factors[-1]]
+        if not keys:
+            return False
+        logger.debug(f'Dropping {len(keys)} decoded tiles of {self}')
+        for key in keys:
+            del self.tiles[key]
+            self._grayscale_tiles.pop(key, None)
+        self.release_sample_buffer()
+        self.update()
+        return True
+
+    def draw_image(self, painter, option, scale):
+        self.draw_tiles(painter, option, scale, self.crop)
+
+    def draw_uncropped_image(self, painter, option, scale):
+        self.draw_tiles(painter, option, scale, QtCore.QRectF(
+            QtCore.QPointF(0, 0), QtCore.QSizeF(self._image_size)))
+
+    def draw_tiles(self, painter, option, scale, rect):
+        """Draw the tiles within the given rect that are exposed.
+        Tiles that haven't been decoded yet are drawn from coarser
+        tiles in the meantime."""
+
+        if option:
+            rect = rect.intersected(option.exposedRect)
+        # Always get the coarsest tiles to fall back on:
+        for key in self.tile_keys(self.tile_factors[-1], rect):
+            self.get_tile(key)
+
+        factor = self.get_lod_factor(scale)
+        for key in self.tile_keys(factor, rect):
+            target = QtCore.QRectF(self.tile_rect(key)).intersected(rect)
+            self.draw_tile(painter, key, target)
+
+    def draw_tile(self, painter, key, target):
+        factor, col, row = key
+        for coarser in self.tile_factors:
+            if coarser < factor:
+                continue
+            tile_key = (coarser, col * factor // coarser,
+                        row * factor // coarser)
+            tile = self.get_tile(tile_key, decode=(tile_key == key))
+            if tile is not None:
+                origin = self.tile_rect(tile_key).topLeft()
+                source = QtCore.QRectF(
+                    (target.x() - origin.x()) / coarser,
+                    (target.y() - origin.y()) / coarser,
+                    target.width() / coarser,
+                    target.height() / coarser)
+                painter.drawPixmap(target, tile, source)
+                return
+        painter.fillRect(target, self.PLACEHOLDER_COLOR)
+
+    def bounding_rect_unselected(self):
+        if self.crop_mode:
+            return QtCore.QRectF(
+                QtCore.QPointF(0, 0), QtCore.QSizeF(self._image_size))
+        return super().bounding_rect_unselected()
+
+    def sample_color_at(self, pos, size=1):
+        ipos = self.mapFromScene(pos)
+        if self._sample_image is None:
+            self._sample_image = {}
+        # Don't decode anything just for sampling, use the most
+        # detailed tile that is available:
+        for factor in self.tile_factors:
+            span = self.TILE_SIZE * factor
+            key = (factor, int(ipos.x() // span), int(ipos.y() // span))
+            if key not in self._sample_image:
+                tile = self.get_tile(key, decode=False)
+                if tile is None:
+                    continue
+                self._sample_image[key] = tile.toImage()
+            origin = self.tile_rect(key).topLeft()
+            return sample_image(
+                self._sample_image[key],
+                int((ipos.x() - origin.x()) / factor),
+                int((ipos.y() - origin.y()) / factor),
+                size)
+
+    def export_image_source(self, apply_grayscale=False, apply_crop=False):
+        return partial(
+            self.create_export_image,
+            self.source_data,
+            crop=self.crop.toRect() if apply_crop else None,
+            grayscale=apply_grayscale and self.grayscale,
+            formt=self.settings.valueOrDefault('Items/image_storage_format'))
+
+    @classmethod
+    def create_export_image(cls, data, crop, grayscale, formt):
+        img = cls.read_image(data, crop)
+        if grayscale:
+            img = to_grayscale(img)
+        return (img, cls.choose_imgformat(img, formt))
+
+    def create_image_copy(self):
+        item = BeeTiledPixmapItem(self.source_data, self.filename)
+        # The copy can share the already decoded tiles
+        item.tiles = OrderedDict(self.tiles)
+        return item
+
+
 @register_item
 class BeeTextItem(BeeItemMixin, QtWidgets.QGraphicsTextItem):
     """Class for text added by the user."""
@@ -648,6 +1616,7 @@ class BeeTextItem(BeeItemMixin, QtWidgets.QGraphicsTextItem):
         self.is_editable = True
         self.edit_mode = False
         self.setDefaultTextColor(QtGui.QColor(*COLORS['Scene:Text']))
+        self.document().contentsChanged.connect(self.notify_geometry_change)
 
     @classmethod
     def create_from_data(cls, **kwargs):
@@ -689,6 +1658,7 @@ class BeeTextItem(BeeItemMixin, QtWidgets.QGraphicsTextItem):
     def enter_edit_mode(self):
         logger.debug(f'Entering edit mode on {self}')
         self.edit_mode = True
+        self.on_selection_handles_change()
         self.old_text = self.toPlainText()
         self.setTextInteractionFlags(
             Qt.TextInteractionFlag.TextEditorInteraction)
@@ -697,6 +1667,7 @@ class BeeTextItem(BeeItemMixin, QtWidgets.QGraphicsTextItem):
     def exit_edit_mode(self, commit=True):
         logger.debug(f'Exiting edit mode on {self}')
         self.edit_mode = False
+        self.on_selection_handles_change()
         # reset selection:
         self.setTextCursor(QtGui.QTextCursor(self.document()))
         self.setTextInteractionFlags(Qt.TextInteractionFlag.NoTextInteraction)
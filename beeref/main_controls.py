@@ -105,6 +105,7 @@ class MainControlsMixin:
         elif mimedata.hasImage():
             img = QtGui.QImage(mimedata.imageData())
             item = BeePixmapItem(img)
+            item.source_data = fileio.encoded_image_data(mimedata)
             pos = self.control_target.mapToScene(pos)
             self.control_target.undo_stack.push(
                 commands.InsertItems(self.control_target.scene, [item], pos))
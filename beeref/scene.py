@@ -13,19 +13,26 @@
 # You should have received a copy of the GNU General Public License
 # along with BeeRef.  If not, see <https://www.gnu.org/licenses/>.
 
+from contextlib import contextmanager
 from functools import partial
 import logging
 import math
-from queue import Queue
+from queue import Full, Queue
 
 from PyQt6 import QtCore, QtWidgets, QtGui
 from PyQt6.QtCore import Qt
 
 import rpack
 
-from beeref import commands
+from beeref import commands, utils
 from beeref.config import BeeSettings
-from beeref.items import item_registry, BeeErrorItem, sort_by_filename
+from beeref.fileio.lazy import LazyDecoder
+from beeref.items import (
+    item_registry,
+    BeeErrorItem,
+    BeePixmapItem,
+    sort_by_filename,
+)
 from beeref.selection import MultiSelectItem, RubberbandItem
 
 
@@ -38,6 +45,17 @@ class BeeGraphicsScene(QtWidgets.QGraphicsScene):
 
     MOVE_MODE = 1
     RUBBERBAND_MODE = 2
+    #: Time in milliseconds per event loop iteration for adding
+    #: queued items
+    ADD_ITEMS_BUDGET = 8
+    #: How many items may be waiting for the main thread
+    MAX_QUEUED_ITEMS = 20
+    #: Time in seconds after which a loading thread waiting for
+    #: room in the queue checks whether it has been canceled
+    QUEUE_CANCEL_CHECK = 0.05
+    #: Time in milliseconds without rubberband selection changes after
+    #: which the multi select outline gets updated
+    RUBBERBAND_OUTLINE_DELAY = 150
 
     def __init__(self, undo_stack):
         super().__init__()
@@ -46,9 +64,26 @@ class BeeGraphicsScene(QtWidgets.QGraphicsScene):
         self.max_z = 0
         self.min_z = 0
         self.Z_STEP = 0.001
+        self._batch_depth = 0
         self.selectionChanged.connect(self.on_selection_change)
         self.changed.connect(self.on_change)
-        self.items_to_add = Queue()
+        self.items_to_add = Queue(maxsize=self.MAX_QUEUED_ITEMS)
+        self.add_queued_timer = QtCore.QTimer(self)
+        self.add_queued_timer.setSingleShot(True)
+        self.add_queued_timer.setInterval(0)
+        self.add_queued_timer.timeout.connect(
+            partial(self.add_queued_items, budget=self.ADD_ITEMS_BUDGET))
+        self.rubberband_timer = QtCore.QTimer(self)
+        self.rubberband_timer.setSingleShot(True)
+        self.rubberband_timer.setInterval(self.get_frame_interval())
+        self.rubberband_timer.timeout.connect(self.on_rubberband_timer)
+        self.selection_outline_timer = QtCore.QTimer(self)
+        self.selection_outline_timer.setSingleShot(True)
+        self.selection_outline_timer.setInterval(
+            self.RUBBERBAND_OUTLINE_DELAY)
+        self.selection_outline_timer.timeout.connect(
+            self.update_selection_outline)
+        self.lazy_decoder = LazyDecoder()
         self.edit_item = None
         self.crop_item = None
         self.settings = BeeSettings()
@@ -57,19 +92,66 @@ class BeeGraphicsScene(QtWidgets.QGraphicsScene):
 
     def clear(self):
         self._clear_ongoing = True
+        if hasattr(self, 'lazy_decoder'):
+            self.lazy_decoder.clear()
         super().clear()
+        self.sampled_items = set()
+        # Bounding rects of the user items in scene coordinates, see
+        # ``itemsBoundingRect``:
+        self._item_rects = {}
+        self._items_rect = None
+        self._changed_items = set()
+        self.invalidate_selection()
+        # The item currently showing selection handles:
+        self._handles_item = None
         self.internal_clipboard = []
         self.rubberband_item = RubberbandItem()
+        # The rubberband area the current selection is based on:
+        self._rubberband_rect = None
+        self._rubberband_pending = False
         self.multi_select_item = MultiSelectItem()
         self._clear_ongoing = False
 
+    @contextmanager
+    def batch(self):
+        """Context manager for adding, removing or (de)selecting many
+        items at once.
+
+        The scene's signals are held back and the items skip their
+        own selection handling until the batch ends, so that the
+        selection is handled once instead of for every item. Batches
+        can be nested.
+        """
+
+        selection = set(self.get_user_selection())
+        was_blocked = self.blockSignals(True)
+        self._batch_depth += 1
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+            self.blockSignals(was_blocked)
+        if not was_blocked and set(self.get_user_selection()) != selection:
+            self.selectionChanged.emit()
+
+    def batch_ongoing(self):
+        """Whether changes are currently collected in a ``batch``."""
+
+        return self._batch_depth > 0
+
     def addItem(self, item):
         logger.debug(f'Adding item {item}')
         super().addItem(item)
+        self.on_item_geometry_change(item)
+        # Qt doesn't tell the item when it gets added already selected
+        self.on_item_selected_change(item, item.isSelected())
 
     def removeItem(self, item):
         logger.debug(f'Removing item {item}')
         super().removeItem(item)
+        self.on_item_geometry_change(item)
+        # Qt doesn't tell the item when it gets deselected by removal
+        self.on_item_selected_change(item, False)
 
     def cancel_active_modes(self):
         """Cancels ongoing crop modes, rubberband modes etc, if there are
@@ -79,10 +161,77 @@ class BeeGraphicsScene(QtWidgets.QGraphicsScene):
         self.end_rubberband_mode()
 
     def end_rubberband_mode(self):
+        if self._rubberband_pending:
+            self.update_rubberband_selection()
+        self.rubberband_timer.stop()
+        self._rubberband_rect = None
         if self.rubberband_item.scene():
             logger.debug('Ending rubberband selection')
             self.removeItem(self.rubberband_item)
         self.active_mode = None
+        if self.selection_outline_timer.isActive():
+            self.selection_outline_timer.stop()
+            self.update_selection_outline()
+
+    @staticmethod
+    def get_frame_interval():
+        """Returns the display's refresh interval in milliseconds."""
+
+        screen = QtGui.QGuiApplication.primaryScreen()
+        rate = screen.refreshRate() if screen else 0
+        return max(1, round(1000 / rate)) if rate > 0 else 16
+
+    def on_rubberband_timer(self):
+        if self._rubberband_pending:
+            self.update_rubberband_selection()
+            # Keep throttling as long as the mouse keeps moving:
+            self.rubberband_timer.start()
+
+    def update_rubberband_selection(self):
+        """Selects the user items touched by the rubberband and
+        deselects all others.
+
+        Only items in the area that changed since the last update are
+        looked at, and the scene's ``selectionChanged`` is emitted once
+        for the whole change.
+        """
+
+        self._rubberband_pending = False
+        rect = self.rubberband_item.rect()
+        path = QtGui.QPainterPath()
+        path.addRect(rect)
+        mode = Qt.ItemSelectionMode.IntersectsItemShape
+
+        if self._rubberband_rect is None:
+            candidates = set(self.items(rect, mode))
+            candidates.update(self.get_user_selection())
+        else:
+            old = self._rubberband_rect
+            candidates = set()
+            for delta in (utils.subtract_rect(rect, old)
+                          + utils.subtract_rect(old, rect)):
+                candidates.update(self.items(delta, mode))
+        self._rubberband_rect = rect
+
+        changes = []
+        for item in candidates:
+            if not (hasattr(item, 'save_id')
+                    and item.flags() & item.GraphicsItemFlag.ItemIsSelectable):
+                continue
+            selected = item.collidesWithPath(item.mapFromScene(path), mode)
+            if selected != item.isSelected():
+                changes.append((item, selected))
+
+        if not changes:
+            return
+        logger.trace(f'Rubberband changes selection of {len(changes)} items')
+        self.blockSignals(True)
+        try:
+            for item, selected in changes:
+                item.setSelected(selected)
+        finally:
+            self.blockSignals(False)
+        self.selectionChanged.emit()
 
     def cancel_crop_mode(self):
         """Cancels an ongoing crop mode, if there is any."""
@@ -325,10 +474,24 @@ class BeeGraphicsScene(QtWidgets.QGraphicsScene):
             if item.is_image:
                 item.enter_crop_mode()
 
-    def sample_color_at(self, position):
+    def sample_color_at(self, position, size=1):
+        """The colour of the item at the given position.
+
+        :param size: Average over a square of this many pixels
+        """
+
         item_at_pos = self.itemAt(position, self.views()[0].transform())
         if item_at_pos:
-            return item_at_pos.sample_color_at(position)
+            self.sampled_items.add(item_at_pos)
+            return item_at_pos.sample_color_at(position, size)
+
+    def release_sample_buffers(self):
+        """Free the memory used for sampling colours once we are done
+        sampling."""
+
+        for item in self.sampled_items:
+            item.release_sample_buffer()
+        self.sampled_items = set()
 
     def select_all_items(self):
         self.cancel_active_modes()
@@ -344,24 +507,29 @@ class BeeGraphicsScene(QtWidgets.QGraphicsScene):
     def has_selection(self):
         """Checks whether there are currently items selected."""
 
-        return bool(self.selectedItems(user_only=True))
+        return bool(self._get_user_selection())
 
     def has_single_selection(self):
         """Checks whether there's currently exactly one item selected."""
 
-        return len(self.selectedItems(user_only=True)) == 1
+        return len(self._get_user_selection()) == 1
 
     def has_multi_selection(self):
         """Checks whether there are currently more than one items selected."""
 
-        return len(self.selectedItems(user_only=True)) > 1
+        return len(self._get_user_selection()) > 1
 
     def has_single_image_selection(self):
         """Checks whether the current selection is a single image."""
 
-        if self.has_single_selection():
-            return self.selectedItems(user_only=True)[0].is_image
-        return False
+        return (self.has_single_selection()
+                and self._selected_images_count == 1)
+
+    def has_image_selection(self):
+        """Checks whether the current selection contains images."""
+
+        self._get_user_selection()
+        return self._selected_images_count > 0
 
     def mousePressEvent(self, event):
         if event.button() == Qt.MouseButton.RightButton:
@@ -416,7 +584,12 @@ class BeeGraphicsScene(QtWidgets.QGraphicsScene):
                 self.addItem(self.rubberband_item)
                 self.rubberband_item.bring_to_front()
             self.rubberband_item.fit(self.event_start, event.scenePos())
-            self.setSelectionArea(self.rubberband_item.shape())
+            if self.rubberband_timer.isActive():
+                # Coalesce mouse moves to one update per frame
+                self._rubberband_pending = True
+            else:
+                self.update_rubberband_selection()
+                self.rubberband_timer.start()
             self.views()[0].reset_previous_transform()
         super().mouseMoveEvent(event)
 
@@ -443,10 +616,48 @@ class BeeGraphicsScene(QtWidgets.QGraphicsScene):
         User items are items that have a ``save_id`` attribute.
         """
 
-        items = super().selectedItems()
         if user_only:
-            return list(filter(lambda i: hasattr(i, 'save_id'), items))
-        return items
+            return list(self.get_user_selection())
+        return super().selectedItems()
+
+    def get_user_selection(self):
+        """Returns the currently selected user items as a tuple."""
+
+        return tuple(self._get_user_selection())
+
+    def _get_user_selection(self):
+        """The selected user items as a dict (for a stable order).
+
+        The selection is only looked up once and then kept up to
+        date via ``on_item_selected_change``, so that selection
+        queries stay cheap while many items get (de)selected.
+        """
+
+        if self._user_selection is None:
+            self._user_selection = dict.fromkeys(
+                filter(lambda i: hasattr(i, 'save_id'),
+                       super().selectedItems()))
+            self._selected_images_count = sum(
+                1 for item in self._user_selection if item.is_image)
+        return self._user_selection
+
+    def on_item_selected_change(self, item, selected):
+        """Updates the cached selection when an item got (de)selected."""
+
+        if self._user_selection is None or not hasattr(item, 'save_id'):
+            return
+        if selected and item not in self._user_selection:
+            self._user_selection[item] = None
+            self._selected_images_count += item.is_image
+        elif not selected and item in self._user_selection:
+            del self._user_selection[item]
+            self._selected_images_count -= item.is_image
+
+    def invalidate_selection(self):
+        """Discards the cached selection, see ``_get_user_selection``."""
+
+        self._user_selection = None
+        self._selected_images_count = 0
 
     def items_by_type(self, itype):
         """Returns all items of the given type."""
@@ -467,42 +678,97 @@ class BeeGraphicsScene(QtWidgets.QGraphicsScene):
     def clear_save_ids(self):
         for item in self.items_for_save():
             item.save_id = None
+            item.saved_row = None
 
     def on_view_scale_change(self):
         for item in self.selectedItems():
             item.on_view_scale_change()
 
+    def on_item_geometry_change(self, item):
+        """Called by items when their extent in the scene might have
+        changed, and when they are added or removed."""
+
+        if hasattr(item, 'save_id'):
+            self._changed_items.add(item)
+
+    def update_item_rects(self):
+        """Update the cached bounding rects of the items that have
+        changed since the last call.
+
+        The bounding rect of all items is only extended as long as no
+        item shrinks or moves away from its edges, otherwise it will
+        be recalculated from the cached rects of the items.
+        """
+
+        for item in self._changed_items:
+            old = self._item_rects.pop(item, None)
+            if item.scene() is self:
+                new = self.item_rect_to_scene(item)
+                self._item_rects[item] = new
+            else:
+                new = None
+            if self._items_rect is None:
+                continue
+            left, top, right, bottom = self._items_rect
+            on_edge = old is not None and (
+                old.left() <= left or old.top() <= top
+                or old.right() >= right or old.bottom() >= bottom)
+            if on_edge:
+                # The item might have defined the edges
+                self._items_rect = None
+            elif new is not None:
+                self._items_rect = (min(left, new.left()),
+                                    min(top, new.top()),
+                                    max(right, new.right()),
+                                    max(bottom, new.bottom()))
+        self._changed_items = set()
+
+        if self._items_rect is None and self._item_rects:
+            logger.trace('Recalculating bounding rect of all items')
+            rects = self._item_rects.values()
+            self._items_rect = (min(r.left() for r in rects),
+                                min(r.top() for r in rects),
+                                max(r.right() for r in rects),
+                                max(r.bottom() for r in rects))
+
+    @staticmethod
+    def item_rect_to_scene(item):
+        return item.mapRectToScene(item.bounding_rect_unselected())
+
     def itemsBoundingRect(self, selection_only=False, items=None):
         """Returns the bounding rect of the scene's items; either all of them
         or only selected ones, or the items givin in ``items``.
 
         Re-implemented to not include the items's selection handles.
+        The bounding rects of the items in the scene are cached and
+        updated as the items change.
         """
 
-        def filter_user_items(ilist):
-            return list(filter(lambda i: hasattr(i, 'save_id'), ilist))
+        self.update_item_rects()
+
+        if not (selection_only or items):
+            if not self._item_rects:
+                return QtCore.QRectF(0, 0, 0, 0)
+            left, top, right, bottom = self._items_rect
+            return QtCore.QRectF(
+                QtCore.QPointF(left, top), QtCore.QPointF(right, bottom))
 
         if selection_only:
-            base = filter_user_items(self.selectedItems())
-        elif items:
-            base = items
+            base = [self._item_rects[item]
+                    for item in self.get_user_selection()
+                    if item in self._item_rects]
         else:
-            base = filter_user_items(self.items())
+            # Not cached, since these might not be in the scene (yet)
+            base = [self.item_rect_to_scene(item) for item in items]
 
         if not base:
             return QtCore.QRectF(0, 0, 0, 0)
 
-        x = []
-        y = []
-
-        for item in base:
-            for corner in item.corners_scene_coords:
-                x.append(corner.x())
-                y.append(corner.y())
-
         return QtCore.QRectF(
-            QtCore.QPointF(min(x), min(y)),
-            QtCore.QPointF(max(x), max(y)))
+            QtCore.QPointF(min(r.left() for r in base),
+                           min(r.top() for r in base)),
+            QtCore.QPointF(max(r.right() for r in base),
+                           max(r.bottom() for r in base)))
 
     def get_selection_center(self):
         rect = self.itemsBoundingRect(selection_only=True)
@@ -513,6 +779,34 @@ class BeeGraphicsScene(QtWidgets.QGraphicsScene):
             # Ignore events while clearing the scene since the
             # multiselect item will get cleared, too
             return
+        self.update_selection_handles()
+        if (self.active_mode == self.RUBBERBAND_MODE
+                and self.has_multi_selection()):
+            # Refitting the outline while rubberband selecting a
+            # lot of items is expensive; wait until the drag pauses
+            self.selection_outline_timer.start()
+            return
+        self.update_selection_outline()
+
+    def update_selection_handles(self):
+        """Notifies items whose selection handles appeared or
+        disappeared because the selection changed elsewhere."""
+
+        handles_item = None
+        if self.has_single_selection():
+            handles_item = self.get_user_selection()[0]
+        if handles_item is self._handles_item:
+            return
+        for item in (self._handles_item, handles_item):
+            if item is not None and item.scene() is self:
+                item.on_selection_handles_change()
+        self._handles_item = handles_item
+
+    def update_selection_outline(self):
+        """Fits the multi select outline to the current selection and
+        shows or hides it as needed."""
+
+        self.selection_outline_timer.stop()
         if self.has_multi_selection():
             self.multi_select_item.fit_selection_area(
                 self.itemsBoundingRect(selection_only=True))
@@ -532,33 +826,144 @@ class BeeGraphicsScene(QtWidgets.QGraphicsScene):
             self.multi_select_item.fit_selection_area(
                 self.itemsBoundingRect(selection_only=True))
 
-    def add_item_later(self, itemdata, selected=False):
+    def decode_later(self, item, factor=1):
+        """Decode a lazily loaded image in the background.
+
+        :param factor: Decode the preview downscaled by this factor
+            instead of the full image
+        """
+
+        self.lazy_decoder.decode_later(item, factor)
+
+    def decode_tile_later(self, item, key):
+        """Decode a tile of a tiled image in the background."""
+
+        self.lazy_decoder.decode_tile_later(item, key)
+
+    def convert_grayscale_later(self, item):
+        """Convert an item's image to grayscale in the background."""
+
+        self.lazy_decoder.convert_grayscale_later(item)
+
+    def create_previews_later(self, item):
+        """Create the previews of an item's image in the background."""
+
+        self.lazy_decoder.create_previews_later(item)
+
+    def decode_pending_items(self, rect, scale=1):
+        """Decode lazily loaded images within the given rect in the
+        background.
+
+        :param scale: The view's scale, to determine whether
+            downscaled previews are sufficient
+        """
+
+        for item in self.items(rect):
+            if getattr(item, 'pixmap_pending', False):
+                self.decode_later(
+                    item, item.get_lod_factor(scale * item.scale()))
+
+    def free_pixmap_memory(self, rect):
+        """Drop the decoded images that haven't been drawn for the
+        longest time until the memory used by decoded images is within
+        the budget. They will be decoded again once they are needed.
+
+        :param rect: Images within this rect are kept
+        """
+
+        budget = self.settings.valueOrDefault('Items/pixmap_memory_budget')
+        if not budget:
+            return
+        budget *= 1024 * 1024
+        items = [(item, item.pixmap_memory())
+                 for item in self.items_by_type(BeePixmapItem.TYPE)]
+        used = sum(memory for item, memory in items)
+        if used <= budget:
+            return
+
+        logger.debug(f'Decoded images exceed memory budget: {used}')
+        keep = set(self.items(rect))
+        items.sort(key=lambda x: x[0].last_painted)
+        for item, memory in items:
+            if used <= budget:
+                break
+            if memory and item not in keep and item.drop_pixmap():
+                # Tiled images keep some of their tiles:
+                used -= memory - item.pixmap_memory()
+        logger.debug(f'Memory used by decoded images: {used}')
+
+    def add_item_later(self, itemdata, selected=False, worker=None):
         """Keep an item for adding later via ``add_queued_items``
 
+        When called from a loading thread, this blocks while the queue
+        is full, so that we don't load faster than items can be added
+        to the scene. On the main thread, a full queue gets processed
+        right away instead.
+
         :param dict itemdata: Defines the item's data
         :param bool selected: Whether the item is initialised as selected
+        :param worker: The :class:`ThreadedIO` this is called from, if any
+        :return: ``False`` if the worker got canceled before the item
+            could be queued, else ``True``
         """
 
-        self.items_to_add.put((itemdata, selected))
-
-    def add_queued_items(self):
-        """Adds items added via ``add_item_later``"""
-
-        while not self.items_to_add.empty():
-            data, selected = self.items_to_add.get()
-            typ = data.pop('type')
-            cls = item_registry.get(typ)
-            if not cls:
-                # Just in case we add new item types in future versions
-                logger.warning(f'Encountered item of unknown type: {typ}')
-                cls = BeeErrorItem
-                data['data'] = {'text': f'Item of unknown type: {typ}'}
-            item = cls.create_from_data(**data)
-            # Set the values common to all item types:
-            item.update_from_data(**data)
-            self.addItem(item)
-            # Force recalculation of min/max z values:
-            item.setZValue(item.zValue())
-            if selected:
-                item.setSelected(True)
-                item.bring_to_front()
+        while True:
+            try:
+                self.items_to_add.put(
+                    (itemdata, selected),
+                    block=worker is not None,
+                    timeout=self.QUEUE_CANCEL_CHECK)
+                return True
+            except Full:
+                if worker is None:
+                    self.add_queued_items()
+                elif worker.canceled:
+                    return False
+
+    def add_queued_items(self, budget=None):
+        """Adds items added via ``add_item_later``
+
+        :param budget: Time in milliseconds after which to stop
+            adding items so that the UI stays responsive. The
+            remaining items will be added in the next iteration of the
+            event loop. If ``None``, all queued items are added at once.
+        """
+
+        self.add_queued_timer.stop()
+        timer = QtCore.QElapsedTimer()
+        timer.start()
+        with self.batch():
+            while not self.items_to_add.empty():
+                data, selected = self.items_to_add.get()
+                self.add_item_from_data(data, selected)
+                if (budget is not None
+                        and timer.elapsed() >= budget
+                        and not self.items_to_add.empty()):
+                    logger.trace('Out of time budget for adding items')
+                    self.add_queued_timer.start()
+                    break
+
+    def add_item_from_data(self, data, selected):
+        """Creates an item from data queued via ``add_item_later`` and
+        adds it to the scene.
+
+        :return: Whether the item has been selected
+        """
+
+        typ = data.pop('type')
+        cls = item_registry.get(typ)
+        if not cls:
+            # Just in case we add new item types in future versions
+            logger.warning(f'Encountered item of unknown type: {typ}')
+            cls = BeeErrorItem
+            data['data'] = {'text': f'Item of unknown type: {typ}'}
+        item = cls.create_from_data(**data)
+        # Set the values common to all item types:
+        item.update_from_data(**data)
+        self.addItem(item)
+        # Force recalculation of min/max z values:
+        item.setZValue(item.zValue())
+        if selected:
+            item.setSelected(True)
+            item.bring_to_front()
+        return selected
@@ -61,6 +61,17 @@ def with_anchor(func):
 
 class BaseItemMixin:
 
+    def prepareGeometryChange(self):
+        super().prepareGeometryChange()
+        self.notify_geometry_change()
+
+    def notify_geometry_change(self):
+        """Let the scene know that the item's extent in the scene might
+        have changed."""
+
+        if self.scene():
+            self.scene().on_item_geometry_change(self)
+
     @with_anchor
     def setScale(self, value):
         if value <= 0:
@@ -130,9 +141,14 @@ class BaseItemMixin:
         if self.scene():
             self.scene().cursor_cleared.emit()
 
-    def sample_color_at(self, pos):
+    def sample_color_at(self, pos, size=1):
         return None
 
+    def release_sample_buffer(self):
+        """Free the memory used for sampling colours."""
+
+        pass
+
 
 class SelectableMixin(BaseItemMixin):
     """Common code for selectable items: Selection outline, handles etc."""
@@ -151,25 +167,70 @@ class SelectableMixin(BaseItemMixin):
         self.setAcceptHoverEvents(True)
         self.setFlags(
             QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsMovable
-            | QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsSelectable)
+            | QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsSelectable
+            | QtWidgets.QGraphicsItem.GraphicsItemFlag
+            .ItemSendsGeometryChanges)
 
         self.viewport_scale = 1
         self.active_mode = None
         self.is_editable = False
+        self._view_scale = None
+        self._geometry_key = None
+        self._geometry = {}
+        self.transform_group = None
+
+    def get_view_scale(self):
+        """The scale factor of the view. Only looked up again after
+        the view's scale has changed, see ``on_view_scale_change``."""
+
+        if self.scene() and self.scene().views():
+            if getattr(self, '_view_scale', None) is None:
+                self._view_scale = self.scene().views()[0].get_scale()
+        # It can happen that the item is already removed from
+        # the scene but its boundingRect is still needed. Keep the
+        # last known scaling factor for that case
+        return getattr(self, '_view_scale', None) or 1
 
     def fixed_length_for_viewport(self, value):
         """The interactable areas need to stay the same size on the
         screen so we need to adjust the values according to the scale
         factor sof the view and the item."""
 
-        if self.scene():
-            scale = self.scene().views()[0].get_scale()
-            self._view_scale = scale
+        return value / self.get_view_scale() / self.scale()
 
-        # It can happen that the item is already removed from
-        # the scene but its boundingRect is still needed. Keep the
-        # last known scaling factor for that case
-        return value / getattr(self, '_view_scale', 1) / self.scale()
+    def cached_geometry(self, name, func, *args):
+        """The result of ``func(*args)``, cached until the view scale,
+        the item's scale, size or selected state changes.
+
+        The shapes of the selection handles are needed on every hover
+        and paint event, so we don't want to rebuild them every time.
+        Only the item's own state goes into the cache key; changes
+        that depend on the rest of the selection are reported by the
+        scene via ``on_selection_handles_change``.
+        """
+
+        key = (self.get_view_scale(),
+               self.scale(),
+               self.bounding_rect_unselected(),
+               self.isSelected())
+        if key != getattr(self, '_geometry_key', None):
+            self._geometry_key = key
+            self._geometry = {}
+        if (name, args) not in self._geometry:
+            self._geometry[(name, args)] = func(*args)
+        return self._geometry[(name, args)]
+
+    def clear_geometry_cache(self):
+        self._view_scale = None
+        self._geometry_key = None
+        self._geometry = {}
+
+    def on_selection_handles_change(self):
+        """Called when the selection handles appear or disappear
+        without the item's own selected state changing."""
+
+        self.clear_geometry_cache()
+        self.update()
 
     @property
     def select_resize_size(self):
@@ -184,6 +245,10 @@ class SelectableMixin(BaseItemMixin):
          even if it is covered by selection scale/flip/... handles.
          This ensures that small items can always still be moved/edited.
         """
+        return self.cached_geometry(
+            'free_center', self._select_handle_free_center)
+
+    def _select_handle_free_center(self):
         size = self.fixed_length_for_viewport(self.SELECT_FREE_CENTER)
         return QtCore.QRectF(
             self.center.x() - size/2,
@@ -240,10 +305,14 @@ class SelectableMixin(BaseItemMixin):
     @property
     def corners(self):
         """The corners of the item. Used for scale and rotate handles."""
-        return (self.bounding_rect_unselected().topLeft(),
-                self.bounding_rect_unselected().topRight(),
-                self.bounding_rect_unselected().bottomRight(),
-                self.bounding_rect_unselected().bottomLeft())
+        return self.cached_geometry('corners', self._corners)
+
+    def _corners(self):
+        rect = self.bounding_rect_unselected()
+        return (rect.topLeft(),
+                rect.topRight(),
+                rect.bottomRight(),
+                rect.bottomLeft())
 
     @property
     def corners_scene_coords(self):
@@ -254,6 +323,12 @@ class SelectableMixin(BaseItemMixin):
     def get_scale_bounds(self, corner, margin=0):
         """The interactable shape of the scale handles. The scale handles sit
         centered around the visible handle."""
+        return self.cached_geometry(
+            'scale_bounds', self._get_scale_bounds,
+            (corner.x(), corner.y()), margin)
+
+    def _get_scale_bounds(self, corner, margin):
+        corner = QtCore.QPointF(*corner)
         path = QtGui.QPainterPath()
         path.addRect(QtCore.QRectF(
             corner.x() - self.select_resize_size/2 - margin,
@@ -273,6 +348,12 @@ class SelectableMixin(BaseItemMixin):
          └───┘
         """
 
+        return self.cached_geometry(
+            'rotate_bounds', self._get_rotate_bounds,
+            (corner.x(), corner.y()))
+
+    def _get_rotate_bounds(self, corner):
+        corner = QtCore.QPointF(*corner)
         path = QtGui.QPainterPath()
 
         # The whole square containing the rotate area:
@@ -300,6 +381,9 @@ class SelectableMixin(BaseItemMixin):
           └───┘
         """
 
+        return self.cached_geometry('flip_bounds', self._get_flip_bounds)
+
+    def _get_flip_bounds(self):
         outer_margin = self.select_resize_size / 2
         inner_margin = self.select_resize_size / 2
         origin = self.bounding_rect_unselected().topLeft()
@@ -346,12 +430,19 @@ class SelectableMixin(BaseItemMixin):
         if not self.has_selection_outline():
             return self.bounding_rect_unselected()
 
+        return QtCore.QRectF(
+            self.cached_geometry('bounding_rect', self._bounding_rect))
+
+    def _bounding_rect(self):
         # Add extra space for the interactive areas
         margin = self.select_resize_size / 2 + self.select_rotate_size
         return self.bounding_rect_unselected().marginsAdded(
             QtCore.QMarginsF(margin, margin, margin, margin))
 
     def shape(self):
+        return self.cached_geometry('shape', self._shape)
+
+    def _shape(self):
         path = QtGui.QPainterPath()
         if self.has_selection_handles():
             margin = self.select_resize_size / 2
@@ -428,6 +519,7 @@ class SelectableMixin(BaseItemMixin):
                         self.get_scale_anchor(corner))
                     for item in self.selection_action_items():
                         item.scale_orig_factor = item.scale()
+                    self.begin_group_transform()
                     event.accept()
                     return
                 # Check if we are in one of the corner's rotate areas
@@ -439,6 +531,7 @@ class SelectableMixin(BaseItemMixin):
                         event.scenePos())
                     for item in self.selection_action_items():
                         item.rotate_orig_degrees = item.rotation()
+                    self.begin_group_transform()
                     event.accept()
                     return
                 # Check if we are in one of the flip edges:
@@ -543,13 +636,46 @@ class SelectableMixin(BaseItemMixin):
         else:
             return edge['flip_v']
 
+    def begin_group_transform(self):
+        """Moves the other items affected by the current scale or rotate
+        action into a ``TransformGroupItem``, so that mouse moves only
+        need to update a single transform."""
+
+        items = [item for item in self.selection_action_items()
+                 if item is not self]
+        if len(items) < 2:
+            return
+        self.transform_group = TransformGroupItem(items)
+        self.scene().addItem(self.transform_group)
+        self.transform_group.group()
+
+    def end_group_transform(self):
+        """Moves the grouped items back into the scene, applying the
+        group's transform to each of them."""
+
+        if self.transform_group:
+            self.transform_group.ungroup()
+            self.scene().removeItem(self.transform_group)
+            self.transform_group = None
+
+    def individual_action_items(self):
+        """The items affected by the current scale or rotate action that
+        need to be transformed one by one, i.e. aren't grouped."""
+
+        if self.transform_group:
+            return [item for item in self.selection_action_items()
+                    if item.parentItem() is not self.transform_group]
+        return self.selection_action_items()
+
     def mouseMoveEvent(self, event):
         if (event.scenePos() - self.event_start).manhattanLength() > 5:
             self.scene().views()[0].reset_previous_transform()
 
         if self.active_mode == self.SCALE_MODE:
             factor = self.get_scale_factor(event)
-            for item in self.selection_action_items():
+            if self.transform_group and factor > 0:
+                self.transform_group.scale_around(factor, self.event_anchor)
+            for item in self.individual_action_items():
                 item.setScale(item.scale_orig_factor * factor,
                               item.mapFromScene(self.event_anchor))
             event.accept()
@@ -558,7 +684,9 @@ class SelectableMixin(BaseItemMixin):
             snap = (event.modifiers() == Qt.KeyboardModifier.ControlModifier
                     or event.modifiers() == Qt.KeyboardModifier.ShiftModifier)
             delta = self.get_rotate_delta(event.scenePos(), snap)
-            for item in self.selection_action_items():
+            if self.transform_group:
+                self.transform_group.rotate_around(delta, self.event_anchor)
+            for item in self.individual_action_items():
                 item.setRotation(
                     item.rotate_orig_degrees + delta * item.flip(),
                     item.mapFromScene(self.event_anchor))
@@ -574,6 +702,7 @@ class SelectableMixin(BaseItemMixin):
         super().mouseMoveEvent(event)
 
     def mouseReleaseEvent(self, event):
+        self.end_group_transform()
         if self.active_mode == self.SCALE_MODE:
             if self.get_scale_factor(event) != 1:
                 self.scene().undo_stack.push(
@@ -611,12 +740,29 @@ class SelectableMixin(BaseItemMixin):
 
     def on_view_scale_change(self):
         self.prepareGeometryChange()
+        self.clear_geometry_cache()
+
+    GEOMETRY_CHANGES = (
+        QGraphicsItem.GraphicsItemChange.ItemPositionHasChanged,
+        QGraphicsItem.GraphicsItemChange.ItemTransformHasChanged,
+        QGraphicsItem.GraphicsItemChange.ItemRotationHasChanged,
+        QGraphicsItem.GraphicsItemChange.ItemScaleHasChanged,
+    )
 
     def itemChange(self, change, value):
         if change == QGraphicsItem.GraphicsItemChange.ItemSelectedChange:
             self.prepareGeometryChange()
-            if hasattr(self, 'on_selected_change'):
+            # The view's scale might have changed while not selected:
+            self.clear_geometry_cache()
+            if (hasattr(self, 'on_selected_change')
+                    and not (self.scene() and self.scene().batch_ongoing())):
                 self.on_selected_change(value)
+            if self.scene():
+                # Qt emits the scene's selectionChanged before
+                # ItemSelectedHasChanged, so update the selection now:
+                self.scene().on_item_selected_change(self, bool(value))
+        if change in self.GEOMETRY_CHANGES:
+            self.notify_geometry_change()
         return super().itemChange(change, value)
 
 
@@ -686,6 +832,68 @@ class MultiSelectItem(SelectableMixin,
         super().mousePressEvent(event)
 
 
+class TransformGroupItem(QtWidgets.QGraphicsRectItem):
+    """Temporary parent for the items of an interactive scale or
+    rotate action on a multi selection.
+
+    While grouped, the items are transformed as a whole via the
+    group's transform. Their own position, scale and rotation are only
+    updated once when ungrouping.
+    """
+
+    def __init__(self, items):
+        super().__init__()
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemHasNoContents)
+        self.items = items
+        self.factor = 1
+        self.delta = 0
+
+    def __str__(self):
+        return f'TransformGroupItem ({len(self.items)} items)'
+
+    def group(self):
+        # Keep the grouped items above the rest while transforming
+        self.setZValue(max(item.zValue() for item in self.items))
+        for item in self.items:
+            # The group sits at the scene's origin without a transform,
+            # so the items' positions stay the same
+            item.setParentItem(self)
+        logger.debug(f'Grouped {self}')
+
+    def scale_around(self, factor, anchor):
+        """Scales the group by ``factor`` around ``anchor`` (in scene
+        coordinates), relative to the items' original scale."""
+
+        self.factor = factor
+        self.setTransform(QtGui.QTransform()
+                          .translate(anchor.x(), anchor.y())
+                          .scale(factor, factor)
+                          .translate(-anchor.x(), -anchor.y()))
+
+    def rotate_around(self, delta, anchor):
+        """Rotates the group by ``delta`` degrees around ``anchor`` (in
+        scene coordinates), relative to the items' original rotation."""
+
+        self.delta = delta
+        self.setTransform(QtGui.QTransform()
+                          .translate(anchor.x(), anchor.y())
+                          .rotate(delta)
+                          .translate(-anchor.x(), -anchor.y()))
+
+    def ungroup(self):
+        transform = self.transform()
+        for item in self.items:
+            pos = transform.map(item.pos())
+            item.setParentItem(None)
+            if self.factor != 1:
+                item.setScale(item.scale() * self.factor)
+            if self.delta:
+                item.setRotation(item.rotation() + self.delta * item.flip())
+            item.setPos(pos)
+        self.setTransform(QtGui.QTransform())
+        logger.debug(f'Ungrouped {self}')
+
+
 class RubberbandItem(BaseItemMixin, QtWidgets.QGraphicsRectItem):
     """The outline for the rubber band selection."""
 
@@ -13,7 +13,8 @@
 # You should have received a copy of the GNU General Public License
 # along with BeeRef.  If not, see <https://www.gnu.org/licenses/>.
 
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 import re
 
 from PyQt6 import QtCore, QtGui
@@ -62,6 +63,29 @@ def get_rect_from_points(point1, point2):
     return QtCore.QRectF(topleft, bottomright)
 
 
+def subtract_rect(rect1, rect2):
+    """Returns a list of QRectF covering the area of ``rect1`` that isn't
+    covered by ``rect2``."""
+
+    if not rect1.intersects(rect2):
+        return [rect1] if not rect1.isEmpty() else []
+
+    inner = rect1.intersected(rect2)
+    candidates = [
+        # Full width stripes above and below the intersection:
+        QtCore.QRectF(QtCore.QPointF(rect1.left(), rect1.top()),
+                      QtCore.QPointF(rect1.right(), inner.top())),
+        QtCore.QRectF(QtCore.QPointF(rect1.left(), inner.bottom()),
+                      QtCore.QPointF(rect1.right(), rect1.bottom())),
+        # Stripes left and right of the intersection:
+        QtCore.QRectF(QtCore.QPointF(rect1.left(), inner.top()),
+                      QtCore.QPointF(inner.left(), inner.bottom())),
+        QtCore.QRectF(QtCore.QPointF(inner.right(), inner.top()),
+                      QtCore.QPointF(rect1.right(), inner.bottom())),
+    ]
+    return [rect for rect in candidates if not rect.isEmpty()]
+
+
 def round_to(number, base):
     """Rounds to the given base.
 
@@ -81,6 +105,120 @@ def get_file_extension_from_format(formatstr):
     return ext.removeprefix('*.')
 
 
+def image_to_bytes(img, imgformat, quality=90):
+    """Encodes the QImage in the given format (e.g. 'png' or 'jpg')
+    and returns the bytestring."""
+
+    barray = QtCore.QByteArray()
+    buffer = QtCore.QBuffer(barray)
+    buffer.open(QtCore.QIODevice.OpenModeFlag.WriteOnly)
+    img.save(buffer, imgformat.upper(), quality=quality)
+    return barray.data()
+
+
+def image_reader(data):
+    """Returns a ``QImageReader`` for the encoded image data."""
+
+    buffer = QtCore.QBuffer()
+    buffer.setData(data)
+    buffer.open(QtCore.QIODevice.OpenModeFlag.ReadOnly)
+    reader = QtGui.QImageReader(buffer)
+    # The reader doesn't take ownership of its device:
+    reader.buffer = buffer
+    return reader
+
+
+def image_format(data):
+    """Returns the format of the encoded image data as a string as
+    reported by Qt (e.g. 'png' or 'jpeg'), or an empty string if the
+    format can't be determined."""
+
+    return image_reader(data).format().data().decode()
+
+
+def to_grayscale(img):
+    """Returns a grayscale version of the given image which keeps its
+    transparency. Safe to call outside of the main thread."""
+
+    gray = img.convertToFormat(QtGui.QImage.Format.Format_Grayscale8)
+    if not img.hasAlphaChannel():
+        return gray
+    # The grayscale format drops the alpha channel, so we mask the
+    # converted image with the original's alpha values:
+    result = gray.convertToFormat(
+        QtGui.QImage.Format.Format_ARGB32_Premultiplied)
+    painter = QtGui.QPainter(result)
+    painter.setCompositionMode(
+        QtGui.QPainter.CompositionMode.CompositionMode_DestinationIn)
+    painter.drawImage(0, 0, img)
+    painter.end()
+    return result
+
+
+def sample_image(img, x, y, size=1):
+    """Returns the colour of the given image at the given pixel, or
+    ``None`` if it is transparent or outside of the image.
+
+    :param size: Average the colour over a square of this many pixels
+        around the given pixel
+    """
+
+    rect = QtCore.QRect(x - size // 2, y - size // 2, size, size)
+    rect = rect.intersected(img.rect())
+    if rect.isEmpty():
+        return
+    if size == 1:
+        color = img.pixelColor(x, y)
+    else:
+        red = green = blue = alpha = 0
+        for i in range(rect.left(), rect.right() + 1):
+            for j in range(rect.top(), rect.bottom() + 1):
+                pixel = img.pixel(i, j)
+                a = QtGui.qAlpha(pixel)
+                red += QtGui.qRed(pixel) * a
+                green += QtGui.qGreen(pixel) * a
+                blue += QtGui.qBlue(pixel) * a
+                alpha += a
+        if not alpha:
+            return
+        count = rect.width() * rect.height()
+        color = QtGui.QColor(round(red / alpha),
+                             round(green / alpha),
+                             round(blue / alpha),
+                             round(alpha / count))
+    if color.alpha():
+        return color
+
+
+def parallel_map(func, iterable, max_workers=None):
+    """Like ``map``, but calls ``func`` in a thread pool. Results are
+    yielded in order.
+
+    Only a limited number of calls is in flight at any time, so that
+    results don't pile up in memory when the consumer is slower than
+    the thread pool. Closing the generator cancels calls that haven't
+    started yet.
+    """
+
+    max_workers = max_workers or QtCore.QThread.idealThreadCount()
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    args = iter(iterable)
+    pending = deque()
+    try:
+        for arg in args:
+            pending.append(executor.submit(func, arg))
+            if len(pending) >= 2 * max_workers:
+                break
+        while pending:
+            result = pending.popleft().result()
+            for arg in args:
+                pending.append(executor.submit(func, arg))
+                break
+            yield result
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
 def qcolor_to_hex(color):
     """Returns the QColor as a hex represenation string:
     #RRGGBBAA if the color has transparencey, otherwise #RRGGBB.
@@ -70,6 +70,19 @@ class BeeGraphicsView(MainControlsMixin,
         self.previous_transform = None
         self.active_mode = None
 
+        # Coalesces decoding of lazily loaded images while panning/zooming
+        self.decode_timer = QtCore.QTimer(self)
+        self.decode_timer.setSingleShot(True)
+        self.decode_timer.setInterval(50)
+        self.decode_timer.timeout.connect(self.decode_visible_items)
+
+        # Periodically saves unsaved changes in the background
+        self.autosave_worker = None
+        self.recovery_lock = None
+        self.autosave_timer = QtCore.QTimer(self)
+        self.autosave_timer.timeout.connect(self.on_autosave_timer)
+        self.autosave_timer.start(self.get_autosave_interval())
+
         self.scene = BeeGraphicsScene(self.undo_stack)
         self.scene.changed.connect(self.on_scene_changed)
         self.scene.selectionChanged.connect(self.on_selection_changed)
@@ -116,6 +129,7 @@ class BeeGraphicsView(MainControlsMixin,
         if hasattr(self, 'sample_color_widget'):
             self.sample_color_widget.hide()
             del self.sample_color_widget
+        self.scene.release_sample_buffers()
         if self.scene.has_multi_selection():
             self.scene.multi_select_item.bring_to_front()
 
@@ -171,6 +185,7 @@ class BeeGraphicsView(MainControlsMixin,
     def clear_scene(self):
         logging.debug('Clearing scene...')
         self.cancel_active_modes()
+        self.wait_for_autosave()
         self.scene.clear()
         self.undo_stack.clear()
         self.filename = None
@@ -203,6 +218,7 @@ class BeeGraphicsView(MainControlsMixin,
         # It seems to be more reliable when we fit a second time
         # Sometimes a changing scene rect can mess up the fitting
         self.fitInView(rect, Qt.AspectRatioMode.KeepAspectRatio)
+        self.decode_timer.start()
         logger.trace('Fit view done')
 
     def get_confirmation_unsaved_changes(self, msg):
@@ -224,6 +240,7 @@ class BeeGraphicsView(MainControlsMixin,
             'Are you sure you want to open a new scene?')
         if confirm:
             self.clear_scene()
+            self.discard_recovery_file()
 
     def on_action_fit_scene(self):
         self.fit_rect(self.scene.itemsBoundingRect())
@@ -381,7 +398,9 @@ class BeeGraphicsView(MainControlsMixin,
             self.scene.selectedItems(user_only=True)))
 
     def on_action_show_color_gamut(self):
-        widgets.color_gamut.GamutDialog(self, self.scene.selectedItems()[0])
+        items = [item for item in self.scene.selectedItems(user_only=True)
+                 if item.is_image]
+        widgets.color_gamut.GamutDialog(self, items)
 
     def on_action_sample_color(self):
         self.cancel_active_modes()
@@ -398,11 +417,17 @@ class BeeGraphicsView(MainControlsMixin,
         self.sample_color_widget = widgets.SampleColorWidget(
             self,
             pos,
-            self.scene.sample_color_at(self.mapToScene(pos)))
+            self.sample_color_at(pos))
+
+    def sample_color_at(self, pos):
+        """The colour at the given position in view coordinates."""
+
+        size = self.settings.valueOrDefault('Items/color_sample_size')
+        return self.scene.sample_color_at(self.mapToScene(pos), size)
 
     def on_items_loaded(self, value):
         logger.debug('On items loaded: add queued items')
-        self.scene.add_queued_items()
+        self.scene.add_queued_items(budget=self.scene.ADD_ITEMS_BUDGET)
 
     def on_loading_finished(self, filename, errors):
         if errors:
@@ -412,7 +437,12 @@ class BeeGraphicsView(MainControlsMixin,
                 ('<p>Problem loading file %s</p>'
                  '<p>Not accessible or not a proper bee file</p>') % filename)
         else:
-            self.filename = filename
+            if filename == self.recovery_filename:
+                # The recovered changes haven't been saved by the user yet
+                self.undo_stack.resetClean()
+            else:
+                self.discard_recovery_file()
+                self.filename = filename
             self.scene.add_queued_items()
             self.on_action_fit_scene()
 
@@ -423,11 +453,11 @@ class BeeGraphicsView(MainControlsMixin,
         if confirm:
             self.open_from_file(filename)
 
-    def open_from_file(self, filename):
+    def open_from_file(self, filename, lazy=True):
         logger.info(f'Opening file {filename}')
         self.clear_scene()
         self.worker = fileio.ThreadedIO(
-            fileio.load_bee, filename, self.scene)
+            fileio.load_bee, filename, self.scene, lazy=lazy)
         self.worker.progress.connect(self.on_items_loaded)
         self.worker.finished.connect(self.on_loading_finished)
         self.progress = widgets.BeeProgressDialog(
@@ -454,6 +484,7 @@ class BeeGraphicsView(MainControlsMixin,
             self.filename = filename
 
     def on_saving_finished(self, filename, errors):
+        self.save_snapshot.apply()
         if errors:
             QtWidgets.QMessageBox.warning(
                 self,
@@ -463,12 +494,18 @@ class BeeGraphicsView(MainControlsMixin,
         else:
             self.filename = filename
             self.undo_stack.setClean()
+            self.discard_recovery_file()
 
     def do_save(self, filename, create_new):
         if not fileio.is_bee_file(filename):
             filename = f'{filename}.bee'
+        self.wait_for_autosave()
+        self.save_snapshot = fileio.SceneSnapshot(self.scene)
         self.worker = fileio.ThreadedIO(
-            fileio.save_bee, filename, self.scene, create_new=create_new)
+            fileio.save_bee,
+            filename,
+            self.save_snapshot,
+            create_new=create_new)
         self.worker.finished.connect(self.on_saving_finished)
         self.progress = widgets.BeeProgressDialog(
             f'Saving {filename}',
@@ -494,6 +531,150 @@ class BeeGraphicsView(MainControlsMixin,
         else:
             self.do_save(self.filename, create_new=False)
 
+    def get_autosave_interval(self):
+        """The autosave timer interval in milliseconds. If autosaving
+        is disabled, we still check every minute whether it has been
+        enabled in the meantime."""
+
+        minutes = self.settings.valueOrDefault('Save/autosave_interval')
+        return max(minutes, 1) * 60 * 1000
+
+    @property
+    def recovery_filename(self):
+        dirname = os.path.dirname(self.settings.fileName())
+        return os.path.join(dirname, 'recovery.bee')
+
+    def acquire_recovery_file(self):
+        """Make sure only one BeeRef instance at a time uses the recovery
+        file.
+
+        :return: Whether this instance may use the recovery file
+        """
+
+        if self.recovery_lock is None:
+            lock = QtCore.QLockFile(f'{self.recovery_filename}.lock')
+            # Only treat the lock as stale when its process is gone:
+            lock.setStaleLockTime(0)
+            if not lock.tryLock(0):
+                logger.debug('Recovery file is used by another instance')
+                return False
+            self.recovery_lock = lock
+        return True
+
+    def discard_recovery_file(self):
+        if self.recovery_lock:
+            self.wait_for_autosave()
+            logger.debug('Removing recovery file')
+            fileio.remove_bee_file(self.recovery_filename)
+
+    def offer_recovery(self):
+        """Offer to restore the autosaved changes of a previous session
+        that didn't end properly."""
+
+        if not os.path.exists(self.recovery_filename):
+            return
+        if commandline_args.filenames or self.io_in_progress():
+            # Don't mix the recovered scene with files that are being
+            # opened; the recovery is offered again on the next start
+            logger.debug('Files are being opened, not offering recovery')
+            return
+        if not self.acquire_recovery_file():
+            return
+
+        answer = QtWidgets.QMessageBox.question(
+            self,
+            'Recover unsaved changes?',
+            (f'{constants.APPNAME} wasn\'t closed properly. Do you want to '
+             'recover the unsaved changes of the last session?'))
+        if answer == QtWidgets.QMessageBox.StandardButton.Yes:
+            # Don't load lazily so that the scene doesn't depend on
+            # the recovery file anymore once it's discarded
+            self.open_from_file(self.recovery_filename, lazy=False)
+        else:
+            self.discard_recovery_file()
+
+    def on_autosave_timer(self):
+        self.autosave_timer.setInterval(self.get_autosave_interval())
+        if (self.settings.valueOrDefault('Save/autosave_interval')
+                and not self.undo_stack.isClean()):
+            self.do_autosave()
+
+    def io_in_progress(self):
+        """Whether files are currently being loaded or saved."""
+
+        worker = getattr(self, 'worker', None)
+        return bool((worker and worker.isRunning())
+                    or (self.autosave_worker
+                        and self.autosave_worker.isRunning())
+                    or not self.scene.items_to_add.empty())
+
+    def do_autosave(self):
+        if self.io_in_progress():
+            logger.debug('Autosave: Loading/saving in progress, skipping')
+            return
+
+        if self.filename:
+            filename = self.filename
+        elif self.acquire_recovery_file():
+            filename = self.recovery_filename
+        else:
+            return
+
+        logger.debug(f'Autosaving to {filename}')
+        self.autosave_index = self.undo_stack.index()
+        self.autosave_snapshot = fileio.SceneSnapshot(self.scene)
+        self.autosave_worker = fileio.ThreadedIO(
+            fileio.save_bee,
+            filename,
+            self.autosave_snapshot,
+            create_new=not os.path.exists(filename),
+            wal=True,
+            # The recovery file gets removed again:
+            keep_source_data=filename == self.recovery_filename)
+        self.autosave_worker.finished.connect(self.on_autosave_finished)
+        self.autosave_worker.start()
+
+    def on_autosave_finished(self, filename, errors):
+        self.autosave_snapshot.apply()
+        if errors:
+            logger.warning(f'Autosaving to {filename} failed: {errors}')
+        elif (filename == self.filename
+              and self.undo_stack.index() == self.autosave_index):
+            # Only if nothing has changed while we were saving
+            self.undo_stack.setClean()
+
+    def wait_for_autosave(self):
+        """Let a running autosave finish before the scene or the file
+        gets changed. Keeps the GUI responsive and shows a progress
+        dialog if that takes a while."""
+
+        if not self.autosave_worker:
+            return
+        worker = self.autosave_worker
+        if worker.isRunning():
+            logger.debug('Waiting for autosave to finish')
+            loop = QtCore.QEventLoop()
+            # ThreadedIO's finished signal hides the one of QThread,
+            # which is only emitted once the thread has ended:
+            QtCore.QThread.finished.__get__(worker).connect(loop.quit)
+            progress = QtWidgets.QProgressDialog(
+                'Finishing autosave...', None, 0, 0, self)
+            progress.setWindowModality(Qt.WindowModality.WindowModal)
+            progress.setMinimumDuration(500)
+            if not worker.isFinished():
+                loop.exec()
+            progress.close()
+            progress.deleteLater()
+        # Don't wait for the finished signal, later saves need
+        # to know what has been saved already:
+        self.autosave_snapshot.apply()
+
+    def on_close(self):
+        """Clean up when BeeRef is closed deliberately."""
+
+        self.autosave_timer.stop()
+        self.discard_recovery_file()
+
     def on_action_export_scene(self):
         directory = os.path.dirname(self.filename) if self.filename else None
         filename, formatstr = QtWidgets.QFileDialog.getSaveFileName(
@@ -573,6 +754,7 @@ class BeeGraphicsView(MainControlsMixin,
             'There are unsaved changes. Are you sure you want to quit?')
         if confirm:
             logger.info('User quit. Exiting...')
+            self.on_close()
             self.app.quit()
 
     def on_action_settings(self):
@@ -621,6 +803,7 @@ class BeeGraphicsView(MainControlsMixin,
         self.undo_stack.endMacro()
         if new_scene:
             self.on_action_fit_scene()
+        self.decode_timer.start()
 
     def do_insert_images(self, filenames, pos=None):
         if not pos:
@@ -696,6 +879,8 @@ class BeeGraphicsView(MainControlsMixin,
         img = clipboard.image()
         if not img.isNull():
             item = BeePixmapItem(img)
+            item.source_data = fileio.encoded_image_data(
+                clipboard.mimeData())
             self.undo_stack.push(commands.InsertItems(self.scene, [item], pos))
             if len(self.scene.items()) == 1:
                 # This is the first image in the scene
@@ -724,6 +909,8 @@ class BeeGraphicsView(MainControlsMixin,
                                      self.scene.has_selection())
         self.actiongroup_set_enabled('active_when_single_image',
                                      self.scene.has_single_image_selection())
+        self.actiongroup_set_enabled('active_when_image_selection',
+                                     self.scene.has_image_selection())
 
         if self.scene.has_selection():
             item = self.scene.selectedItems(user_only=True)[0]
@@ -749,13 +936,12 @@ class BeeGraphicsView(MainControlsMixin,
             return
         logger.trace('Recalculating scene rectangle...')
         try:
-            topleft = self.mapFromScene(
-                self.scene.itemsBoundingRect().topLeft())
+            rect = self.scene.itemsBoundingRect()
+            topleft = self.mapFromScene(rect.topLeft())
             topleft = self.mapToScene(QtCore.QPoint(
                 topleft.x() - self.size().width(),
                 topleft.y() - self.size().height()))
-            bottomright = self.mapFromScene(
-                self.scene.itemsBoundingRect().bottomRight())
+            bottomright = self.mapFromScene(rect.bottomRight())
             bottomright = self.mapToScene(QtCore.QPoint(
                 bottomright.x() + self.size().width(),
                 bottomright.y() + self.size().height()))
@@ -776,17 +962,35 @@ class BeeGraphicsView(MainControlsMixin,
             arguments and turns it into a number, for ex. ``min`` or ``max``.
         """
 
-        topleft = self.mapFromScene(
-            self.scene.itemsBoundingRect().topLeft())
-        bottomright = self.mapFromScene(
-            self.scene.itemsBoundingRect().bottomRight())
+        rect = self.scene.itemsBoundingRect()
+        topleft = self.mapFromScene(rect.topLeft())
+        bottomright = self.mapFromScene(rect.bottomRight())
         return func(bottomright.x() - topleft.x(),
                     bottomright.y() - topleft.y())
 
+    def decode_visible_items(self):
+        """Decode lazily loaded images that are visible or about to
+        become visible, and free the memory of images that are far
+        away if needed."""
+
+        rect = self.mapToScene(self.viewport().rect()).boundingRect()
+        # Also decode items just outside the viewport so that they
+        # are ready when the user pans towards them:
+        margin = max(rect.width(), rect.height()) / 2
+        rect = rect.marginsAdded(
+            QtCore.QMarginsF(margin, margin, margin, margin))
+        self.scene.decode_pending_items(rect, self.get_scale())
+        self.scene.free_pixmap_memory(rect)
+
+    def scrollContentsBy(self, dx, dy):
+        super().scrollContentsBy(dx, dy)
+        self.decode_timer.start()
+
     def scale(self, *args, **kwargs):
         super().scale(*args, **kwargs)
         self.scene.on_view_scale_change()
         self.recalc_scene_rect()
+        self.decode_timer.start()
 
     def get_scale(self):
         return self.transform().m11()
@@ -860,8 +1064,7 @@ class BeeGraphicsView(MainControlsMixin,
 
         if self.active_mode == self.SAMPLE_COLOR_MODE:
             if (event.button() == Qt.MouseButton.LeftButton):
-                color = self.scene.sample_color_at(
-                    self.mapToScene(event.pos()))
+                color = self.sample_color_at(event.pos())
                 if color:
                     name = qcolor_to_hex(color)
                     clipboard = QtWidgets.QApplication.clipboard()
@@ -922,7 +1125,7 @@ class BeeGraphicsView(MainControlsMixin,
         if self.active_mode == self.SAMPLE_COLOR_MODE:
             self.sample_color_widget.update(
                 event.position(),
-                self.scene.sample_color_at(self.mapToScene(event.pos())))
+                self.sample_color_at(event.pos()))
             event.accept()
             return
 
@@ -948,6 +1151,7 @@ class BeeGraphicsView(MainControlsMixin,
     def resizeEvent(self, event):
         super().resizeEvent(event)
         self.recalc_scene_rect()
+        self.decode_timer.start()
         self.welcome_overlay.resize(self.size())
 
     def keyPressEvent(self, event):
@@ -13,65 +13,134 @@
 # You should have received a copy of the GNU General Public License
 # along with BeeRef.  If not, see <https://www.gnu.org/licenses/>.
 
+from bisect import bisect_right
+from collections import Counter
 import logging
 import math
 
 from PyQt6 import QtWidgets, QtGui, QtCore
 from PyQt6.QtCore import Qt
 
+from beeref.items import BeePixmapItem
+
 
 logger = logging.getLogger(__name__)
 
 
 class GamutPainterThread(QtCore.QThread):
-    """Dedicated thread for drawing the gamut image."""
+    """Dedicated thread for calculating the colour gamut of the items
+    (if needed) and drawing the gamut image.
+
+    The gamuts of all items are merged into one list of bins sorted
+    by pixel count. Lowering the threshold then only needs to draw the
+    additional bins onto the previous image.
+    """
 
     finished = QtCore.pyqtSignal(QtGui.QImage)
+    gamut_calculated = QtCore.pyqtSignal(object, object)
     radius = 250
 
-    def __init__(self, parent, item):
+    def __init__(self, parent, items):
         super().__init__()
-        self.item = item
+        self.items = items
         self.parent = parent
+        self.gamuts = {}
+        self.image_sources = {}
+        for item in items:
+            if item.has_color_gamut():
+                self.gamuts[item] = item.color_gamut
+            else:
+                # Needs to be fetched in the main thread, but images
+                # get decoded in the worker thread one by one:
+                self.image_sources[item] = item.gamut_image_source()
+        self.bins = None
+        self.image = None
+        self.drawn_bins = 0
+
+    def calculate_bins(self):
+        """Merge the gamuts of all items into a list of
+        ``(count, hue, saturation)`` tuples, highest count first.
+
+        Stops early when interrupted, leaving ``bins`` unset. Gamuts
+        that have been calculated so far are kept.
+        """
+
+        for item in list(self.image_sources):
+            if self.isInterruptionRequested():
+                return
+            source = self.image_sources.pop(item)
+            gamut = BeePixmapItem.color_gamut_from_image(source())
+            self.gamuts[item] = gamut
+            self.gamut_calculated.emit(item, gamut)
+
+        merged = Counter()
+        for gamut in self.gamuts.values():
+            merged.update(gamut)
+        self.bins = sorted(
+            ((count, hue, saturation)
+             for (hue, saturation), count in merged.items()),
+            reverse=True)
+        # Ascending, for finding the bins above a threshold:
+        self.negated_counts = [-count for count, hue, saturation
+                               in self.bins]
 
     def run(self):
-        logger.debug('Start drawing gamut image...')
-        self.image = QtGui.QImage(
-            QtCore.QSize(2 * self.radius, 2 * self.radius),
-            QtGui.QImage.Format.Format_ARGB32)
-        self.image.fill(QtGui.QColor(0, 0, 0, 0))
-
-        painter = QtGui.QPainter(self.image)
-        painter.setRenderHint(QtGui.QPainter.RenderHint.Antialiasing)
-        painter.setBrush(QtGui.QBrush(QtGui.QColor(0, 0, 0)))
-        painter.setPen(Qt.PenStyle.NoPen)
+        if self.bins is None:
+            self.calculate_bins()
+            if self.bins is None:
+                return
+
+        threshold = self.parent.threshold
+        logger.debug(f'Threshold: {threshold}')
+        end = bisect_right(self.negated_counts, -threshold)
         center = QtCore.QPoint(self.radius, self.radius)
-        painter.drawEllipse(center, self.radius, self.radius)
-        logger.debug(f'Threshold: {self.parent.threshold}')
 
-        for (hue, saturation), count in self.item.color_gamut.items():
-            if count < self.parent.threshold:
-                continue
+        if self.image is None or end < self.drawn_bins:
+            logger.debug('Start drawing gamut image...')
+            self.image = QtGui.QImage(
+                QtCore.QSize(2 * self.radius, 2 * self.radius),
+                QtGui.QImage.Format.Format_ARGB32)
+            self.image.fill(QtGui.QColor(0, 0, 0, 0))
+            painter = QtGui.QPainter(self.image)
+            painter.setRenderHint(QtGui.QPainter.RenderHint.Antialiasing)
+            painter.setBrush(QtGui.QBrush(QtGui.QColor(0, 0, 0)))
+            painter.setPen(Qt.PenStyle.NoPen)
+            painter.drawEllipse(center, self.radius, self.radius)
+            self.drawn_bins = 0
+        else:
+            logger.debug(f'Adding {end - self.drawn_bins} bins to gamut image')
+            painter = QtGui.QPainter(self.image)
+            painter.setRenderHint(QtGui.QPainter.RenderHint.Antialiasing)
+            painter.setPen(Qt.PenStyle.NoPen)
+
+        color = QtGui.QColor()
+        for count, hue, saturation in self.bins[self.drawn_bins:end]:
+            if self.isInterruptionRequested():
+                break
             hypotenuse = saturation / 255 * self.radius
             angle = math.radians(-90 - hue)
             x = int(math.sin(angle) * hypotenuse) + center.x()
             y = int(math.cos(angle) * hypotenuse) + center.y()
-            color = QtGui.QColor()
             color.setHsv(hue, saturation, 255)
             painter.setBrush(QtGui.QBrush(color))
             painter.drawEllipse(QtCore.QPoint(x, y), 3, 3)
+            self.drawn_bins += 1
+        painter.end()
 
-        logger.debug('Finished drawing gamut image.')
-        self.finished.emit(self.image)
+        if not self.isInterruptionRequested():
+            logger.debug('Finished drawing gamut image.')
+            # We keep drawing on our own image later:
+            self.finished.emit(self.image.copy())
 
 
 class GamutWidget(QtWidgets.QWidget):
 
-    def __init__(self, parent, item):
+    def __init__(self, parent, items):
         super().__init__(parent)
-        self.item = item
+        self.items = items
         self.image = None
-        self.worker = GamutPainterThread(self, item)
+        self.worker = GamutPainterThread(self, items)
+        self.worker.gamut_calculated.connect(self.on_gamut_calculated)
         self.worker.finished.connect(self.on_gamut_finished)
         self.worker.start()
 
@@ -79,6 +148,10 @@ class GamutWidget(QtWidgets.QWidget):
     def threshold(self):
         return self.parent().threshold_input.value()
 
+    def on_gamut_calculated(self, item, gamut):
+        logger.debug(f'Gamut calculation received for {item}')
+        item.set_color_gamut(gamut)
+
     def on_gamut_finished(self, image):
         logger.debug('Gamut image update received')
         self.image = image
@@ -88,6 +161,13 @@ class GamutWidget(QtWidgets.QWidget):
         return QtCore.QSize(200, 200)
 
     def update_values(self):
+        if self.worker.isRunning() and self.worker.bins is None:
+            # Still calculating; the worker will draw with the current
+            # threshold once that's done
+            return
+        # Drop the outdated drawing instead of waiting for it
+        self.worker.requestInterruption()
+        self.worker.wait()
         self.worker.start()
 
     def paintEvent(self, event):
@@ -103,10 +183,13 @@ class GamutWidget(QtWidgets.QWidget):
 
 
 class GamutDialog(QtWidgets.QDialog):
-    def __init__(self, parent, item):
+    def __init__(self, parent, items):
         super().__init__(parent)
-        self.item = item
-        self.setWindowTitle('Color Gamut')
+        self.items = items
+        if len(items) == 1:
+            self.setWindowTitle('Color Gamut')
+        else:
+            self.setWindowTitle(f'Color Gamut ({len(items)} Images)')
 
         # The input controls on the right
         controls_layout = QtWidgets.QVBoxLayout()
@@ -116,7 +199,6 @@ class GamutDialog(QtWidgets.QDialog):
         self.threshold_input = QtWidgets.QSlider(self)
         self.threshold_input.setRange(0, 500)
         self.threshold_input.setValue(20)
-        self.threshold_input.setTracking(False)
         self.threshold_input.valueChanged.connect(self.on_value_changed)
         controls_layout.addWidget(
             self.threshold_input, alignment=Qt.AlignmentFlag.AlignHCenter)
@@ -130,7 +212,7 @@ class GamutDialog(QtWidgets.QDialog):
         # The gamut display
         layout = QtWidgets.QHBoxLayout()
         self.setLayout(layout)
-        self.gamut_widget = GamutWidget(self, item)
+        self.gamut_widget = GamutWidget(self, items)
         layout.addWidget(self.gamut_widget, stretch=1)
 
         layout.addLayout(controls_layout, stretch=0)
@@ -138,3 +220,8 @@ class GamutDialog(QtWidgets.QDialog):
 
     def on_value_changed(self, value):
         self.gamut_widget.update_values()
+
+    def done(self, result):
+        # Don't keep calculating gamuts of the remaining images
+        self.gamut_widget.worker.requestInterruption()
+        super().done(result)
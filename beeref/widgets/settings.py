@@ -177,6 +177,26 @@ class AllocationLimitWidget(IntegerGroup):
     MAX = 10000
 
 
+class PixmapMemoryBudgetWidget(IntegerGroup):
+    TITLE = 'Image Memory Budget:'
+    HELPTEXT = ('How much memory decoded images may use (in megabytes).'
+                ' When exceeded, images outside of the view are reduced'
+                ' to a preview until they become visible again.'
+                ' Set to 0 for no limitation.')
+    KEY = 'Items/pixmap_memory_budget'
+    MIN = 0
+    MAX = 100000
+
+
+class ColorSampleSizeWidget(IntegerGroup):
+    TITLE = 'Color Sample Size:'
+    HELPTEXT = ('When sampling colors, average over a square of this many'
+                ' pixels. Set to 1 to sample single pixels.')
+    KEY = 'Items/color_sample_size'
+    MIN = 1
+    MAX = 25
+
+
 class ConfirmCloseUnsavedWidget(SingleCheckboxGroup):
     TITLE = 'Confirm when closing an unsaved file:'
     HELPTEXT = (
@@ -186,6 +206,16 @@ class ConfirmCloseUnsavedWidget(SingleCheckboxGroup):
     KEY = 'Save/confirm_close_unsaved'
 
 
+class AutosaveIntervalWidget(IntegerGroup):
+    TITLE = 'Autosave Interval:'
+    HELPTEXT = ('How often unsaved changes are saved in the background'
+                ' (in minutes). Untitled scenes are saved to a recovery'
+                ' file. Set to 0 to disable autosaving.')
+    KEY = 'Save/autosave_interval'
+    MIN = 0
+    MAX = 120
+
+
 class SettingsDialog(QtWidgets.QDialog):
     def __init__(self, parent):
         super().__init__(parent)
@@ -197,6 +227,7 @@ class SettingsDialog(QtWidgets.QDialog):
         misc_layout = QtWidgets.QGridLayout()
         misc.setLayout(misc_layout)
         misc_layout.addWidget(ConfirmCloseUnsavedWidget(), 0, 0)
+        misc_layout.addWidget(AutosaveIntervalWidget(), 0, 1)
         tabs.addTab(misc, '&Miscellaneous')
 
         # Images & Items
@@ -207,6 +238,8 @@ class SettingsDialog(QtWidgets.QDialog):
         items_layout.addWidget(AllocationLimitWidget(), 0, 1)
         items_layout.addWidget(ArrangeGapWidget(), 1, 0)
         items_layout.addWidget(ArrangeDefaultWidget(), 1, 1)
+        items_layout.addWidget(PixmapMemoryBudgetWidget(), 2, 0)
+        items_layout.addWidget(ColorSampleSizeWidget(), 2, 1)
         tabs.addTab(items, '&Images && Items')
 
         layout = QtWidgets.QVBoxLayout()
@@ -97,6 +97,25 @@ def item():
     yield BeePixmapItem(QtGui.QImage(10, 10, QtGui.QImage.Format.Format_RGB32))
 
 
+@pytest.fixture
+def jpgdata600x400(qapp):
+    from beeref.utils import image_to_bytes
+    # Red on the left half, blue on the right half:
+    img = QtGui.QImage(600, 400, QtGui.QImage.Format.Format_RGB32)
+    img.fill(QtGui.QColor(255, 0, 0))
+    painter = QtGui.QPainter(img)
+    painter.fillRect(300, 0, 300, 400, QtGui.QColor(0, 0, 255))
+    painter.end()
+    yield image_to_bytes(img, 'jpg')
+
+
+@pytest.fixture
+def tiled_item(jpgdata600x400):
+    from beeref.items import BeeTiledPixmapItem
+    with patch.object(BeeTiledPixmapItem, 'TILE_SIZE', 128):
+        yield BeeTiledPixmapItem(jpgdata600x400, filename='big.jpg')
+
+
 @pytest.fixture(scope="session")
 def qapp():
     from beeref.__main__ import BeeRefApplication
@@ -1,6 +1,8 @@
+from PyQt6 import QtGui
 import pytest
 
 from beeref.fileio.export import (
+    encode_image,
     exporter_registry,
     SceneToPixmapExporter,
     SceneToSVGExporter,
@@ -13,3 +15,10 @@ from beeref.fileio.export import (
                           ('svg', SceneToSVGExporter)])
 def test_registry(key, expected):
     exporter_registry[key] == expected
+
+
+def test_encode_image():
+    img = QtGui.QImage(10, 10, QtGui.QImage.Format.Format_RGB32)
+    data, imgformat = encode_image((img, 'png'))
+    assert imgformat == 'png'
+    assert data.startswith(b'\x89PNG')
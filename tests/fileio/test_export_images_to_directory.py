@@ -26,6 +26,36 @@ def test_images_to_directory_exporter_export_writes_images(
         assert f.read().startswith(b'\x89PNG')
 
 
+def test_images_to_directory_exporter_export_when_pixmap_pending(
+        view, tmpdir, imgdata3x3):
+    item = BeePixmapItem(QtGui.QImage())
+    item.set_lazy_source(MagicMock(return_value=imgdata3x3))
+    item.save_id = 3
+    view.scene.addItem(item)
+    exporter = ImagesToDirectoryExporter(view.scene, tmpdir)
+    exporter.export()
+
+    img = QtGui.QImage(os.path.join(tmpdir, '0003.png'))
+    assert img.size().width() == 3
+    assert item.pixmap_pending is True
+
+
+def test_images_to_directory_exporter_export_writes_images_in_order(
+        view, tmpdir):
+    for i in range(10):
+        img = QtGui.QImage(5, 5, QtGui.QImage.Format.Format_RGB32)
+        img.fill(QtGui.QColor(i * 20, 0, 0))
+        item = BeePixmapItem(img)
+        item.save_id = i + 1
+        view.scene.addItem(item)
+    exporter = ImagesToDirectoryExporter(view.scene, tmpdir)
+    exporter.export()
+
+    for i in range(10):
+        img = QtGui.QImage(os.path.join(tmpdir, f'{i + 1:04}.png'))
+        assert img.pixelColor(0, 0).red() == i * 20
+
+
 def test_images_to_directory_exporter_export_file_exists_no_user_input(
         view, tmpdir, imgdata3x3, imgfilename3x3,):
     item1 = BeePixmapItem(QtGui.QImage(imgfilename3x3))
@@ -1,6 +1,6 @@
 import os
 import stat
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 import pytest
 
 from PyQt6 import QtGui, QtCore
@@ -219,6 +219,21 @@ def test_scene_to_svg_exporter_render_with_worker_canceled(view):
     assert svg is None
 
 
+def test_scene_to_svg_exporter_render_closes_images_on_error(view):
+    item = BeeTextItem('foo')
+    view.scene.addItem(item)
+    exporter = SceneToSVGExporter(view.scene)
+    exporter.size = QtCore.QSize(200, 400)
+    exporter.margin = 5
+    images = MagicMock()
+    exporter.build_svg = MagicMock(side_effect=ValueError())
+
+    with patch('beeref.fileio.export.parallel_map', return_value=images):
+        with pytest.raises(ValueError):
+            exporter.render_to_svg()
+    images.close.assert_called_once_with()
+
+
 def test_scene_to_svg_exporter_export_writes_svg(view, tmpdir):
     filename = os.path.join(tmpdir, 'foo.svg')
     item = BeeTextItem('foo')
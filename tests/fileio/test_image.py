@@ -9,7 +9,12 @@ import plum
 
 from PyQt6 import QtCore, QtGui
 
-from beeref.fileio.image import exif_rotated_image, load_image
+from beeref.fileio.image import (
+    encoded_image_data,
+    exif_rotated_image,
+    load_image,
+    read_image,
+)
 
 
 def test_exif_rotated_image_without_path(qapp):
@@ -66,21 +71,82 @@ def test_exif_rotated_image(path, expected, qapp):
             assert math.sqrt(sum(diff)) < 3
 
 
+def test_read_image_returns_data_when_not_transformed(qapp, imgfilename3x3):
+    img, data = read_image(imgfilename3x3)
+    assert img.isNull() is False
+    with open(imgfilename3x3, 'rb') as f:
+        assert data == f.read()
+
+
+def test_read_image_returns_data_when_orientation_top_left(qapp):
+    root = os.path.dirname(__file__)
+    fname = os.path.join(root, '..', 'assets', 'test3x3_orientation1.jpg')
+    img, data = read_image(fname)
+    assert img.isNull() is False
+    with open(fname, 'rb') as f:
+        assert data == f.read()
+
+
+def test_read_image_no_data_when_transformed(qapp):
+    root = os.path.dirname(__file__)
+    fname = os.path.join(root, '..', 'assets', 'test3x3_orientation6.jpg')
+    img, data = read_image(fname)
+    assert img.isNull() is False
+    assert data is None
+
+
+def test_read_image_returns_data_when_exif_unpack_error(
+        qapp, imgfilename3x3):
+    with patch('beeref.fileio.image.exif.Image',
+               side_effect=plum.exceptions.UnpackError()):
+        img, data = read_image(imgfilename3x3)
+        assert img.isNull() is False
+        assert data
+
+
+def test_read_image_not_a_file(qapp):
+    img, data = read_image('foo')
+    assert img.isNull() is True
+    assert data is None
+
+
+def test_encoded_image_data_png(qapp, imgdata3x3):
+    mimedata = QtCore.QMimeData()
+    mimedata.setData('image/png', imgdata3x3)
+    assert encoded_image_data(mimedata) == imgdata3x3
+
+
+def test_encoded_image_data_jpeg(qapp):
+    mimedata = QtCore.QMimeData()
+    mimedata.setData('image/jpeg', b'foo')
+    assert encoded_image_data(mimedata) == b'foo'
+
+
+def test_encoded_image_data_when_no_encoded_data(qapp, imgfilename3x3):
+    mimedata = QtCore.QMimeData()
+    mimedata.setImageData(QtGui.QImage(imgfilename3x3))
+    mimedata.setData('image/bmp', b'foo')
+    assert encoded_image_data(mimedata) is None
+
+
 def test_load_image_loads_from_filename(view, imgfilename3x3):
-    img, filename = load_image(imgfilename3x3)
+    img, filename, data = load_image(imgfilename3x3)
     assert img.isNull() is False
     assert filename == imgfilename3x3
+    with open(imgfilename3x3, 'rb') as f:
+        assert data == f.read()
 
 
 def test_load_image_loads_from_nonexisting_filename(view, imgfilename3x3):
-    img, filename = load_image('foo.png')
+    img, filename, data = load_image('foo.png')
     assert img.isNull() is True
     assert filename == 'foo.png'
+    assert data is None
 
 
 def test_load_image_loads_from_existing_local_url(view, imgfilename3x3):
     url = QtCore.QUrl.fromLocalFile(imgfilename3x3)
-    img, filename = load_image(url)
+    img, filename, data = load_image(url)
     assert img.isNull() is False
     assert filename == imgfilename3x3
 
@@ -93,9 +159,10 @@ def test_load_image_loads_from_existing_web_url(view, imgdata3x3):
         url,
         body=imgdata3x3,
     )
-    img, filename = load_image(QtCore.QUrl(url))
+    img, filename, data = load_image(QtCore.QUrl(url))
     assert img.isNull() is False
     assert filename == url
+    assert data == imgdata3x3
 
 
 @httpretty.activate
@@ -106,7 +173,7 @@ def test_load_image_loads_from_existing_web_url_non_ascii(view, imgdata3x3):
         url,
         body=imgdata3x3,
     )
-    img, filename = load_image(QtCore.QUrl(url))
+    img, filename, data = load_image(QtCore.QUrl(url))
     assert img.isNull() is False
     assert filename == 'http://example.com/f%C3%B6%C3%B6.png'
 
@@ -119,7 +186,7 @@ def test_load_image_loads_from_web_url_errors(view, imgfilename3x3):
         url,
         status=500,
     )
-    img, filename = load_image(QtCore.QUrl(url))
+    img, filename, data = load_image(QtCore.QUrl(url))
     assert img.isNull() is True
     assert filename == url
 
@@ -138,7 +205,7 @@ def test_load_image_from_pinterest_finds_image(view, imgdata3x3):
         img_url,
         body=imgdata3x3,
     )
-    img, filename = load_image(QtCore.QUrl(url))
+    img, filename, data = load_image(QtCore.QUrl(url))
     assert img.isNull() is False
     assert filename == img_url
 
@@ -151,7 +218,7 @@ def test_load_image_from_pinterest_when_already_image(view, imgdata3x3):
         img_url,
         body=imgdata3x3,
     )
-    img, filename = load_image(QtCore.QUrl(img_url))
+    img, filename, data = load_image(QtCore.QUrl(img_url))
     assert img.isNull() is False
     assert filename == img_url
 
@@ -170,7 +237,7 @@ def test_load_image_from_pinterest_when_img_url_not_found(view, imgdata3x3):
         img_url,
         body=imgdata3x3,
     )
-    img, filename = load_image(QtCore.QUrl(url))
+    img, filename, data = load_image(QtCore.QUrl(url))
     assert img.isNull() is True
 
 
@@ -182,5 +249,5 @@ def test_load_image_from_pinterest_when_url_errors(view, imgdata3x3):
         url,
         status=500,
     )
-    img, filename = load_image(QtCore.QUrl(url))
+    img, filename, data = load_image(QtCore.QUrl(url))
     assert img.isNull() is True
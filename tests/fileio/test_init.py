@@ -6,6 +6,7 @@ from PyQt6 import QtCore
 
 from beeref import fileio
 from beeref import commands
+from beeref.items import BeeTiledPixmapItem
 from ..utils import queue2list
 
 
@@ -45,6 +46,21 @@ def test_load_images_loads(view, imgfilename3x3):
     assert item.pos() == QtCore.QPointF(3.5, 4.5)
 
 
+@patch('beeref.items.BeeTiledPixmapItem.TILING_MIN_SIZE', 500)
+def test_load_images_loads_big_images_tiled(view, tmpdir, jpgdata600x400):
+    filename = os.path.join(tmpdir, 'big.jpg')
+    with open(filename, 'wb') as f:
+        f.write(jpgdata600x400)
+    view.scene.undo_stack = MagicMock()
+    worker = MagicMock(canceled=False)
+    fileio.load_images([filename], QtCore.QPointF(5, 6), view.scene, worker)
+    worker.finished.emit.assert_called_once_with('', [])
+    item = queue2list(view.scene.items_to_add)[0][0]['item']
+    assert isinstance(item, BeeTiledPixmapItem)
+    assert item.filename == filename
+    assert item.source_data == jpgdata600x400
+
+
 def test_load_images_canceled(view, imgfilename3x3):
     view.scene.undo_stack = MagicMock()
     worker = MagicMock(canceled=True)
@@ -84,3 +100,25 @@ def test_load_images_error(view, imgfilename3x3):
     assert cmd.scene == view.scene
     assert cmd.ignore_first_redo is True
     assert item.pos() == QtCore.QPointF(3.5, 4.5)
+
+
+def test_load_images_keeps_order(view, imgfilename3x3):
+    view.scene.undo_stack = MagicMock()
+    worker = MagicMock(canceled=False)
+    filenames = [imgfilename3x3, 'foo.jpg'] * 10
+    fileio.load_images(filenames, QtCore.QPointF(5, 6), view.scene, worker)
+    assert worker.progress.emit.call_count == 20
+    worker.finished.emit.assert_called_once_with('', ['foo.jpg'] * 10)
+    itemdata = queue2list(view.scene.items_to_add)
+    assert len(itemdata) == 10
+
+
+def test_load_images_leaves_out_items_not_queued_when_canceled(
+        view, imgfilename3x3):
+    view.scene.undo_stack = MagicMock()
+    worker = MagicMock(canceled=True)
+    filenames = [imgfilename3x3] * 3
+    with patch.object(view.scene, 'add_item_later', return_value=False):
+        fileio.load_images(filenames, QtCore.QPointF(5, 6), view.scene, worker)
+    cmd = view.scene.undo_stack.push.call_args_list[0][0][0]
+    assert cmd.items == []
@@ -0,0 +1,174 @@
+from unittest.mock import MagicMock
+
+from PyQt6 import QtCore, QtGui
+
+from beeref.fileio.lazy import LazyDecoder
+from beeref.items import BeePixmapItem
+
+
+def test_lazy_decoder_decodes_item(qapp, qtbot, imgdata3x3):
+    decoder = LazyDecoder()
+    item = BeePixmapItem(QtGui.QImage())
+    item.set_lazy_source(MagicMock(return_value=imgdata3x3))
+    decoder.decode_later(item)
+    qtbot.waitUntil(lambda: item.pixmap_pending is False)
+    assert item.pixmap().size() == QtCore.QSize(3, 3)
+    assert decoder.queued == set()
+
+
+def test_lazy_decoder_decodes_item_only_once(qapp, qtbot, imgdata3x3):
+    decoder = LazyDecoder()
+    item = BeePixmapItem(QtGui.QImage())
+    item.set_lazy_source(MagicMock(return_value=imgdata3x3))
+    decoder.pool.start = MagicMock()
+    decoder.decode_later(item)
+    decoder.decode_later(item)
+    decoder.pool.start.assert_called_once()
+
+
+def test_lazy_decoder_decodes_preview(qapp, qtbot, imgdata3x3):
+    decoder = LazyDecoder()
+    item = BeePixmapItem(QtGui.QImage())
+    item.set_lazy_source(MagicMock())
+    item.set_preview_sources({4: MagicMock(return_value=imgdata3x3)})
+    decoder.decode_later(item, 4)
+    qtbot.waitUntil(lambda: 4 in item.previews)
+    assert item.previews[4].size() == QtCore.QSize(3, 3)
+    assert item.pixmap_pending is True
+    item.blob_source.assert_not_called()
+
+
+def test_lazy_decoder_ignores_decoded_preview(qapp):
+    decoder = LazyDecoder()
+    item = BeePixmapItem(QtGui.QImage())
+    item.set_lazy_source(MagicMock())
+    item.previews = {4: MagicMock()}
+    decoder.pool.start = MagicMock()
+    decoder.decode_later(item, 4)
+    decoder.pool.start.assert_not_called()
+
+
+def test_lazy_decoder_ignores_decoded_item(qapp, item):
+    decoder = LazyDecoder()
+    decoder.pool.start = MagicMock()
+    decoder.decode_later(item)
+    decoder.pool.start.assert_not_called()
+
+
+def test_lazy_decoder_handles_errors(qapp, qtbot):
+    decoder = LazyDecoder()
+    item = BeePixmapItem(QtGui.QImage())
+    item.set_lazy_source(MagicMock(side_effect=OSError('oops')))
+    decoder.decode_later(item)
+    qtbot.waitUntil(lambda: not decoder.queued)
+    assert item.pixmap_pending is True
+    assert item.may_decode() is False
+    decoder.pool.start = MagicMock()
+    decoder.decode_later(item)
+    decoder.pool.start.assert_not_called()
+
+
+def test_lazy_decoder_decodes_tile(qapp, qtbot, tiled_item):
+    decoder = LazyDecoder()
+    decoder.decode_tile_later(tiled_item, (2, 1, 0))
+    qtbot.waitUntil(lambda: (2, 1, 0) in tiled_item.tiles)
+    assert tiled_item.tiles[(2, 1, 0)].size() == QtCore.QSize(128, 128)
+    assert decoder.queued == set()
+
+
+def test_lazy_decoder_decodes_tile_only_once(qapp, tiled_item):
+    decoder = LazyDecoder()
+    decoder.pool.start = MagicMock()
+    decoder.decode_tile_later(tiled_item, (1, 0, 0))
+    decoder.decode_tile_later(tiled_item, (1, 0, 0))
+    decoder.pool.start.assert_called_once()
+
+
+def test_lazy_decoder_handles_tile_errors(qapp, qtbot, tiled_item):
+    decoder = LazyDecoder()
+    tiled_item.tile_source = MagicMock(
+        return_value=MagicMock(side_effect=OSError('oops')))
+    decoder.decode_tile_later(tiled_item, (1, 0, 0))
+    qtbot.waitUntil(lambda: (1, 0, 0) in tiled_item.tiles)
+    assert tiled_item.tiles[(1, 0, 0)].isNull()
+
+
+def test_lazy_decoder_converts_grayscale(qapp, qtbot, item):
+    decoder = LazyDecoder()
+    decoder.convert_grayscale_later(item)
+    qtbot.waitUntil(lambda: item._grayscale_pixmap is not None)
+    assert item._grayscale_pixmap.toImage().isGrayscale() is True
+    assert decoder.queued == set()
+
+
+def test_lazy_decoder_converts_grayscale_only_once(qapp, item):
+    decoder = LazyDecoder()
+    decoder.pool.start = MagicMock()
+    decoder.convert_grayscale_later(item)
+    decoder.convert_grayscale_later(item)
+    decoder.pool.start.assert_called_once()
+
+
+def test_lazy_decoder_creates_previews(qapp, qtbot):
+    decoder = LazyDecoder()
+    item = BeePixmapItem(
+        QtGui.QImage(400, 200, QtGui.QImage.Format.Format_RGB32))
+    decoder.create_previews_later(item)
+    qtbot.waitUntil(lambda: item._previews_created)
+    assert item.previews[4].size() == QtCore.QSize(100, 50)
+    assert decoder.queued == set()
+
+
+def test_lazy_decoder_creates_previews_only_once(qapp, item):
+    decoder = LazyDecoder()
+    decoder.pool.start = MagicMock()
+    decoder.create_previews_later(item)
+    decoder.create_previews_later(item)
+    decoder.pool.start.assert_called_once()
+
+
+def test_lazy_decoder_discards_outdated_previews(qapp, qtbot):
+    decoder = LazyDecoder()
+    item = BeePixmapItem(
+        QtGui.QImage(400, 200, QtGui.QImage.Format.Format_RGB32))
+    key = item.pixmap_key()
+    decoder.queued.add((item, 'previews', key))
+    item.setPixmap(QtGui.QPixmap(300, 300))
+    decoder.on_previews_created(
+        item, [(4, QtGui.QImage(100, 50, QtGui.QImage.Format.Format_RGB32))],
+        key)
+    assert item.previews == {}
+    assert item._previews_created is False
+
+
+def test_lazy_decoder_clear(qapp):
+    decoder = LazyDecoder()
+    decoder.queued.add('foo')
+    decoder.clear()
+    assert decoder.queued == set()
+
+
+def test_lazy_decoder_drops_results_after_clear(qapp, imgdata3x3):
+    decoder = LazyDecoder()
+    item = BeePixmapItem(QtGui.QImage())
+    item.set_lazy_source(MagicMock(return_value=imgdata3x3))
+    decoder.pool.start = MagicMock()
+    decoder.decode_later(item)
+    decoder.clear()
+    img = QtGui.QImage(3, 3, QtGui.QImage.Format.Format_RGB32)
+    decoder.on_decoded(item, img, 1)
+    assert item.pixmap_pending is True
+
+
+def test_lazy_decoder_drops_results_of_deleted_items(
+        view, imgdata3x3):
+    decoder = LazyDecoder()
+    item = BeePixmapItem(QtGui.QImage())
+    item.set_lazy_source(MagicMock(return_value=imgdata3x3))
+    view.scene.addItem(item)
+    decoder.pool.start = MagicMock()
+    decoder.decode_later(item)
+    view.scene.clear()
+    img = QtGui.QImage(3, 3, QtGui.QImage.Format.Format_RGB32)
+    decoder.on_decoded(item, img, 1)
+    assert decoder.queued == set()
@@ -0,0 +1,161 @@
+import json
+from unittest.mock import MagicMock
+
+from PyQt6 import QtGui
+
+from beeref.fileio.snapshot import (
+    ItemSnapshot,
+    PixmapItemSnapshot,
+    SceneSnapshot,
+)
+from beeref.fileio.sql import SQLiteIO
+from beeref.items import BeeErrorItem, BeePixmapItem, BeeTextItem
+
+
+def test_item_snapshot_takes_row(view):
+    item = BeeTextItem('foo')
+    view.scene.addItem(item)
+    item.setPos(3, 4)
+    item.setZValue(0.5)
+    item.setScale(2)
+    item.setRotation(30)
+    snapshot = ItemSnapshot(item)
+    item.setPos(10, 20)
+    item.setPlainText('bar')
+    assert snapshot.row == (3, 4, 0.5, 2, 30, 1,
+                            json.dumps({'text': 'foo'}))
+    assert snapshot.TYPE == 'text'
+    assert str(snapshot) == 'Text "foo"'
+
+
+def test_item_snapshot_apply(view):
+    item = BeeTextItem('foo')
+    snapshot = ItemSnapshot(item)
+    snapshot.save_id = 5
+    snapshot.saved_row = (1, 2)
+    snapshot.apply()
+    assert item.save_id == 5
+    assert item.saved_row == (1, 2)
+
+
+def test_pixmap_item_snapshot_shares_image(view, imgfilename3x3):
+    item = BeePixmapItem(QtGui.QImage(imgfilename3x3), filename='bee.png')
+    snapshot = PixmapItemSnapshot(item)
+    assert snapshot.get_image() == item.pixmap().toImage()
+    assert snapshot.filename == 'bee.png'
+    assert snapshot.pixmap_pending is False
+
+
+def test_pixmap_item_snapshot_pending_decodes_without_item(
+        view, imgdata3x3):
+    item = BeePixmapItem(QtGui.QImage())
+    item.set_lazy_source(MagicMock(return_value=imgdata3x3))
+    snapshot = PixmapItemSnapshot(item)
+    assert snapshot.get_image().size().width() == 3
+    assert item.pixmap_pending is True
+
+
+def test_pixmap_item_snapshot_pixmap_to_bytes(view, item, settings):
+    settings.setValue('Items/image_storage_format', 'png')
+    snapshot = PixmapItemSnapshot(item)
+    data, imgformat = snapshot.pixmap_to_bytes()
+    assert imgformat == 'png'
+    assert data.startswith(b'\x89PNG')
+
+
+def test_pixmap_item_snapshot_create_thumbnails(view):
+    item = BeePixmapItem(
+        QtGui.QImage(400, 200, QtGui.QImage.Format.Format_RGB32))
+    snapshot = PixmapItemSnapshot(item)
+    thumbnails = snapshot.create_thumbnails()
+    assert [factor for factor, img in thumbnails] == [4]
+    assert thumbnails[0][1].size().width() == 100
+
+
+def test_pixmap_item_snapshot_create_thumbnails_when_dropped(view):
+    item = BeePixmapItem(
+        QtGui.QImage(400, 200, QtGui.QImage.Format.Format_RGB32))
+    item.source_data = item.pixmap_to_bytes()[0]
+    item.drop_pixmap()
+    snapshot = PixmapItemSnapshot(item)
+    thumbnails = snapshot.create_thumbnails()
+    assert [factor for factor, img in thumbnails] == [4]
+    assert snapshot.image is None
+
+
+def test_pixmap_item_snapshot_apply_sets_blob_hash(view, item):
+    snapshot = PixmapItemSnapshot(item)
+    snapshot.blob_hash = 'abc'
+    snapshot.apply()
+    assert item.blob_hash == 'abc'
+
+
+def test_pixmap_item_snapshot_apply_when_pixmap_changed(view, item):
+    snapshot = PixmapItemSnapshot(item)
+    snapshot.blob_hash = 'abc'
+    item.setPixmap(QtGui.QPixmap(5, 5))
+    snapshot.apply()
+    assert item.blob_hash is None
+
+
+def test_pixmap_item_snapshot_tiled(view, tiled_item, jpgdata600x400):
+    snapshot = PixmapItemSnapshot(tiled_item)
+    assert snapshot.TILED is True
+    assert snapshot.image is None
+    assert snapshot.get_source_data() == (jpgdata600x400, 'jpg')
+    thumbnails = snapshot.create_thumbnails()
+    assert [factor for factor, img in thumbnails] == [4, 16]
+    assert snapshot.get_image().size().width() == 600
+
+
+def test_scene_snapshot_items(view, item):
+    view.scene.addItem(item)
+    text = BeeTextItem('foo')
+    view.scene.addItem(text)
+    err = BeeErrorItem('error')
+    err.original_save_id = 3
+    view.scene.addItem(err)
+    snapshot = SceneSnapshot(view.scene)
+    assert {s.item for s in snapshot.items_for_save()} == {item, text}
+    pixmaps = snapshot.items_by_type(BeePixmapItem.TYPE)
+    assert [s.item for s in pixmaps] == [item]
+    errors = snapshot.items_by_type(BeeErrorItem.TYPE)
+    assert [s.original_save_id for s in errors] == [3]
+
+
+def test_scene_snapshot_clear_save_ids(view, item):
+    view.scene.addItem(item)
+    item.save_id = 4
+    snapshot = SceneSnapshot(view.scene)
+    snapshot.clear_save_ids()
+    assert snapshot.items[0].save_id is None
+    assert item.save_id == 4
+
+
+def test_scene_snapshot_apply_only_when_saved(view, item):
+    view.scene.addItem(item)
+    snapshot = SceneSnapshot(view.scene)
+    snapshot.items[0].save_id = 7
+    snapshot.apply()
+    assert item.save_id is None
+    snapshot.saved = True
+    snapshot.apply()
+    assert item.save_id == 7
+    snapshot.items[0].save_id = 8
+    snapshot.apply()
+    assert item.save_id == 7
+
+
+def test_write_snapshot_doesnt_touch_items_before_apply(
+        view, item, tmpfile):
+    view.scene.addItem(item)
+    snapshot = SceneSnapshot(view.scene)
+    # Changes after taking the snapshot don't end up in the file
+    item.setPos(50, 60)
+    io = SQLiteIO(tmpfile, snapshot, create_new=True)
+    io.write()
+    assert item.save_id is None
+    assert io.fetchone('SELECT x, y FROM items') == (0, 0)
+    snapshot.apply()
+    assert item.save_id == 1
+    assert item.saved_row[:2] == (0, 0)
@@ -1,16 +1,24 @@
+import hashlib
 import json
 import os
 import os.path
-import stat
+import sqlite3
 from unittest.mock import MagicMock, patch
 
 from PyQt6 import QtCore, QtGui
 import pytest
 
 from beeref.fileio import schema, is_bee_file
+from beeref.fileio import sql
 from beeref.fileio.errors import BeeFileIOError
-from beeref.fileio.sql import SQLiteIO
-from beeref.items import BeePixmapItem, BeeTextItem, BeeErrorItem
+from beeref.fileio.snapshot import ItemSnapshot, PixmapItemSnapshot
+from beeref.fileio.sql import LazyBlob, SQLiteIO, remove_bee_file
+from beeref.items import (
+    BeeErrorItem,
+    BeePixmapItem,
+    BeeTextItem,
+    BeeTiledPixmapItem,
+)
 
 
 @pytest.mark.parametrize('filename,expected',
@@ -53,22 +61,110 @@ def test_sqliteio_migrate_migrates(tmpfile):
     2: ['CREATE TABLE foo (col1 INT)',
         'CREATE TABLE bar (baz INT)'],
     3: ['ALTER TABLE foo ADD COLUMN col2 TEXT']})
-def test_sqliteio_migrate_migrates_when_file_not_writable(tmpfile):
+def test_sqliteio_migrate_doesnt_migrate_when_readonly(tmpfile):
     io = SQLiteIO(tmpfile, MagicMock(), create_new=True)
     io.ex('PRAGMA user_version=1')
     io.connection.commit()
     del io
-    os.chmod(tmpfile, stat.S_IREAD)
-    with pytest.raises(PermissionError):
-        open(tmpfile, 'w')
     io = SQLiteIO(tmpfile, MagicMock(), readonly=True)
-    io.ex('INSERT INTO foo (col1, col2) VALUES (22, "hello world")')
-    io.ex('INSERT INTO bar (baz) VALUES (55)')
     result = io.fetchone('PRAGMA user_version')
-    assert result[0] == 3
-    newdir = io._tmpdir.name
+    assert result[0] == 1
+    result = io.fetchone(
+        'SELECT COUNT(*) FROM sqlite_master WHERE name="foo"')
+    assert result[0] == 0
+
+
+def test_sqliteio_readonly_opens_file_readonly(tmpfile):
+    io = SQLiteIO(tmpfile, MagicMock(), create_new=True)
+    io.create_schema_on_new()
+    io.connection.commit()
+    del io
+    io = SQLiteIO(tmpfile, MagicMock(), readonly=True)
+    with pytest.raises(sqlite3.OperationalError):
+        io.ex('INSERT INTO items (type) VALUES ("text")')
+
+
+def create_v1_file(tmpfile, imgdata3x3):
+    io = SQLiteIO(tmpfile, MagicMock(), create_new=True)
+    io.ex('PRAGMA user_version=1')
+    io.ex("""
+        CREATE TABLE items (
+          id INTEGER PRIMARY KEY,
+          type TEXT NOT NULL,
+          x REAL DEFAULT 0,
+          y REAL DEFAULT 0,
+          z REAL DEFAULT 0,
+          scale REAL DEFAULT 1,
+          rotation REAL DEFAULT 0,
+          flip INTEGER DEFAULT 1,
+          filename TEXT)""")
+    io.ex("""
+        CREATE TABLE sqlar (
+            name TEXT PRIMARY KEY,
+            item_id INTEGER NOT NULL,
+            mode INT,
+            mtime INT default current_timestamp,
+            sz INT,
+            data BLOB,
+            FOREIGN KEY (item_id)
+              REFERENCES items (id)
+                 ON DELETE CASCADE
+                 ON UPDATE NO ACTION)""")
+    io.ex('INSERT INTO items '
+          '(type, x, y, z, scale, rotation, flip, filename) '
+          'VALUES (?, ?, ?, ?, ?, ?, ?, ?) ',
+          ('pixmap', 22.2, 33.3, 0.22, 3.4, 45, -1, 'bee.png'))
+    io.ex('INSERT INTO sqlar (item_id, data) VALUES (?, ?)',
+          (1, imgdata3x3))
+    io.connection.commit()
+
+
+def test_sqliteio_read_version_1_without_migrating(
+        tmpfile, view, imgdata3x3):
+    create_v1_file(tmpfile, imgdata3x3)
+    io = SQLiteIO(tmpfile, view.scene, readonly=True, lazy=True)
+    io.read()
+    view.scene.add_queued_items()
+    assert len(view.scene.items()) == 1
+    item = view.scene.items()[0]
+    assert item.save_id == 1
+    assert item.filename == 'bee.png'
+    assert item.pos() == QtCore.QPointF(22.2, 33.3)
+    assert item.width == 3
+    assert io.fetchone('PRAGMA user_version') == (1,)
+
+
+def test_sqliteio_read_version_3_without_migrating(
+        tmpfile, view, imgdata3x3):
+    create_v1_file(tmpfile, imgdata3x3)
+    with patch('beeref.fileio.sql.USER_VERSION', 3):
+        io = SQLiteIO(tmpfile, view.scene)
+        io.connection
+        del io
+    io = SQLiteIO(tmpfile, view.scene, readonly=True)
+    io.read()
+    view.scene.add_queued_items()
+    assert len(view.scene.items()) == 1
+    item = view.scene.items()[0]
+    assert item.filename == 'bee.png'
+    assert item.width == 3
+    assert item.blob_hash is None
+    assert io.fetchone('PRAGMA user_version') == (3,)
+
+
+def test_sqliteio_write_migrates_file_opened_readonly(
+        tmpfile, view, imgdata3x3):
+    create_v1_file(tmpfile, imgdata3x3)
+    io = SQLiteIO(tmpfile, view.scene, readonly=True, lazy=True)
+    io.read()
+    view.scene.add_queued_items()
     del io
-    assert os.path.exists(newdir) is False
+
+    io = SQLiteIO(tmpfile, view.scene)
+    io.write()
+    assert io.fetchone('PRAGMA user_version') == (schema.USER_VERSION,)
+    assert io.fetchone('SELECT COUNT(*) FROM items') == (1,)
+    assert io.fetchone('SELECT data FROM sqlar') == (imgdata3x3,)
 
 
 def test_all_migrations(tmpfile):
@@ -118,6 +214,68 @@ def test_all_migrations(tmpfile):
     assert result[1] == 33.3
     assert json.loads(result[2]) == {'filename': 'bee.png'}
     assert result[3] == b'bla'
+    assert io.fetchone('SELECT COUNT(*) FROM thumbnails') == (0,)
+    assert io.fetchone('SELECT blob_id FROM items') == (1,)
+    assert io.fetchone('SELECT hash FROM sqlar') == (None,)
+
+
+def test_remove_bee_file_removes_journal_files(tmpfile):
+    for suffix in ('', '-journal', '-wal', '-shm'):
+        with open(tmpfile + suffix, 'w') as f:
+            f.write('foo')
+    remove_bee_file(tmpfile)
+    for suffix in ('', '-journal', '-wal', '-shm'):
+        assert os.path.exists(tmpfile + suffix) is False
+
+
+def test_remove_bee_file_when_not_existing(tmpfile):
+    remove_bee_file(tmpfile)
+    assert os.path.exists(tmpfile) is False
+
+
+def test_sqliteio_create_new_removes_stale_wal_file(tmpfile, view):
+    with open(f'{tmpfile}-wal', 'w') as f:
+        f.write('foo')
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.write()
+    assert os.path.exists(f'{tmpfile}-wal') is False
+
+
+def test_sqliteio_write_with_wal(tmpfile, view, item):
+    view.scene.addItem(item)
+    io = SQLiteIO(tmpfile, view.scene, create_new=True, wal=True)
+    with patch.object(io, 'leave_wal_mode') as leave_mock:
+        io.write()
+        assert io.fetchone('PRAGMA journal_mode') == ('wal',)
+        leave_mock.assert_called_once_with()
+    assert io.fetchone('SELECT COUNT(*) FROM items') == (1,)
+
+
+def test_sqliteio_write_with_wal_leaves_wal_mode(tmpfile, view, item):
+    view.scene.addItem(item)
+    io = SQLiteIO(tmpfile, view.scene, create_new=True, wal=True)
+    io.write()
+    assert io.fetchone('PRAGMA journal_mode') == ('delete',)
+    del io
+    assert os.path.exists(f'{tmpfile}-wal') is False
+    assert os.path.exists(f'{tmpfile}-shm') is False
+
+
+def test_sqliteio_write_with_wal_when_file_in_use(tmpfile, view, item):
+    view.scene.addItem(item)
+    io = SQLiteIO(tmpfile, view.scene, create_new=True, wal=True)
+    with patch.object(io, 'leave_wal_mode'):
+        io.write()
+    reader = sqlite3.connect(tmpfile)
+    reader.execute('BEGIN')
+    reader.execute('SELECT * FROM items').fetchall()
+    item.setPos(5, 5)
+    io = SQLiteIO(tmpfile, view.scene, wal=True)
+    io.write()
+    assert io.fetchone('PRAGMA journal_mode') == ('wal',)
+    assert reader.execute('SELECT x FROM items').fetchone() == (0,)
+    reader.close()
+    assert io.fetchone('SELECT x FROM items') == (5,)
 
 
 def test_sqliteio_write_meta_application_id(tmpfile):
@@ -148,7 +306,7 @@ def test_sqliteio_create_schema_on_new_when_create_new(tmpfile):
     result = io.fetchone(
         'SELECT COUNT(*) FROM sqlite_master '
         'WHERE type="table" AND name NOT LIKE "sqlite_%"')
-    assert result[0] == 2
+    assert result[0] == 4
     scene_mock.clear_save_ids.assert_called_once()
 
 
@@ -225,8 +383,12 @@ def test_sqliteio_write_inserts_new_text_item(tmpfile, view):
     assert result[9] is None
 
 
-def test_sqliteio_write_inserts_new_pixmap_item_png(tmpfile, view):
-    item = BeePixmapItem(QtGui.QImage(), filename='bee.jpg')
+@patch('beeref.fileio.snapshot.PixmapItemSnapshot.pixmap_to_bytes',
+       return_value=(b'abc', 'png'))
+def test_sqliteio_write_inserts_new_pixmap_item_png(bytes_mock, tmpfile, view):
+    item = BeePixmapItem(
+        QtGui.QImage(10, 10, QtGui.QImage.Format.Format_RGB32),
+        filename='bee.jpg')
     view.scene.addItem(item)
     item.setOpacity(0.66)
     item.setScale(1.3)
@@ -236,7 +398,6 @@ def test_sqliteio_write_inserts_new_pixmap_item_png(tmpfile, view):
     item.do_flip()
     item.crop = QtCore.QRectF(5, 5, 100, 80)
     item.grayscale = True
-    item.pixmap_to_bytes = MagicMock(return_value=(b'abc', 'png'))
     io = SQLiteIO(tmpfile, view.scene, create_new=True)
     io.write()
 
@@ -263,10 +424,13 @@ def test_sqliteio_write_inserts_new_pixmap_item_png(tmpfile, view):
     assert result[9] == '0001-bee.png'
 
 
-def test_sqliteio_write_inserts_new_pixmap_item_jpg(tmpfile, view):
-    item = BeePixmapItem(QtGui.QImage(), filename='bee.jpg')
+@patch('beeref.fileio.snapshot.PixmapItemSnapshot.pixmap_to_bytes',
+       return_value=(b'abc', 'jpg'))
+def test_sqliteio_write_inserts_new_pixmap_item_jpg(bytes_mock, tmpfile, view):
+    item = BeePixmapItem(
+        QtGui.QImage(10, 10, QtGui.QImage.Format.Format_RGB32),
+        filename='bee.jpg')
     view.scene.addItem(item)
-    item.pixmap_to_bytes = MagicMock(return_value=(b'abc', 'jpg'))
     io = SQLiteIO(tmpfile, view.scene, create_new=True)
     io.write()
 
@@ -280,6 +444,38 @@ def test_sqliteio_write_inserts_new_pixmap_item_jpg(tmpfile, view):
     assert result[2] == '0001-bee.jpg'
 
 
+@patch('beeref.fileio.snapshot.PixmapItemSnapshot.pixmap_to_bytes')
+def test_sqliteio_write_inserts_new_pixmap_item_source_data(
+        bytes_mock, tmpfile, view, imgfilename3x3, imgdata3x3, settings):
+    settings.setValue('Items/image_storage_format', 'best')
+    item = BeePixmapItem(QtGui.QImage(imgfilename3x3), filename='bee.png')
+    item.source_data = imgdata3x3
+    view.scene.addItem(item)
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.write()
+
+    bytes_mock.assert_not_called()
+    result = io.fetchone('SELECT data, name, sz FROM sqlar')
+    assert result == (imgdata3x3, '0001-bee.png', len(imgdata3x3))
+
+
+def test_sqliteio_write_inserts_pending_pixmap_item_without_decoding(
+        tmpfile, view, imgdata3x3, settings):
+    settings.setValue('Items/image_storage_format', 'best')
+    item = BeePixmapItem(QtGui.QImage(), filename='bee.png')
+    item.set_lazy_source(MagicMock(return_value=imgdata3x3))
+    item.set_preview_sources({4: MagicMock(return_value=b'thumb')})
+    item.crop = QtCore.QRectF(0, 0, 3, 3)
+    view.scene.addItem(item)
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.write()
+
+    assert item.pixmap_pending is True
+    assert io.fetchone('SELECT data FROM sqlar') == (imgdata3x3,)
+    assert io.fetchall('SELECT factor, data FROM thumbnails') == [
+        (4, b'thumb')]
+
+
 def test_sqliteio_write_inserts_new_pixmap_item_without_filename(
         tmpfile, view, item):
     view.scene.addItem(item)
@@ -330,8 +526,13 @@ def test_sqliteio_write_updates_existing_text_item(tmpfile, view):
     assert result[7] is None
 
 
-def test_sqliteio_write_updates_existing_pixmap_item(tmpfile, view):
-    item = BeePixmapItem(QtGui.QImage(), filename='bee.png')
+@patch('beeref.fileio.snapshot.PixmapItemSnapshot.pixmap_to_bytes',
+       return_value=(b'abc', 'png'))
+def test_sqliteio_write_updates_existing_pixmap_item(
+        bytes_mock, tmpfile, view):
+    item = BeePixmapItem(
+        QtGui.QImage(10, 10, QtGui.QImage.Format.Format_RGB32),
+        filename='bee.png')
     view.scene.addItem(item)
     item.setScale(1.3)
     item.setPos(44, 55)
@@ -340,7 +541,6 @@ def test_sqliteio_write_updates_existing_pixmap_item(tmpfile, view):
     item.setOpacity(0.2)
     item.save_id = 1
     item.crop = QtCore.QRectF(5, 5, 80, 100)
-    item.pixmap_to_bytes = MagicMock(return_value=(b'abc', 'png'))
     io = SQLiteIO(tmpfile, view.scene, create_new=True)
     io.write()
     assert io.fetchone('SELECT COUNT(*) from items') == (1,)
@@ -354,7 +554,7 @@ def test_sqliteio_write_updates_existing_pixmap_item(tmpfile, view):
     item.crop = QtCore.QRectF(1, 2, 30, 40)
     item.grayscale = True
     item.filename = 'new.png'
-    item.pixmap_to_bytes.return_value = b'updated'
+    bytes_mock.return_value = b'updated'
     io.create_new = False
     io.write()
 
@@ -378,8 +578,13 @@ def test_sqliteio_write_updates_existing_pixmap_item(tmpfile, view):
     assert result[7] == b'abc'
 
 
-def test_sqliteio_write_keeps_pixmap_item_of_error_item(tmpfile, view):
-    item = BeePixmapItem(QtGui.QImage(), filename='bee.png')
+@patch('beeref.fileio.snapshot.PixmapItemSnapshot.pixmap_to_bytes',
+       return_value=(b'abc', 'png'))
+def test_sqliteio_write_keeps_pixmap_item_of_error_item(
+        bytes_mock, tmpfile, view):
+    item = BeePixmapItem(
+        QtGui.QImage(10, 10, QtGui.QImage.Format.Format_RGB32),
+        filename='bee.png')
     view.scene.addItem(item)
     item.setScale(1.3)
     item.setPos(44, 55)
@@ -388,7 +593,6 @@ def test_sqliteio_write_keeps_pixmap_item_of_error_item(tmpfile, view):
     item.setOpacity(0.2)
     item.save_id = 1
     item.crop = QtCore.QRectF(5, 5, 80, 100)
-    item.pixmap_to_bytes = MagicMock(return_value=(b'abc', 'png'))
     io = SQLiteIO(tmpfile, view.scene, create_new=True)
     io.write()
     view.scene.removeItem(item)
@@ -451,7 +655,9 @@ def test_sqliteio_write_removes_nonexisting_text_item(tmpfile, view):
 
 
 def test_sqliteio_write_removes_nonexisting_pixmap_item(tmpfile, view):
-    item = BeePixmapItem(QtGui.QImage(), filename='bee.png')
+    item = BeePixmapItem(
+        QtGui.QImage(10, 10, QtGui.QImage.Format.Format_RGB32),
+        filename='bee.png')
     item.setScale(1.3)
     item.setPos(44, 55)
     view.scene.addItem(item)
@@ -471,7 +677,9 @@ def test_sqliteio_write_removes_nonexisting_pixmap_item(tmpfile, view):
 
 
 def test_sqliteio_write_update_recovers_from_borked_file(view, tmpfile):
-    item = BeePixmapItem(QtGui.QImage(), filename='bee.png')
+    item = BeePixmapItem(
+        QtGui.QImage(10, 10, QtGui.QImage.Format.Format_RGB32),
+        filename='bee.png')
     item.save_id = 1
     view.scene.addItem(item)
 
@@ -485,7 +693,9 @@ def test_sqliteio_write_update_recovers_from_borked_file(view, tmpfile):
 
 
 def test_sqliteio_write_update_recovers_from_nonexisting_file(view, tmpfile):
-    item = BeePixmapItem(QtGui.QImage(), filename='bee.png')
+    item = BeePixmapItem(
+        QtGui.QImage(10, 10, QtGui.QImage.Format.Format_RGB32),
+        filename='bee.png')
     item.save_id = 1
     view.scene.addItem(item)
     io = SQLiteIO(tmpfile, view.scene, create_new=False)
@@ -497,7 +707,8 @@ def test_sqliteio_write_update_recovers_from_nonexisting_file(view, tmpfile):
 def test_sqliteio_write_updates_progress(tmpfile, view):
     worker = MagicMock(canceled=False)
     io = SQLiteIO(tmpfile, view.scene, create_new=True, worker=worker)
-    item = BeePixmapItem(QtGui.QImage())
+    item = BeePixmapItem(
+        QtGui.QImage(10, 10, QtGui.QImage.Format.Format_RGB32))
     view.scene.addItem(item)
     io.write()
     worker.begin_processing.emit.assert_called_once_with(1)
@@ -508,9 +719,11 @@ def test_sqliteio_write_updates_progress(tmpfile, view):
 def test_sqliteio_write_canceled(tmpfile, view):
     worker = MagicMock(canceled=True)
     io = SQLiteIO(tmpfile, view.scene, create_new=True, worker=worker)
-    item = BeePixmapItem(QtGui.QImage())
+    item = BeePixmapItem(
+        QtGui.QImage(10, 10, QtGui.QImage.Format.Format_RGB32))
     view.scene.addItem(item)
-    item = BeePixmapItem(QtGui.QImage())
+    item = BeePixmapItem(
+        QtGui.QImage(10, 10, QtGui.QImage.Format.Format_RGB32))
     view.scene.addItem(item)
     io.write()
     worker.begin_processing.emit.assert_called_once_with(2)
@@ -518,6 +731,104 @@ def test_sqliteio_write_canceled(tmpfile, view):
     worker.finished.emit.assert_called_once_with(tmpfile, [])
 
 
+def test_sqliteio_write_sets_saved_row(tmpfile, view):
+    item = BeeTextItem('foo')
+    item.setPos(44, 55)
+    view.scene.addItem(item)
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.write()
+    assert item.saved_row == io.fetchone(
+        'SELECT x, y, z, scale, rotation, flip, data FROM items')
+
+
+def test_sqliteio_write_skips_unchanged_items(tmpfile, view):
+    item = BeeTextItem('foo')
+    view.scene.addItem(item)
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.write()
+
+    io.create_new = False
+    with patch.object(io, 'update_item') as update_mock:
+        io.write()
+        update_mock.assert_not_called()
+    assert io.fetchone('SELECT COUNT(*) from items') == (1,)
+
+
+def test_sqliteio_write_updates_changed_items_only(tmpfile, view):
+    item1 = BeeTextItem('foo')
+    view.scene.addItem(item1)
+    item2 = BeeTextItem('bar')
+    view.scene.addItem(item2)
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.write()
+
+    item2.setPos(20, 30)
+    io.create_new = False
+    with patch.object(io, 'update_item',
+                      wraps=io.update_item) as update_mock:
+        io.write()
+        update_mock.assert_called_once()
+        assert update_mock.call_args[0][0].item == item2
+    assert io.fetchone(
+        'SELECT x, y FROM items WHERE id=?', (item2.save_id,)) == (20, 30)
+
+
+def test_sqliteio_write_reinserts_item_missing_from_file(tmpfile, view):
+    item = BeeTextItem('foo')
+    view.scene.addItem(item)
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.write()
+    io.ex('DELETE FROM items')
+    io.connection.commit()
+
+    io.create_new = False
+    io.write()
+    assert io.fetchone('SELECT data FROM items') == (
+        json.dumps({'text': 'foo'}),)
+
+
+@patch('beeref.fileio.sql.SQLiteIO.vacuum_if_needed')
+def test_sqliteio_write_commits_once(vacuum_mock, tmpfile, view):
+    for i in range(3):
+        view.scene.addItem(BeeTextItem('foo'))
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.create_schema_on_new()
+    io.create_new = False
+    io._connection = MagicMock(wraps=io.connection)
+    io.write()
+    io._connection.commit.assert_called_once_with()
+    vacuum_mock.assert_called_once_with()
+
+
+def test_sqliteio_vacuum_if_needed_when_mostly_unused(tmpfile, view):
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.create_schema_on_new()
+    io.ex('CREATE TABLE filler (data BLOB)')
+    io.exmany('INSERT INTO filler VALUES (?)',
+              [(b'x' * 10000,) for i in range(20)])
+    io.connection.commit()
+    io.ex('DELETE FROM filler')
+    io.connection.commit()
+    assert io.fetchone('PRAGMA freelist_count')[0] > 0
+    io.vacuum_if_needed()
+    assert io.fetchone('PRAGMA freelist_count')[0] == 0
+
+
+def test_sqliteio_vacuum_if_needed_when_mostly_used(tmpfile, view):
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.create_schema_on_new()
+    io.ex('CREATE TABLE filler (data BLOB)')
+    io.exmany('INSERT INTO filler VALUES (?)',
+              [(b'x' * 10000,) for i in range(20)])
+    io.connection.commit()
+    io.ex('DELETE FROM filler WHERE rowid=1')
+    io.connection.commit()
+    free = io.fetchone('PRAGMA freelist_count')[0]
+    assert free > 0
+    io.vacuum_if_needed()
+    assert io.fetchone('PRAGMA freelist_count')[0] == free
+
+
 def test_sqliteio_read_reads_readonly_text_item(tmpfile, view):
     io = SQLiteIO(tmpfile, view.scene, create_new=True)
     io.create_schema_on_new()
@@ -675,3 +986,697 @@ def test_sqliteio_read_raises_error_when_file_empty(view, tmpfile):
 
     # should not create a file on reading!
     assert os.path.isfile(tmpfile) is False
+
+
+def test_sqliteio_read_lazy_defers_decoding(tmpfile, view, imgdata3x3):
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.create_schema_on_new()
+    io.ex('INSERT INTO items '
+          '(type, x, y, z, scale, rotation, flip, data) '
+          'VALUES (?, ?, ?, ?, ?, ?, ?, ?) ',
+          ('pixmap', 22.2, 33.3, 0.22, 3.4, 45, -1,
+           json.dumps({'filename': 'bee.png', 'crop': [0, 0, 3, 3]})))
+    io.ex('INSERT INTO sqlar (item_id, data) VALUES (?, ?)',
+          (1, imgdata3x3))
+    io.connection.commit()
+    del io
+
+    io = SQLiteIO(tmpfile, view.scene, readonly=True, lazy=True)
+    io.read()
+    view.scene.add_queued_items()
+    item = view.scene.items()[0]
+    assert isinstance(item, BeePixmapItem)
+    assert item.pixmap_pending is True
+    assert item.save_id == 1
+    assert item.filename == 'bee.png'
+    assert item.width == 3
+    assert item.height == 3
+    assert item.pixmap().size() == QtCore.QSize(3, 3)
+    assert item.pixmap_pending is False
+    assert item.crop == QtCore.QRectF(0, 0, 3, 3)
+
+
+def test_sqliteio_read_lazy_decodes_items_without_crop(
+        tmpfile, view, imgdata3x3):
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.create_schema_on_new()
+    io.ex('INSERT INTO items '
+          '(type, x, y, z, scale, rotation, flip, data) '
+          'VALUES (?, ?, ?, ?, ?, ?, ?, ?) ',
+          ('pixmap', 22.2, 33.3, 0.22, 3.4, 45, -1,
+           json.dumps({'filename': 'bee.png'})))
+    io.ex('INSERT INTO sqlar (item_id, data) VALUES (?, ?)',
+          (1, imgdata3x3))
+    io.connection.commit()
+    del io
+
+    io = SQLiteIO(tmpfile, view.scene, readonly=True, lazy=True)
+    io.read()
+    view.scene.add_queued_items()
+    item = view.scene.items()[0]
+    assert item.pixmap_pending is False
+    assert item.width == 3
+    assert item.height == 3
+
+
+@patch('beeref.items.BeeTiledPixmapItem.TILING_MIN_SIZE', 500)
+def test_sqliteio_write_and_read_tiled_item(
+        tmpfile, view, tiled_item, jpgdata600x400, settings):
+    settings.setValue('Items/image_storage_format', 'png')
+    view.scene.addItem(tiled_item)
+    tiled_item.crop = QtCore.QRectF(10, 20, 50, 60)
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.write()
+    assert io.fetchone('SELECT data FROM sqlar')[0] == jpgdata600x400
+    assert io.fetchall('SELECT factor FROM thumbnails') == [(4,), (16,)]
+    del io
+    view.scene.clear()
+
+    io = SQLiteIO(tmpfile, view.scene, readonly=True, lazy=True)
+    io.read()
+    view.scene.add_queued_items()
+    item = view.scene.items()[0]
+    assert isinstance(item, BeeTiledPixmapItem)
+    assert item.source_data == jpgdata600x400
+    assert item.image_size() == QtCore.QSize(600, 400)
+    assert item.crop == QtCore.QRectF(10, 20, 50, 60)
+    assert item.save_id == 1
+    assert item.blob_hash == hashlib.sha256(jpgdata600x400).hexdigest()
+
+
+def test_sqliteio_read_tiled_item_when_tiling_not_needed(
+        tmpfile, view, tiled_item):
+    view.scene.addItem(tiled_item)
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.write()
+    del io
+    view.scene.clear()
+
+    io = SQLiteIO(tmpfile, view.scene, readonly=True, lazy=True)
+    io.read()
+    view.scene.add_queued_items()
+    item = view.scene.items()[0]
+    assert type(item) is BeePixmapItem
+    assert item.pixmap_pending is False
+    assert item.pixmap().size() == QtCore.QSize(600, 400)
+
+
+def test_lazy_blob_fetches_data(tmpfile, view, imgdata3x3):
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.create_schema_on_new()
+    io.ex('INSERT INTO items (type) VALUES (?)', ('pixmap',))
+    io.ex('INSERT INTO sqlar (item_id, data) VALUES (?, ?)',
+          (1, imgdata3x3))
+    io.connection.commit()
+    assert LazyBlob(tmpfile, 1)() == imgdata3x3
+
+
+def test_lazy_blob_fetches_data_by_hash(tmpfile, view, imgdata3x3):
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.create_schema_on_new()
+    io.ex('INSERT INTO items (type) VALUES (?)', ('pixmap',))
+    io.ex('INSERT INTO items (type) VALUES (?)', ('pixmap',))
+    io.ex('INSERT INTO sqlar (item_id, data, hash) VALUES (?, ?, ?)',
+          (2, imgdata3x3, 'abc'))
+    io.connection.commit()
+    # The item id might have changed since loading:
+    assert LazyBlob(tmpfile, 1, blob_hash='abc')() == imgdata3x3
+
+
+def test_write_keeps_thumbnails_of_dropped_image(tmpfile, view):
+    item = BeePixmapItem(
+        QtGui.QImage(1000, 600, QtGui.QImage.Format.Format_RGB32))
+    item.source_data = item.pixmap_to_bytes()[0]
+    view.scene.addItem(item)
+    assert item.drop_pixmap() is True
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.write()
+    result = io.fetchall('SELECT factor FROM thumbnails ORDER BY factor')
+    assert result == [(4,), (16,)]
+    assert item.pixmap_pending is True
+
+
+def test_sqliteio_write_releases_source_data(
+        tmpfile, view, imgfilename3x3, imgdata3x3, settings):
+    settings.setValue('Items/image_storage_format', 'best')
+    item = BeePixmapItem(QtGui.QImage(imgfilename3x3), filename='bee.png')
+    item.source_data = imgdata3x3
+    view.scene.addItem(item)
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.write()
+    assert item.source_data is None
+    assert item.pixmap_memory() == 3 * 3 * 4
+    assert isinstance(item.blob_source, LazyBlob)
+    assert item.blob_source() == imgdata3x3
+    assert item.drop_pixmap() is True
+    assert item.pixmap().size() == QtCore.QSize(3, 3)
+
+
+def test_sqliteio_write_releases_source_data_of_dropped_image(
+        tmpfile, view, imgfilename3x3, imgdata3x3, settings):
+    settings.setValue('Items/image_storage_format', 'best')
+    item = BeePixmapItem(QtGui.QImage(imgfilename3x3), filename='bee.png')
+    item.source_data = imgdata3x3
+    view.scene.addItem(item)
+    assert item.drop_pixmap() is True
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.write()
+    assert item.source_data is None
+    assert item.pixmap_memory() == 0
+    assert item.pixmap().size() == QtCore.QSize(3, 3)
+
+
+def test_sqliteio_write_keeps_source_data_when_requested(
+        tmpfile, view, imgfilename3x3, imgdata3x3, settings):
+    settings.setValue('Items/image_storage_format', 'best')
+    item = BeePixmapItem(QtGui.QImage(imgfilename3x3), filename='bee.png')
+    item.source_data = imgdata3x3
+    view.scene.addItem(item)
+    io = SQLiteIO(tmpfile, view.scene, create_new=True,
+                  keep_source_data=True)
+    io.write()
+    assert item.source_data == imgdata3x3
+    assert item.blob_source is None
+
+
+def test_sqliteio_write_keeps_source_data_when_stored_differently(
+        tmpfile, view, imgfilename3x3, imgdata3x3, settings):
+    settings.setValue('Items/image_storage_format', 'jpg')
+    item = BeePixmapItem(QtGui.QImage(imgfilename3x3), filename='bee.png')
+    item.source_data = imgdata3x3
+    view.scene.addItem(item)
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.write()
+    assert item.source_data == imgdata3x3
+    assert item.blob_source is None
+
+
+def test_sqliteio_write_keeps_source_data_of_tiled_images(
+        tmpfile, view, jpgdata600x400):
+    item = BeeTiledPixmapItem(jpgdata600x400)
+    view.scene.addItem(item)
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.write()
+    # Tiles are decoded from the data all the time
+    assert item.source_data == jpgdata600x400
+
+
+def test_sqliteio_write_detaches_images_of_deleted_items(
+        tmpfile, view, imgfilename3x3, imgdata3x3, settings):
+    settings.setValue('Items/image_storage_format', 'best')
+    item = BeePixmapItem(QtGui.QImage(imgfilename3x3), filename='bee.png')
+    item.source_data = imgdata3x3
+    view.scene.addItem(item)
+    SQLiteIO(tmpfile, view.scene, create_new=True).write()
+    assert item.source_data is None
+    view.scene.removeItem(item)
+    io = SQLiteIO(tmpfile, view.scene)
+    io.write()
+    assert io.fetchone('SELECT COUNT(*) FROM sqlar') == (0,)
+    # The item can still be restored, e.g. via undo:
+    assert item.blob_source.data == imgdata3x3
+    assert item.encoded_memory() == len(imgdata3x3)
+    assert item.drop_pixmap() is True
+    assert item.pixmap().size() == QtCore.QSize(3, 3)
+
+
+def test_sqliteio_write_doesnt_detach_images_still_in_use(
+        tmpfile, view, imgfilename3x3, imgdata3x3, settings):
+    settings.setValue('Items/image_storage_format', 'best')
+    item = BeePixmapItem(QtGui.QImage(imgfilename3x3), filename='bee.png')
+    item.source_data = imgdata3x3
+    view.scene.addItem(item)
+    copy = item.create_copy()
+    view.scene.addItem(copy)
+    SQLiteIO(tmpfile, view.scene, create_new=True).write()
+    view.scene.removeItem(item)
+    io = SQLiteIO(tmpfile, view.scene)
+    io.write()
+    assert io.fetchone('SELECT COUNT(*) FROM sqlar') == (1,)
+    assert item.blob_source.data is None
+    assert copy.blob_source.data is None
+
+
+def test_lazy_blob_raises_when_no_data(tmpfile, view):
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.create_schema_on_new()
+    io.connection.commit()
+    with pytest.raises(BeeFileIOError):
+        LazyBlob(tmpfile, 1)()
+
+
+def test_sqliteio_write_create_new_keeps_lazy_items_of_same_file(
+        tmpfile, view, imgdata3x3):
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.create_schema_on_new()
+    io.ex('INSERT INTO items (type) VALUES (?)', ('pixmap',))
+    io.ex('INSERT INTO sqlar (item_id, data) VALUES (?, ?)',
+          (1, imgdata3x3))
+    io.connection.commit()
+    del io
+
+    item = BeePixmapItem(QtGui.QImage())
+    item.save_id = 1
+    item.set_lazy_source(LazyBlob(tmpfile, 1))
+    view.scene.addItem(item)
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.write()
+    assert item.blob_source.data == imgdata3x3
+    assert item.pixmap().size() == QtCore.QSize(3, 3)
+
+
+def test_sqliteio_write_relinks_copies_of_lazy_items_from_older_files(
+        tmpfile, view, imgdata3x3):
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.create_schema_on_new()
+    io.ex('INSERT INTO items (type) VALUES (?)', ('pixmap',))
+    io.ex('INSERT INTO sqlar (item_id, data) VALUES (?, ?)',
+          (1, imgdata3x3))
+    io.connection.commit()
+    del io
+
+    item = BeePixmapItem(QtGui.QImage())
+    item.crop = QtCore.QRectF(0, 0, 3, 3)
+    item.save_id = 1
+    item.set_lazy_source(LazyBlob(tmpfile, 1))
+    view.scene.addItem(item)
+    copy = item.create_copy()
+    view.scene.addItem(copy)
+    io = SQLiteIO(tmpfile, view.scene)
+    io.write()
+    assert copy.blob_source.blob_hash == copy.blob_hash
+    assert item.blob_source.blob_hash is None
+
+    view.scene.removeItem(item)
+    io = SQLiteIO(tmpfile, view.scene)
+    io.write()
+    assert io.fetchone('SELECT COUNT(*) FROM sqlar') == (1,)
+    assert copy.pixmap().size() == QtCore.QSize(3, 3)
+
+
+def test_sqliteio_write_and_read_color_gamut(tmpfile, view):
+    item = BeePixmapItem(
+        QtGui.QImage(10, 10, QtGui.QImage.Format.Format_RGB32))
+    item.set_color_gamut({(120, 255): 2, (0, 255): 3})
+    view.scene.addItem(item)
+    view.scene.addItem(item.create_copy())
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.write()
+    assert io.fetchall('SELECT hash, data FROM color_gamuts') == [
+        (item.blob_hash, '[[0, 255, 3], [120, 255, 2]]')]
+    assert 'color_gamut' not in io.fetchone('SELECT data FROM items')[0]
+    view.scene.clear()
+
+    io = SQLiteIO(tmpfile, view.scene, readonly=True)
+    io.read()
+    view.scene.add_queued_items()
+    for item in view.scene.items():
+        assert item.color_gamut == {(120, 255): 2, (0, 255): 3}
+
+
+def test_sqliteio_write_color_gamut_of_saved_item(tmpfile, view):
+    item = BeePixmapItem(
+        QtGui.QImage(10, 10, QtGui.QImage.Format.Format_RGB32))
+    view.scene.addItem(item)
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.write()
+    assert io.fetchone('SELECT COUNT(*) FROM color_gamuts') == (0,)
+
+    item.set_color_gamut({(0, 255): 3})
+    io.create_new = False
+    with patch.object(io, 'update_item') as update_mock:
+        io.write()
+        update_mock.assert_not_called()
+    assert io.fetchone('SELECT COUNT(*) FROM color_gamuts') == (1,)
+
+
+def test_sqliteio_write_removes_color_gamut_of_deleted_image(
+        tmpfile, view):
+    item = BeePixmapItem(
+        QtGui.QImage(10, 10, QtGui.QImage.Format.Format_RGB32))
+    item.set_color_gamut({(0, 255): 3})
+    view.scene.addItem(item)
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.write()
+    view.scene.removeItem(item)
+    io.create_new = False
+    io.write()
+    assert io.fetchone('SELECT COUNT(*) FROM color_gamuts') == (0,)
+
+
+def test_sqliteio_write_refuses_image_without_data(tmpfile, view):
+    item = BeePixmapItem(QtGui.QImage())
+    view.scene.addItem(item)
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    with pytest.raises(BeeFileIOError):
+        io.write()
+
+
+def test_sqliteio_write_refuses_unreadable_lazy_image(tmpfile, view):
+    item = BeePixmapItem(QtGui.QImage())
+    item.crop = QtCore.QRectF(0, 0, 3, 3)
+    item.set_lazy_source(MagicMock(return_value=b''))
+    view.scene.addItem(item)
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    with pytest.raises(BeeFileIOError):
+        io.write()
+
+
+def test_sqliteio_write_inserts_thumbnails(tmpfile, view):
+    item = BeePixmapItem(
+        QtGui.QImage(1000, 600, QtGui.QImage.Format.Format_RGB32))
+    view.scene.addItem(item)
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.write()
+    result = io.fetchall(
+        'SELECT item_id, factor, data FROM thumbnails ORDER BY factor')
+    assert [r[:2] for r in result] == [(1, 4), (1, 16)]
+    img = QtGui.QImage.fromData(result[0][2])
+    assert img.size() == QtCore.QSize(250, 150)
+
+
+def test_sqliteio_write_adds_missing_thumbnails(tmpfile, view):
+    item = BeePixmapItem(
+        QtGui.QImage(1000, 600, QtGui.QImage.Format.Format_RGB32))
+    view.scene.addItem(item)
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.write()
+    io.ex('DELETE FROM thumbnails')
+    io.connection.commit()
+
+    io.create_new = False
+    io.write()
+    assert io.fetchone('SELECT COUNT(*) FROM thumbnails') == (2,)
+
+
+def test_sqliteio_write_doesnt_decode_for_missing_thumbnails(
+        tmpfile, view):
+    item = BeePixmapItem(QtGui.QImage())
+    item.crop = QtCore.QRectF(0, 0, 1000, 600)
+    view.scene.addItem(item)
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.create_schema_on_new()
+    io.ex('INSERT INTO items (type) VALUES (?)', ('pixmap',))
+    io.connection.commit()
+    item.save_id = 1
+    item.set_lazy_source(MagicMock())
+    io.create_new = False
+    io.write()
+    item.blob_source.assert_not_called()
+    assert io.fetchone('SELECT COUNT(*) FROM thumbnails') == (0,)
+
+
+def test_sqliteio_write_removes_thumbnails_of_nonexisting_item(
+        tmpfile, view):
+    item = BeePixmapItem(
+        QtGui.QImage(1000, 600, QtGui.QImage.Format.Format_RGB32))
+    view.scene.addItem(item)
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.write()
+    view.scene.removeItem(item)
+    io.create_new = False
+    io.write()
+    assert io.fetchone('SELECT COUNT(*) FROM thumbnails') == (0,)
+
+
+def test_sqliteio_read_lazy_sets_preview_sources(tmpfile, view):
+    item = BeePixmapItem(
+        QtGui.QImage(1000, 600, QtGui.QImage.Format.Format_RGB32))
+    view.scene.addItem(item)
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.write()
+    del io
+    view.scene.clear()
+
+    io = SQLiteIO(tmpfile, view.scene, readonly=True, lazy=True)
+    io.read()
+    view.scene.add_queued_items()
+    item = view.scene.items()[0]
+    assert item.pixmap_pending is True
+    assert sorted(item.preview_sources.keys()) == [4, 16]
+    data = item.preview_sources[16]()
+    assert QtGui.QImage.fromData(data).size() == QtCore.QSize(62, 38)
+
+
+def test_sqliteio_write_stores_duplicate_images_once(
+        tmpfile, view, imgfilename3x3, imgdata3x3, settings):
+    settings.setValue('Items/image_storage_format', 'best')
+    item1 = BeePixmapItem(QtGui.QImage(imgfilename3x3), filename='bee.png')
+    item1.source_data = imgdata3x3
+    view.scene.addItem(item1)
+    item2 = item1.create_copy()
+    view.scene.addItem(item2)
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.write()
+
+    assert io.fetchone('SELECT COUNT(*) FROM sqlar') == (1,)
+    result = io.fetchall('SELECT id, blob_id FROM items ORDER BY id')
+    owner = io.fetchone('SELECT item_id FROM sqlar')[0]
+    assert result == [(1, owner), (2, owner)]
+    assert item1.blob_hash == item2.blob_hash
+    assert io.fetchone('SELECT hash FROM sqlar') == (item1.blob_hash,)
+
+
+def test_sqliteio_write_dedupes_without_encoding_when_hash_known(
+        tmpfile, view, imgfilename3x3):
+    item1 = BeePixmapItem(QtGui.QImage(imgfilename3x3), filename='bee.png')
+    view.scene.addItem(item1)
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.write()
+
+    item2 = item1.create_copy()
+    view.scene.addItem(item2)
+    io.create_new = False
+    with patch('beeref.fileio.snapshot.PixmapItemSnapshot.pixmap_to_bytes'
+               ) as bytes_mock:
+        io.write()
+        bytes_mock.assert_not_called()
+    assert io.fetchone('SELECT COUNT(*) FROM sqlar') == (1,)
+    assert io.fetchone(
+        'SELECT blob_id FROM items WHERE id=?', (item2.save_id,)) == (1,)
+
+
+def test_sqliteio_encode_image_when_text_item(view):
+    snapshot = ItemSnapshot(BeeTextItem('foo'))
+    assert SQLiteIO.encode_image(snapshot) is None
+
+
+def test_sqliteio_encode_image_when_hash_known(view, item):
+    item.blob_hash = 'abc'
+    snapshot = PixmapItemSnapshot(item)
+    assert SQLiteIO.encode_image(snapshot, known_hashes={'abc'}) is None
+
+
+def test_sqliteio_encode_image(view, settings):
+    settings.setValue('Items/image_storage_format', 'png')
+    item = BeePixmapItem(
+        QtGui.QImage(200, 200, QtGui.QImage.Format.Format_RGB32))
+    snapshot = PixmapItemSnapshot(item)
+    data, imgformat, blob_hash, thumbnails = SQLiteIO.encode_image(snapshot)
+    assert data.startswith(b'\x89PNG')
+    assert imgformat == 'png'
+    assert blob_hash == hashlib.sha256(data).hexdigest()
+    assert [factor for factor, data in thumbnails] == [4]
+
+
+def test_sqliteio_write_encodes_images_in_parallel(
+        tmpfile, view, imgfilename3x3):
+    items = []
+    for i in range(5):
+        img = QtGui.QImage(5, 5, QtGui.QImage.Format.Format_RGB32)
+        img.fill(QtGui.QColor(i * 40, 0, 0))
+        item = BeePixmapItem(img)
+        view.scene.addItem(item)
+        items.append(item)
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    with patch('beeref.fileio.sql.parallel_map',
+               wraps=sql.parallel_map) as map_mock:
+        io.write()
+        map_mock.assert_called_once()
+    for i, item in enumerate(items):
+        data = io.fetchone(
+            'SELECT data FROM sqlar WHERE item_id=?', (item.save_id,))[0]
+        img = QtGui.QImage.fromData(data)
+        assert img.pixelColor(0, 0).red() == i * 40
+
+
+def test_sqliteio_write_stores_different_images_separately(
+        tmpfile, view, imgfilename3x3):
+    item1 = BeePixmapItem(QtGui.QImage(imgfilename3x3), filename='bee.png')
+    view.scene.addItem(item1)
+    item2 = BeePixmapItem(
+        QtGui.QImage(5, 5, QtGui.QImage.Format.Format_RGB32))
+    view.scene.addItem(item2)
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.write()
+
+    assert io.fetchone('SELECT COUNT(*) FROM sqlar') == (2,)
+    assert item1.blob_hash != item2.blob_hash
+
+
+def test_sqliteio_write_deleting_shared_image_owner_hands_over_image(
+        tmpfile, view):
+    item1 = BeePixmapItem(
+        QtGui.QImage(1000, 600, QtGui.QImage.Format.Format_RGB32))
+    view.scene.addItem(item1)
+    item2 = item1.create_copy()
+    view.scene.addItem(item2)
+    item3 = item1.create_copy()
+    view.scene.addItem(item3)
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.write()
+    owner = io.fetchone('SELECT item_id FROM sqlar')[0]
+    assert owner == item1.save_id
+
+    view.scene.removeItem(item1)
+    io.create_new = False
+    io.write()
+
+    assert io.fetchone('SELECT item_id FROM sqlar') == (item2.save_id,)
+    assert io.fetchall('SELECT DISTINCT item_id FROM thumbnails') == [
+        (item2.save_id,)]
+    assert io.fetchall('SELECT blob_id FROM items') == [
+        (item2.save_id,), (item2.save_id,)]
+
+
+def test_sqliteio_write_deleting_all_users_of_shared_image(tmpfile, view):
+    item1 = BeePixmapItem(
+        QtGui.QImage(1000, 600, QtGui.QImage.Format.Format_RGB32))
+    view.scene.addItem(item1)
+    item2 = item1.create_copy()
+    view.scene.addItem(item2)
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.write()
+
+    view.scene.removeItem(item1)
+    view.scene.removeItem(item2)
+    io.create_new = False
+    io.write()
+
+    assert io.fetchone('SELECT COUNT(*) FROM items') == (0,)
+    assert io.fetchone('SELECT COUNT(*) FROM sqlar') == (0,)
+    assert io.fetchone('SELECT COUNT(*) FROM thumbnails') == (0,)
+
+
+def test_sqliteio_read_shared_images(tmpfile, view, imgfilename3x3):
+    item1 = BeePixmapItem(QtGui.QImage(imgfilename3x3), filename='bee.png')
+    view.scene.addItem(item1)
+    view.scene.addItem(item1.create_copy())
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.write()
+    blob_hash = item1.blob_hash
+    del io
+    view.scene.clear()
+
+    io = SQLiteIO(tmpfile, view.scene, readonly=True)
+    io.read()
+    view.scene.add_queued_items()
+    items = view.scene.items()
+    assert len(items) == 2
+    for item in items:
+        assert item.width == 3
+        assert item.blob_hash == blob_hash
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_sqliteio_write_doesnt_update_unchanged_items_after_read(
+        tmpfile, view, lazy):
+    item = BeePixmapItem(
+        QtGui.QImage(1000, 600, QtGui.QImage.Format.Format_RGB32))
+    item.setPos(20.5, 30)
+    item.setRotation(33)
+    item.setScale(1.7)
+    item.do_flip()
+    item.setOpacity(0.5)
+    view.scene.addItem(item)
+    view.scene.addItem(BeeTextItem('foo'))
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.write()
+    del io
+    view.scene.clear()
+
+    io = SQLiteIO(tmpfile, view.scene, readonly=True, lazy=lazy)
+    io.read()
+    view.scene.add_queued_items()
+    io = SQLiteIO(tmpfile, view.scene)
+    with patch.object(io, 'update_item') as update_mock:
+        io.write()
+        update_mock.assert_not_called()
+
+    next(view.scene.items_by_type(BeePixmapItem.TYPE)).setPos(0, 0)
+    with patch.object(io, 'update_item') as update_mock:
+        io.write()
+        update_mock.assert_called_once()
+
+
+def test_sqliteio_read_lazy_shared_images(tmpfile, view):
+    item1 = BeePixmapItem(
+        QtGui.QImage(1000, 600, QtGui.QImage.Format.Format_RGB32))
+    view.scene.addItem(item1)
+    view.scene.addItem(item1.create_copy())
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.write()
+    del io
+    view.scene.clear()
+
+    io = SQLiteIO(tmpfile, view.scene, readonly=True, lazy=True)
+    io.read()
+    view.scene.add_queued_items()
+    items = view.scene.items()
+    assert len(items) == 2
+    for item in items:
+        assert item.pixmap_pending is True
+        assert item.blob_source.save_id == 1
+        assert set(item.preview_sources.keys()) == {4, 16}
+        assert item.pixmap().size() == QtCore.QSize(1000, 600)
+
+
+def test_sqliteio_read_doesnt_fetch_all_image_data_at_once(
+        tmpfile, view, imgfilename3x3):
+    item = BeePixmapItem(QtGui.QImage(imgfilename3x3), filename='bee.png')
+    view.scene.addItem(item)
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.write()
+    del io
+    view.scene.clear()
+
+    io = SQLiteIO(tmpfile, view.scene, readonly=True)
+    with patch.object(io, 'fetchall', wraps=io.fetchall) as fetchall_mock:
+        io.read()
+        for call in fetchall_mock.call_args_list:
+            assert 'sqlar.data' not in call[0][0]
+    view.scene.add_queued_items()
+    assert view.scene.items()[0].width == 3
+
+
+def test_sqliteio_iter_item_data_fetches_image_data_one_by_one(
+        tmpfile, view):
+    for i in range(3):
+        item = BeePixmapItem(
+            QtGui.QImage(i + 1, 3, QtGui.QImage.Format.Format_RGB32))
+        view.scene.addItem(item)
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    io.write()
+
+    rows = [(i, 'pixmap', 0, 0, 0, 1, 0, 1, '{}', i, None)
+            for i in (1, 2, 3)]
+    with patch.object(io, 'fetchone', wraps=io.fetchone) as fetchone_mock:
+        gen = io.iter_item_data(rows)
+        data, blob = next(gen)
+        assert fetchone_mock.call_count == 1
+        assert data['save_id'] == 1
+        assert QtGui.QImage.fromData(blob).width() == 1
+        data, blob = next(gen)
+        assert fetchone_mock.call_count == 2
+        assert QtGui.QImage.fromData(blob).width() == 2
+
+
+def test_sqliteio_iter_item_data_text_item(tmpfile, view):
+    io = SQLiteIO(tmpfile, view.scene, create_new=True)
+    rows = [(1, 'text', 0, 0, 0, 1, 0, 1, '{"text": "foo"}', None, None)]
+    with patch.object(io, 'fetchone') as fetchone_mock:
+        data, blob = next(io.iter_item_data(rows))
+        fetchone_mock.assert_not_called()
+    assert blob is None
+    assert data['data'] == {'text': 'foo'}
+    assert data['saved_row'] == (0, 0, 0, 1, 0, 1, '{"text": "foo"}')
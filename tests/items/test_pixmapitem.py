@@ -1,10 +1,14 @@
+from collections import defaultdict
 import pytest
+import time
 from unittest.mock import patch, MagicMock
 
 from PyQt6 import QtCore, QtGui, QtWidgets
 from PyQt6.QtCore import Qt
 
+from beeref.fileio.errors import BeeFileIOError
 from beeref.items import BeePixmapItem, item_registry
+from beeref.utils import image_to_bytes
 
 
 def test_in_item_registry():
@@ -65,11 +69,59 @@ def test_set_grayscale_true(qapp, item):
     assert item._grayscale_pixmap is not None
 
 
+def test_set_grayscale_true_in_scene_converts_later(view, item):
+    view.scene.addItem(item)
+    view.scene.convert_grayscale_later = MagicMock()
+    item.grayscale = True
+    view.scene.convert_grayscale_later.assert_called_once_with(item)
+    assert item._grayscale_pixmap is None
+
+
+def test_set_grayscale_true_uses_cache(view, item):
+    view.scene.addItem(item)
+    pixmap = QtGui.QPixmap(10, 10)
+    item._grayscale_pixmap = pixmap
+    view.scene.convert_grayscale_later = MagicMock()
+    item.grayscale = True
+    view.scene.convert_grayscale_later.assert_not_called()
+    assert item._grayscale_pixmap is pixmap
+
+
 def test_set_grayscale_false(qapp, item):
-    item._grayscale_pixmap = QtGui.QPixmap()
+    pixmap = QtGui.QPixmap()
+    item._grayscale_pixmap = pixmap
     item.grayscale = False
     assert item.grayscale is False
+    # Kept for toggling grayscale again:
+    assert item._grayscale_pixmap is pixmap
+
+
+def test_set_grayscale_image(qapp, item):
+    item.update = MagicMock()
+    img = QtGui.QImage(10, 10, QtGui.QImage.Format.Format_Grayscale8)
+    item.set_grayscale_image(img, item.pixmap_key())
+    assert item._grayscale_pixmap.size() == QtCore.QSize(10, 10)
+    item.update.assert_called_once_with()
+
+
+def test_set_grayscale_image_when_image_changed(qapp, item):
+    key = item.pixmap_key()
+    item.setPixmap(QtGui.QPixmap(20, 20))
+    img = QtGui.QImage(10, 10, QtGui.QImage.Format.Format_Grayscale8)
+    item.set_grayscale_image(img, key)
+    assert item._grayscale_pixmap is None
+
+
+def test_set_pixmap_converts_grayscale_again(qapp, item):
+    item.grayscale = True
+    item.setPixmap(QtGui.QPixmap(20, 20))
+    assert item._grayscale_pixmap.size() == QtCore.QSize(20, 20)
+
+
+def test_get_grayscale_pixmap_converts_right_away(qapp, item):
+    item.setPixmap(QtGui.QPixmap(20, 20))
     assert item._grayscale_pixmap is None
+    assert item.get_grayscale_pixmap().size() == QtCore.QSize(20, 20)
 
 
 def test_bounding_rect_unselected(qapp, imgfilename3x3):
@@ -270,6 +322,17 @@ def test_pixmap_to_bytes_apply_grayscale_crop_when_not_set(
     assert img.size() == QtCore.QSize(3, 3)
 
 
+def test_image_for_export(qapp, imgfilename3x3):
+    item = BeePixmapItem(QtGui.QImage(imgfilename3x3))
+    item.crop = QtCore.QRectF(0, 0, 2, 2)
+    item.grayscale = True
+    img, imgformat = item.image_for_export(apply_grayscale=True,
+                                           apply_crop=True)
+    assert imgformat == 'png'
+    assert img.allGray() is True
+    assert img.size() == QtCore.QSize(2, 2)
+
+
 def test_pixmap_from_bytes(qapp, item, imgfilename3x3):
     with open(imgfilename3x3, 'rb') as f:
         imgdata = f.read()
@@ -390,6 +453,122 @@ def test_create_from_data_with_grayscale(item):
     assert item.grayscale is True
 
 
+def test_get_source_data_png(qapp, settings, item, imgdata3x3):
+    settings.setValue('Items/image_storage_format', 'best')
+    item.source_data = imgdata3x3
+    assert item.get_source_data() == (imgdata3x3, 'png')
+
+
+def test_get_source_data_jpg(qapp, settings, item):
+    settings.setValue('Items/image_storage_format', 'best')
+    img = QtGui.QImage(3, 3, QtGui.QImage.Format.Format_RGB32)
+    data = image_to_bytes(img, 'jpg')
+    item.source_data = data
+    assert item.get_source_data() == (data, 'jpg')
+
+
+def test_get_source_data_when_no_data(qapp, settings, item):
+    settings.setValue('Items/image_storage_format', 'best')
+    assert item.get_source_data() is None
+
+
+def test_get_source_data_when_unsupported_format(qapp, settings, item):
+    settings.setValue('Items/image_storage_format', 'best')
+    img = QtGui.QImage(3, 3, QtGui.QImage.Format.Format_RGB32)
+    item.source_data = image_to_bytes(img, 'bmp')
+    assert item.get_source_data() is None
+
+
+def test_get_source_data_when_setting_not_best(
+        qapp, settings, item, imgdata3x3):
+    settings.setValue('Items/image_storage_format', 'jpg')
+    item.source_data = imgdata3x3
+    assert item.get_source_data() is None
+
+
+def test_get_source_data_when_pixmap_pending(qapp, settings, imgdata3x3):
+    settings.setValue('Items/image_storage_format', 'best')
+    item = BeePixmapItem(QtGui.QImage())
+    item.set_lazy_source(MagicMock(return_value=imgdata3x3))
+    assert item.get_source_data() == (imgdata3x3, 'png')
+    assert item.pixmap_pending is True
+
+
+def test_get_source_data_when_decoded_from_blob_source(
+        qapp, settings, imgdata3x3):
+    settings.setValue('Items/image_storage_format', 'best')
+    item = BeePixmapItem(QtGui.QImage())
+    item.set_lazy_source(MagicMock(return_value=imgdata3x3))
+    item.load_pending_pixmap()
+    assert item.pixmap_pending is False
+    assert item.get_source_data() == (imgdata3x3, 'png')
+
+
+def test_encoded_memory_counts_detached_data(qapp, imgdata3x3):
+    item = BeePixmapItem(QtGui.QImage())
+    item.set_lazy_source(MagicMock(data=imgdata3x3))
+    assert item.encoded_memory() == len(imgdata3x3)
+    assert item.pixmap_memory() == len(imgdata3x3)
+
+
+def test_image_for_export_when_pixmap_pending(qapp, settings, imgdata3x3):
+    settings.setValue('Items/image_storage_format', 'best')
+    item = BeePixmapItem(QtGui.QImage())
+    item.set_lazy_source(MagicMock(return_value=imgdata3x3))
+    item.crop = QtCore.QRectF(0, 0, 2, 2)
+    item.grayscale = True
+    img, imgformat = item.image_for_export(apply_grayscale=True,
+                                           apply_crop=True)
+    assert imgformat == 'png'
+    assert img.size() == QtCore.QSize(2, 2)
+    assert img.allGray() is True
+    # The item itself is left alone:
+    assert item.pixmap_pending is True
+
+
+def test_export_image_source_doesnt_touch_item(qapp, settings, imgdata3x3):
+    item = BeePixmapItem(QtGui.QImage())
+    source = MagicMock(return_value=imgdata3x3)
+    item.set_lazy_source(source)
+    export_source = item.export_image_source()
+    source.assert_not_called()
+    item.set_decoded_image = MagicMock()
+    img, imgformat = export_source()
+    assert img.size() == QtCore.QSize(3, 3)
+    item.set_decoded_image.assert_not_called()
+
+
+def test_get_source_data_when_pixmap_pending_errors(qapp, settings):
+    settings.setValue('Items/image_storage_format', 'best')
+    item = BeePixmapItem(QtGui.QImage())
+    item.set_lazy_source(MagicMock(side_effect=BeeFileIOError('foo', 'bar')))
+    assert item.get_source_data() is None
+
+
+def test_set_pixmap_clears_source_data(qapp, item, imgdata3x3):
+    item.source_data = imgdata3x3
+    item.setPixmap(QtGui.QPixmap())
+    assert item.source_data is None
+
+
+def test_create_copy_keeps_source_data(qapp, item, imgdata3x3):
+    item.source_data = imgdata3x3
+    copy = item.create_copy()
+    assert copy.source_data == imgdata3x3
+
+
+def test_set_pixmap_clears_blob_hash(qapp, item):
+    item.blob_hash = 'abc'
+    item.setPixmap(QtGui.QPixmap())
+    assert item.blob_hash is None
+
+
+def test_create_copy_keeps_blob_hash(qapp, item):
+    item.blob_hash = 'abc'
+    copy = item.create_copy()
+    assert copy.blob_hash == 'abc'
+
+
 def test_create_copy(qapp, imgfilename3x3):
     item = BeePixmapItem(QtGui.QImage(imgfilename3x3), 'foo.png')
     item.setPos(20, 30)
@@ -414,6 +593,133 @@ def test_create_copy(qapp, imgfilename3x3):
     assert copy.grayscale is True
 
 
+def test_create_copy_when_pixmap_pending(qapp, imgdata3x3):
+    item = BeePixmapItem(QtGui.QImage(), 'foo.png')
+    source = MagicMock(return_value=imgdata3x3)
+    item.set_lazy_source(source)
+    item.crop = QtCore.QRectF(0, 0, 3, 3)
+
+    copy = item.create_copy()
+    source.assert_not_called()
+    assert copy.pixmap_pending is True
+    assert copy.blob_source is source
+    assert copy.crop == QtCore.QRectF(0, 0, 3, 3)
+
+
+def test_pixmap_decodes_pending_image(qapp, imgdata3x3):
+    item = BeePixmapItem(QtGui.QImage())
+    item.set_lazy_source(MagicMock(return_value=imgdata3x3))
+    item.crop = QtCore.QRectF(1, 1, 2, 2)
+    assert item.pixmap_pending is True
+    assert item.pixmap().size() == QtCore.QSize(3, 3)
+    assert item.pixmap_pending is False
+    assert item.crop == QtCore.QRectF(1, 1, 2, 2)
+    item.blob_source.assert_called_once_with()
+
+
+def test_pixmap_pending_image_when_decoding_fails(qapp):
+    item = BeePixmapItem(QtGui.QImage())
+    item.set_lazy_source(MagicMock(side_effect=OSError('oops')))
+    assert item.pixmap().isNull()
+    # Keeps the source so that the image data isn't lost:
+    assert item.pixmap_pending is True
+    assert item.blob_source is not None
+    assert item.may_decode() is False
+
+
+def test_pixmap_pending_image_retries_decoding_later(
+        qapp, imgdata3x3):
+    item = BeePixmapItem(QtGui.QImage())
+    item.set_lazy_source(MagicMock(side_effect=OSError('oops')))
+    item.pixmap()
+    item.pixmap()
+    item.blob_source.assert_called_once_with()
+    item.blob_source.side_effect = None
+    item.blob_source.return_value = imgdata3x3
+    with patch('beeref.items.time.monotonic',
+               return_value=time.monotonic() + 60):
+        assert item.pixmap().size() == QtCore.QSize(3, 3)
+    assert item.pixmap_pending is False
+
+
+def test_set_decoded_image_applies_grayscale(qapp, imgfilename3x3):
+    item = BeePixmapItem(QtGui.QImage())
+    item.set_lazy_source(MagicMock())
+    item.grayscale = True
+    assert item._grayscale_pixmap is None
+    item.set_decoded_image(QtGui.QImage(imgfilename3x3))
+    assert item.pixmap_pending is False
+    assert item._grayscale_pixmap.size() == QtCore.QSize(3, 3)
+    item.blob_source.assert_not_called()
+
+
+def test_set_decoded_image_when_already_decoded(qapp, imgfilename3x3):
+    item = BeePixmapItem(QtGui.QImage(imgfilename3x3))
+    item.set_decoded_image(QtGui.QImage())
+    assert item.pixmap().size() == QtCore.QSize(3, 3)
+
+
+def test_create_thumbnails(qapp):
+    item = BeePixmapItem(QtGui.QImage(1000, 600,
+                                      QtGui.QImage.Format.Format_RGB32))
+    thumbnails = item.create_thumbnails()
+    assert [t[0] for t in thumbnails] == [4, 16]
+    assert thumbnails[0][1].size() == QtCore.QSize(250, 150)
+    assert thumbnails[1][1].size() == QtCore.QSize(62, 38)
+
+
+def test_create_thumbnails_when_small_image(qapp, item):
+    assert item.create_thumbnails() == []
+
+
+@pytest.mark.parametrize('scale,expected',
+                         [(2, 1),
+                          (0.5, 1),
+                          (0.25, 4),
+                          (0.1, 4),
+                          (1/16, 16),
+                          (0.001, 16)])
+def test_get_lod_factor(qapp, item, scale, expected):
+    item.set_preview_sources({4: MagicMock(), 16: MagicMock()})
+    assert item.get_lod_factor(scale) == expected
+
+
+def test_get_lod_factor_when_no_previews(qapp, item):
+    assert item.get_lod_factor(0.01) == 1
+
+
+@pytest.mark.parametrize('factor,expected',
+                         [(1, 4), (4, 4), (8, 4), (16, 16), (64, 16)])
+def test_get_best_preview(qapp, item, factor, expected):
+    item.previews = {4: MagicMock(), 16: MagicMock()}
+    assert item.get_best_preview(factor) == expected
+
+
+def test_get_best_preview_when_no_previews(qapp, item):
+    assert item.get_best_preview(4) is None
+
+
+def test_set_preview_image(qapp, item):
+    item.set_preview_image(4, QtGui.QImage(3, 3,
+                                           QtGui.QImage.Format.Format_RGB32))
+    assert item.previews[4].size() == QtCore.QSize(3, 3)
+
+
+def test_set_preview_image_when_decoding_failed(qapp, item):
+    item.set_preview_sources({4: MagicMock()})
+    item.set_preview_image(4, QtGui.QImage())
+    assert item.previews == {}
+    assert item.preview_sources == {}
+
+
+def test_str_when_pixmap_pending(qapp):
+    item = BeePixmapItem(QtGui.QImage(), 'foo.png')
+    item.set_lazy_source(MagicMock())
+    item.crop = QtCore.QRectF(0, 0, 30, 40)
+    assert str(item) == 'Image "foo.png" 30 x 40'
+    item.blob_source.assert_not_called()
+
+
 def test_color_gamut_finds_colors(qapp):
     img = QtGui.QImage(10, 10, QtGui.QImage.Format.Format_ARGB32)
     img.fill(QtGui.QColor(0, 0, 0))
@@ -424,6 +730,33 @@ def test_color_gamut_finds_colors(qapp):
     assert item.color_gamut == {(0, 255): 1, (120, 255): 2}
 
 
+def test_color_gamut_same_as_looking_at_each_pixel(qapp):
+    img = QtGui.QImage(50, 40, QtGui.QImage.Format.Format_ARGB32)
+    expected = defaultdict(int)
+    for x in range(img.width()):
+        for y in range(img.height()):
+            color = QtGui.QColor.fromHsv(
+                x * 7, y * 6, (x * y) % 256, 255 - (x + y) % 10)
+            img.setPixelColor(x, y, color)
+            color = img.pixelColor(x, y)
+            rgb = (color.red(), color.green(), color.blue())
+            if 5 < color.alpha() and min(rgb) < 250 and max(rgb) > 5:
+                expected[color.hue(), color.saturation()] += 1
+    gamut = BeePixmapItem.color_gamut_from_image(img)
+    assert gamut == expected
+
+
+def test_color_gamut_merges_similar_colors_when_too_many(qapp):
+    img = QtGui.QImage(3, 1, QtGui.QImage.Format.Format_ARGB32)
+    img.setPixelColor(0, 0, QtGui.QColor(252, 0, 0))
+    img.setPixelColor(1, 0, QtGui.QColor(253, 1, 2))
+    img.setPixelColor(2, 0, QtGui.QColor(0, 0, 255))
+    assert len(BeePixmapItem.color_gamut_from_image(img)) == 3
+    with patch.object(BeePixmapItem, 'GAMUT_MAX_COLORS', 2):
+        gamut = BeePixmapItem.color_gamut_from_image(img)
+    assert gamut == {(0, 253): 2, (240, 253): 1}
+
+
 def test_color_gamut_ignores_almost_black(qapp):
     img = QtGui.QImage(10, 10, QtGui.QImage.Format.Format_ARGB32)
     img.fill(QtGui.QColor(3, 3, 3))
@@ -445,6 +778,38 @@ def test_color_gamut_ignores_almost_transparent(qapp):
     assert item.color_gamut == {}
 
 
+def test_color_gamut_samples_large_images(qapp):
+    img = QtGui.QImage(10, 10, QtGui.QImage.Format.Format_RGB32)
+    img.fill(QtGui.QColor(255, 0, 0))
+    with patch.object(BeePixmapItem, 'GAMUT_SAMPLE_SIZE', 5):
+        gamut = BeePixmapItem.color_gamut_from_image(img)
+    assert gamut == {(0, 255): 25}
+
+
+def test_color_gamut_is_cached(qapp, item):
+    item.set_color_gamut({(0, 255): 3})
+    item.gamut_image = MagicMock()
+    assert item.color_gamut == {(0, 255): 3}
+    item.gamut_image.assert_not_called()
+
+
+def test_color_gamut_cleared_by_set_pixmap(qapp, item):
+    item.set_color_gamut({(0, 255): 3})
+    item.setPixmap(QtGui.QPixmap(5, 5))
+    assert item.has_color_gamut() is False
+
+
+def test_color_gamut_not_in_save_data(qapp, item):
+    item.set_color_gamut({(120, 255): 2, (0, 255): 3})
+    assert 'color_gamut' not in item.get_extra_save_data()
+
+
+def test_create_copy_keeps_color_gamut(qapp, item):
+    item.set_color_gamut({(0, 255): 3})
+    copy = item.create_copy()
+    assert copy.color_gamut == {(0, 255): 3}
+
+
 def test_copy_to_clipboard(qapp, imgfilename3x3):
     clipboard = QtWidgets.QApplication.clipboard()
     item = BeePixmapItem(QtGui.QImage(imgfilename3x3), 'foo.png')
@@ -518,8 +883,260 @@ def test_paint(qapp, item):
         QtCore.QRectF(10, 20, 30, 40))
 
 
+def test_paint_grayscale_before_conversion_done(view, item):
+    view.scene.addItem(item)
+    view.scene.convert_grayscale_later = MagicMock()
+    item.grayscale = True
+    item.paint_selectable = MagicMock()
+    painter = MagicMock(
+        combinedTransform=MagicMock(
+            return_value=MagicMock(
+                m11=MagicMock(return_value=1),
+                m12=MagicMock(return_value=0))))
+    item.paint(painter, None, None)
+    assert (painter.drawPixmap.call_args[0][1].cacheKey()
+            == item.pixmap().cacheKey())
+    item.get_grayscale_pixmap()
+    item.paint(painter, None, None)
+    assert (painter.drawPixmap.call_args[0][1].cacheKey()
+            == item._grayscale_pixmap.cacheKey())
+
+
+def test_paint_when_pixmap_pending(view, item):
+    view.scene.addItem(item)
+    view.scene.decode_later = MagicMock()
+    item.set_lazy_source(MagicMock())
+    item.paint_selectable = MagicMock()
+    item.crop = QtCore.QRectF(10, 20, 30, 40)
+    painter = MagicMock(
+        combinedTransform=MagicMock(
+            return_value=MagicMock(
+                m11=MagicMock(return_value=0.5))))
+    item.paint(painter, None, None)
+    item.paint_selectable.assert_called_once()
+    painter.drawPixmap.assert_not_called()
+    painter.fillRect.assert_called_once_with(
+        QtCore.QRectF(10, 20, 30, 40), item.PLACEHOLDER_COLOR)
+    view.scene.decode_later.assert_called_once_with(item, 1)
+    item.blob_source.assert_not_called()
+
+
+def test_paint_when_pixmap_pending_with_preview(view, item):
+    view.scene.addItem(item)
+    view.scene.decode_later = MagicMock()
+    item.set_lazy_source(MagicMock())
+    item.set_preview_sources({4: MagicMock()})
+    item.previews = {4: QtGui.QPixmap(25, 25)}
+    item.paint_selectable = MagicMock()
+    item.crop = QtCore.QRectF(20, 40, 60, 40)
+    painter = MagicMock(
+        combinedTransform=MagicMock(
+            return_value=QtGui.QTransform.fromScale(0.1, 0.1)))
+    item.paint(painter, None, None)
+    view.scene.decode_later.assert_called_once_with(item, 4)
+    painter.fillRect.assert_not_called()
+    painter.drawPixmap.assert_called_once_with(
+        QtCore.QRectF(20, 40, 60, 40),
+        item.previews[4],
+        QtCore.QRectF(5, 10, 15, 10))
+
+
+def test_paint_when_pixmap_pending_with_grayscale_preview(view, item):
+    view.scene.addItem(item)
+    view.scene.decode_later = MagicMock()
+    item.set_lazy_source(MagicMock())
+    item.previews = {4: QtGui.QPixmap(25, 25)}
+    item.grayscale = True
+    item.crop = QtCore.QRectF(0, 0, 100, 100)
+    item.paint_selectable = MagicMock()
+    painter = MagicMock(
+        combinedTransform=MagicMock(
+            return_value=QtGui.QTransform.fromScale(0.1, 0.1)))
+    item.paint(painter, None, None)
+    assert 4 in item._grayscale_previews
+    assert painter.drawPixmap.call_args[0][1] == item._grayscale_previews[4]
+
+
+def test_paint_creates_previews_when_zoomed_out(qapp):
+    item = BeePixmapItem(
+        QtGui.QImage(400, 200, QtGui.QImage.Format.Format_RGB32))
+    item.paint_selectable = MagicMock()
+    painter = MagicMock(
+        combinedTransform=MagicMock(
+            return_value=QtGui.QTransform.fromScale(0.2, 0.2)))
+    item.paint(painter, None, None)
+    assert set(item.previews) == {4}
+    painter.drawPixmap.assert_called_once_with(
+        QtCore.QRectF(0, 0, 400, 200),
+        item.previews[4],
+        QtCore.QRectF(0, 0, 100, 50))
+    item.paint_selectable.assert_called_once()
+
+
+def test_paint_creates_previews_in_background_when_in_scene(view):
+    item = BeePixmapItem(
+        QtGui.QImage(400, 200, QtGui.QImage.Format.Format_RGB32))
+    view.scene.addItem(item)
+    view.scene.create_previews_later = MagicMock()
+    item.paint_selectable = MagicMock()
+    painter = MagicMock(
+        combinedTransform=MagicMock(
+            return_value=QtGui.QTransform.fromScale(0.2, 0.2)))
+    item.paint(painter, None, None)
+    view.scene.create_previews_later.assert_called_once_with(item)
+    assert item.previews == {}
+    painter.setRenderHint.assert_called_with(
+        painter.RenderHint.SmoothPixmapTransform, False)
+    painter.drawPixmap.assert_called_once()
+    assert painter.drawPixmap.call_args[0][1].cacheKey() == (
+        item.pixmap().cacheKey())
+
+
+def test_paint_doesnt_create_previews_when_zoomed_in(qapp):
+    item = BeePixmapItem(
+        QtGui.QImage(400, 200, QtGui.QImage.Format.Format_RGB32))
+    item.paint_selectable = MagicMock()
+    painter = MagicMock(
+        combinedTransform=MagicMock(
+            return_value=QtGui.QTransform.fromScale(0.5, 0.5)))
+    item.paint(painter, None, None)
+    assert item.previews == {}
+    painter.drawPixmap.assert_called_once()
+    args = painter.drawPixmap.call_args[0]
+    assert args[1].cacheKey() == item.pixmap().cacheKey()
+    assert args[2] == QtCore.QRectF(0, 0, 400, 200)
+
+
+def test_paint_impostor_when_tiny(qapp):
+    img = QtGui.QImage(400, 200, QtGui.QImage.Format.Format_RGB32)
+    img.fill(QtGui.QColor(10, 20, 30))
+    item = BeePixmapItem(img)
+    item.paint_selectable = MagicMock()
+    painter = MagicMock(
+        combinedTransform=MagicMock(
+            return_value=QtGui.QTransform.fromScale(0.005, 0.005)))
+    item.paint(painter, None, None)
+    painter.drawPixmap.assert_not_called()
+    painter.fillRect.assert_called_once_with(
+        QtCore.QRectF(0, 0, 400, 200), QtGui.QColor(10, 20, 30))
+    item.paint_selectable.assert_called_once()
+
+
+def test_paint_impostor_when_pending_without_previews(view, item):
+    view.scene.addItem(item)
+    view.scene.decode_later = MagicMock()
+    item.set_lazy_source(MagicMock())
+    item.paint_selectable = MagicMock()
+    painter = MagicMock(
+        combinedTransform=MagicMock(
+            return_value=QtGui.QTransform.fromScale(0.1, 0.1)))
+    item.paint(painter, None, None)
+    painter.fillRect.assert_called_once_with(
+        item.crop, item.PLACEHOLDER_COLOR)
+    item.blob_source.assert_not_called()
+
+
+def test_average_color(qapp):
+    img = QtGui.QImage(40, 20, QtGui.QImage.Format.Format_RGB32)
+    img.fill(QtGui.QColor(0, 0, 0))
+    for x in range(20):
+        for y in range(20):
+            img.setPixelColor(x, y, QtGui.QColor(200, 100, 0))
+    item = BeePixmapItem(img)
+    assert item.average_color() == QtGui.QColor(100, 50, 0)
+
+
+def test_average_color_grayscale(qapp):
+    img = QtGui.QImage(40, 20, QtGui.QImage.Format.Format_RGB32)
+    img.fill(QtGui.QColor(200, 100, 0))
+    item = BeePixmapItem(img)
+    item.grayscale = True
+    color = item.average_color()
+    assert color.red() == color.green() == color.blue()
+
+
+def test_average_color_when_pending_without_previews(qapp, item):
+    item.set_lazy_source(MagicMock())
+    assert item.average_color() is None
+    item.blob_source.assert_not_called()
+
+
+def test_average_color_waits_for_previews_when_in_scene(view):
+    item = BeePixmapItem(
+        QtGui.QImage(400, 200, QtGui.QImage.Format.Format_RGB32))
+    view.scene.addItem(item)
+    view.scene.create_previews_later = MagicMock()
+    assert item.average_color() is None
+    view.scene.create_previews_later.assert_called_once_with(item)
+    item.create_previews()
+    assert item.average_color() is not None
+
+
+def test_set_pixmap_clears_previews(qapp):
+    item = BeePixmapItem(
+        QtGui.QImage(400, 200, QtGui.QImage.Format.Format_RGB32))
+    item.create_previews()
+    assert item.previews
+    item.setPixmap(QtGui.QPixmap(300, 300))
+    assert item.previews == {}
+    assert item.average_color() is not None
+    item.create_previews()
+    assert item.previews[4].size() == QtCore.QSize(75, 75)
+
+
+def test_pixmap_memory(qapp, item):
+    assert item.pixmap_memory() == 10 * 10 * 4
+    item.set_lazy_source(MagicMock())
+    assert item.pixmap_memory() == 0
+
+
+def test_drop_pixmap(qapp, imgdata3x3):
+    item = BeePixmapItem(QtGui.QImage.fromData(imgdata3x3))
+    item.source_data = imgdata3x3
+    assert item.drop_pixmap() is True
+    assert item.pixmap_pending is True
+    # The encoded data is still in memory:
+    assert item.pixmap_memory() == len(imgdata3x3)
+    assert item.blob_source() == imgdata3x3
+    assert item.pixmap().size() == QtCore.QSize(3, 3)
+    assert item.pixmap_pending is False
+
+
+def test_drop_pixmap_keeps_lazy_source(qapp, item):
+    source = MagicMock()
+    item.set_lazy_source(source)
+    item.set_decoded_image(
+        QtGui.QImage(20, 20, QtGui.QImage.Format.Format_RGB32))
+    assert item.drop_pixmap() is True
+    assert item.blob_source is source
+
+
+def test_drop_pixmap_without_source(qapp, item):
+    assert item.drop_pixmap() is False
+    assert item.pixmap_pending is False
+    assert item.pixmap_memory() == 400
+
+
+def test_drop_pixmap_when_crop_mode(qapp, item, imgdata3x3):
+    item.source_data = imgdata3x3
+    item.crop_mode = True
+    assert item.drop_pixmap() is False
+
+
+def test_paint_updates_last_painted(qapp, item):
+    item.paint_selectable = MagicMock()
+    painter = MagicMock(
+        combinedTransform=MagicMock(
+            return_value=MagicMock(
+                m11=MagicMock(return_value=1), m12=MagicMock(return_value=0))))
+    item.paint(painter, None, None)
+    first = item.last_painted
+    item.paint(painter, None, None)
+    assert item.last_painted > first > 0
+
+
 def test_paint_when_crop_mode(qapp, item):
-    item.pixmap = MagicMock()
+    item.pixmap = MagicMock(return_value=QtGui.QPixmap(50, 60))
     item.paint_selectable = MagicMock()
     item.crop = QtCore.QRectF(10, 20, 30, 40)
     item.crop_mode = True
@@ -915,6 +1532,38 @@ def test_sample_color_in_greyscale_mode(qapp, view):
     assert gray == QtGui.QColor(130, 130, 130)
 
 
+def test_sample_color_at_keeps_sample_buffer(qapp, view, item):
+    view.scene.addItem(item)
+    item.sample_color_at(QtCore.QPointF(2, 2))
+    buffer = item._sample_image
+    item.sample_color_at(QtCore.QPointF(3, 3))
+    assert item._sample_image is buffer
+    item.release_sample_buffer()
+    assert item._sample_image is None
+
+
+def test_sample_color_at_averages(qapp, view):
+    img = QtGui.QImage(10, 10, QtGui.QImage.Format.Format_ARGB32)
+    img.fill(QtGui.QColor(255, 0, 0))
+    img.setPixelColor(5, 5, QtGui.QColor(0, 0, 255))
+    item = BeePixmapItem(img, 'foo.png')
+    view.scene.addItem(item)
+    color = item.sample_color_at(QtCore.QPointF(5, 5), size=3)
+    assert color == QtGui.QColor(227, 0, 28)
+
+
+def test_grayscale_releases_sample_buffer(qapp, item):
+    item.sample_color_at(QtCore.QPointF(2, 2))
+    item.grayscale = True
+    assert item._sample_image is None
+
+
+def test_set_pixmap_releases_sample_buffer(qapp, item):
+    item.sample_color_at(QtCore.QPointF(2, 2))
+    item.setPixmap(QtGui.QPixmap(5, 5))
+    assert item._sample_image is None
+
+
 def test_sample_color_at_returns_none_when_transparent(qapp, view):
     color = QtGui.QColor(255, 0, 0, 0)
     img = QtGui.QImage(10, 10, QtGui.QImage.Format.Format_ARGB32)
@@ -0,0 +1,351 @@
+from unittest.mock import patch, MagicMock
+
+from pytest import approx
+
+from PyQt6 import QtCore, QtGui
+
+from beeref.items import BeeTiledPixmapItem
+from beeref.utils import image_reader, image_to_bytes
+
+
+def painter_with_scale(scale):
+    return MagicMock(
+        combinedTransform=MagicMock(
+            return_value=QtGui.QTransform.fromScale(scale, scale)))
+
+
+def test_init(tiled_item, jpgdata600x400):
+    assert tiled_item.source_data == jpgdata600x400
+    assert tiled_item.filename == 'big.jpg'
+    assert tiled_item.image_size() == QtCore.QSize(600, 400)
+    assert tiled_item.crop == QtCore.QRectF(0, 0, 600, 400)
+    assert tiled_item.width == 600
+    assert tiled_item.height == 400
+    assert tiled_item.tile_factors == [1, 2, 4, 8]
+    assert tiled_item.pixmap_pending is False
+    assert str(tiled_item) == 'Image "big.jpg" 600 x 400'
+
+
+def test_needs_tiling_when_small(jpgdata600x400):
+    reader = image_reader(jpgdata600x400)
+    assert BeeTiledPixmapItem.needs_tiling(reader) is False
+
+
+@patch('beeref.items.BeeTiledPixmapItem.TILING_MIN_SIZE', 500)
+def test_needs_tiling_when_long_side(jpgdata600x400):
+    reader = image_reader(jpgdata600x400)
+    assert BeeTiledPixmapItem.needs_tiling(reader) is True
+
+
+def test_needs_tiling_when_exceeding_allocation_limit(jpgdata600x400):
+    img = QtGui.QImage(1000, 600, QtGui.QImage.Format.Format_RGB32)
+    img.fill(QtGui.QColor(0, 0, 0))
+    limit = QtGui.QImageReader.allocationLimit()
+    QtGui.QImageReader.setAllocationLimit(1)
+    try:
+        reader = image_reader(image_to_bytes(img, 'jpg'))
+        assert BeeTiledPixmapItem.needs_tiling(reader) is True
+    finally:
+        QtGui.QImageReader.setAllocationLimit(limit)
+
+
+@patch('beeref.items.BeeTiledPixmapItem.TILING_MIN_SIZE', 1)
+def test_needs_tiling_when_format_cant_be_decoded_in_parts(imgdata3x3):
+    reader = image_reader(imgdata3x3)
+    assert BeeTiledPixmapItem.needs_tiling(reader) is False
+
+
+def test_needs_tiling_when_invalid():
+    reader = image_reader(b'foo')
+    assert BeeTiledPixmapItem.needs_tiling(reader) is False
+
+
+def test_get_extra_save_data(tiled_item):
+    data = tiled_item.get_extra_save_data()
+    assert data['tiled'] is True
+    assert data['crop'] == [0, 0, 600, 400]
+
+
+def test_get_lod_factor(tiled_item):
+    assert tiled_item.get_lod_factor(2) == 1
+    assert tiled_item.get_lod_factor(0.5) == 2
+    assert tiled_item.get_lod_factor(0.3) == 2
+    assert tiled_item.get_lod_factor(0.001) == 8
+
+
+def test_tile_rect(tiled_item):
+    assert tiled_item.tile_rect((1, 1, 2)) == QtCore.QRect(128, 256, 128, 128)
+    assert tiled_item.tile_rect((1, 4, 3)) == QtCore.QRect(512, 384, 88, 16)
+    assert tiled_item.tile_rect((8, 0, 0)) == QtCore.QRect(0, 0, 600, 400)
+
+
+def test_tile_keys(tiled_item):
+    keys = tiled_item.tile_keys(1, QtCore.QRectF(100, 100, 100, 50))
+    assert keys == [(1, 0, 0), (1, 1, 0), (1, 0, 1), (1, 1, 1)]
+
+
+def test_tile_keys_outside_of_image(tiled_item):
+    assert tiled_item.tile_keys(1, QtCore.QRectF(700, 100, 50, 50)) == []
+
+
+def test_tile_keys_coarse(tiled_item):
+    keys = tiled_item.tile_keys(4, QtCore.QRectF(0, 0, 600, 400))
+    assert keys == [(4, 0, 0), (4, 1, 0)]
+
+
+def test_tile_source(tiled_item):
+    img = tiled_item.tile_source((2, 2, 0))()
+    assert img.size() == QtCore.QSize(44, 128)
+    assert img.pixelColor(5, 5).blue() > 200
+
+
+def test_get_tile_schedules_decode(view, tiled_item):
+    view.scene.addItem(tiled_item)
+    view.scene.decode_tile_later = MagicMock()
+    assert tiled_item.get_tile((1, 0, 0)) is None
+    view.scene.decode_tile_later.assert_called_once_with(
+        tiled_item, (1, 0, 0))
+
+
+def test_get_tile_doesnt_decode(view, tiled_item):
+    view.scene.addItem(tiled_item)
+    view.scene.decode_tile_later = MagicMock()
+    assert tiled_item.get_tile((1, 0, 0), decode=False) is None
+    view.scene.decode_tile_later.assert_not_called()
+
+
+def test_get_tile_grayscale(qapp, tiled_item):
+    tiled_item.set_tile((1, 0, 0), tiled_item.tile_source((1, 0, 0))())
+    tiled_item.grayscale = True
+    tile = tiled_item.get_tile((1, 0, 0))
+    assert tile == tiled_item._grayscale_tiles[(1, 0, 0)]
+    color = tile.toImage().pixelColor(5, 5)
+    assert color.red() == color.green() == color.blue()
+
+
+def test_set_tile_evicts_oldest_tiles(qapp, tiled_item):
+    tiled_item.MAX_TILES = 3
+    img = QtGui.QImage(10, 10, QtGui.QImage.Format.Format_RGB32)
+    tiled_item.set_tile((8, 0, 0), img)
+    tiled_item.set_tile((1, 0, 0), img)
+    tiled_item.set_tile((1, 1, 0), img)
+    tiled_item.get_tile((1, 0, 0))
+    tiled_item.set_tile((1, 2, 0), img)
+    assert list(tiled_item.tiles) == [(8, 0, 0), (1, 0, 0), (1, 2, 0)]
+
+
+def test_pixmap_memory(qapp, tiled_item, jpgdata600x400):
+    assert tiled_item.pixmap_memory() == len(jpgdata600x400)
+    img = QtGui.QImage(10, 10, QtGui.QImage.Format.Format_RGB32)
+    tiled_item.set_tile((8, 0, 0), img)
+    tiled_item.set_tile((1, 0, 0), img)
+    assert tiled_item.pixmap_memory() == (
+        2 * 10 * 10 * 4 + len(jpgdata600x400))
+
+
+def test_drop_pixmap_keeps_coarsest_tiles(
+        qapp, tiled_item, jpgdata600x400):
+    img = QtGui.QImage(10, 10, QtGui.QImage.Format.Format_RGB32)
+    tiled_item.set_tile((8, 0, 0), img)
+    tiled_item.set_tile((1, 0, 0), img)
+    tiled_item.grayscale = True
+    tiled_item.get_tile((1, 0, 0))
+    assert tiled_item.drop_pixmap() is True
+    assert list(tiled_item.tiles) == [(8, 0, 0)]
+    assert tiled_item._grayscale_tiles == {}
+    assert tiled_item.pixmap_memory() == 10 * 10 * 4 + len(jpgdata600x400)
+    assert tiled_item.drop_pixmap() is False
+
+
+def test_paint_schedules_visible_tiles(view, tiled_item):
+    view.scene.addItem(tiled_item)
+    view.scene.decode_tile_later = MagicMock()
+    tiled_item.paint_selectable = MagicMock()
+    option = MagicMock(exposedRect=QtCore.QRectF(0, 0, 100, 100))
+    painter = painter_with_scale(1)
+    tiled_item.paint(painter, option, None)
+    keys = [c[0][1] for c in view.scene.decode_tile_later.call_args_list]
+    assert keys == [(8, 0, 0), (1, 0, 0)]
+    painter.fillRect.assert_called_once_with(
+        QtCore.QRectF(0, 0, 100, 100), tiled_item.PLACEHOLDER_COLOR)
+    painter.drawPixmap.assert_not_called()
+    tiled_item.paint_selectable.assert_called_once()
+
+
+def test_paint_draws_tiles(qapp, tiled_item):
+    tile = QtGui.QPixmap(128, 128)
+    tiled_item.tiles[(1, 1, 0)] = tile
+    tiled_item.tiles[(8, 0, 0)] = QtGui.QPixmap(75, 50)
+    tiled_item.paint_selectable = MagicMock()
+    option = MagicMock(exposedRect=QtCore.QRectF(150, 10, 20, 20))
+    painter = painter_with_scale(1)
+    tiled_item.paint(painter, option, None)
+    painter.drawPixmap.assert_called_once_with(
+        QtCore.QRectF(150, 10, 20, 20), tile, QtCore.QRectF(22, 10, 20, 20))
+
+
+def test_paint_draws_coarser_tiles_until_decoded(qapp, tiled_item):
+    overview = QtGui.QPixmap(75, 50)
+    tiled_item.tiles[(8, 0, 0)] = overview
+    tiled_item.paint_selectable = MagicMock()
+    option = MagicMock(exposedRect=QtCore.QRectF(160, 0, 80, 80))
+    painter = painter_with_scale(1)
+    tiled_item.paint(painter, option, None)
+    painter.drawPixmap.assert_called_once_with(
+        QtCore.QRectF(160, 0, 80, 80), overview, QtCore.QRectF(20, 0, 10, 10))
+    painter.fillRect.assert_not_called()
+
+
+def test_paint_respects_crop(qapp, tiled_item):
+    tile = QtGui.QPixmap(128, 128)
+    tiled_item.tiles[(1, 0, 0)] = tile
+    tiled_item.crop = QtCore.QRectF(10, 20, 50, 60)
+    tiled_item.paint_selectable = MagicMock()
+    option = MagicMock(exposedRect=QtCore.QRectF(0, 0, 600, 400))
+    painter = painter_with_scale(1)
+    tiled_item.paint(painter, option, None)
+    painter.drawPixmap.assert_called_once_with(
+        QtCore.QRectF(10, 20, 50, 60), tile, QtCore.QRectF(10, 20, 50, 60))
+
+
+def test_paint_in_crop_mode_draws_whole_image(qapp, tiled_item):
+    tiled_item.tiles[(8, 0, 0)] = QtGui.QPixmap(75, 50)
+    tiled_item.crop = QtCore.QRectF(10, 20, 50, 60)
+    tiled_item.crop_mode = True
+    tiled_item.crop_temp = QtCore.QRectF(10, 20, 50, 60)
+    option = MagicMock(exposedRect=QtCore.QRectF(0, 0, 600, 400))
+    painter = painter_with_scale(0.1)
+    tiled_item.paint(painter, option, None)
+    painter.drawPixmap.assert_called_once_with(
+        QtCore.QRectF(0, 0, 600, 400),
+        tiled_item.tiles[(8, 0, 0)],
+        QtCore.QRectF(0, 0, 75, 50))
+
+
+def test_bounding_rect_unselected_in_crop_mode(qapp, tiled_item):
+    tiled_item.crop = QtCore.QRectF(10, 20, 50, 60)
+    tiled_item.crop_mode = True
+    assert tiled_item.bounding_rect_unselected() == QtCore.QRectF(
+        0, 0, 600, 400)
+
+
+def test_average_color(qapp, tiled_item):
+    assert tiled_item.average_color() is None
+    tiled_item.set_tile((8, 0, 0), tiled_item.tile_source((8, 0, 0))())
+    color = tiled_item.average_color()
+    assert color.red() > 100
+    assert color.blue() > 100
+
+
+def test_create_thumbnails(qapp, tiled_item):
+    thumbnails = tiled_item.create_thumbnails()
+    assert [factor for factor, img in thumbnails] == [4, 16]
+    assert thumbnails[0][1].size() == QtCore.QSize(150, 100)
+    assert thumbnails[1][1].size() == QtCore.QSize(38, 25)
+
+
+def test_sample_color_at(view, tiled_item):
+    view.scene.addItem(tiled_item)
+    view.scene.decode_tile_later = MagicMock()
+    assert tiled_item.sample_color_at(QtCore.QPointF(400, 10)) is None
+    tiled_item.set_tile((8, 0, 0), tiled_item.tile_source((8, 0, 0))())
+    assert tiled_item.sample_color_at(QtCore.QPointF(400, 10)).blue() > 200
+    tiled_item.set_tile((1, 0, 0), tiled_item.tile_source((1, 0, 0))())
+    assert tiled_item.sample_color_at(QtCore.QPointF(10, 10)).red() > 200
+    view.scene.decode_tile_later.assert_not_called()
+
+
+def test_pixmap(qapp, tiled_item):
+    pixmap = tiled_item.pixmap()
+    assert pixmap.size() == QtCore.QSize(600, 400)
+    assert pixmap.toImage().pixelColor(10, 10).red() > 200
+
+
+def test_pixmap_when_exceeding_allocation_limit(qapp):
+    img = QtGui.QImage(1000, 600, QtGui.QImage.Format.Format_RGB32)
+    img.fill(QtGui.QColor(255, 0, 0))
+    item = BeeTiledPixmapItem(image_to_bytes(img, 'jpg'))
+    limit = QtGui.QImageReader.allocationLimit()
+    QtGui.QImageReader.setAllocationLimit(1)
+    try:
+        pixmap = item.pixmap()
+    finally:
+        QtGui.QImageReader.setAllocationLimit(limit)
+    assert pixmap.isNull() is False
+    assert pixmap.width() * pixmap.height() * 4 <= 1024 * 1024
+    assert pixmap.width() / pixmap.height() == approx(1000 / 600, rel=0.01)
+    assert pixmap.toImage().pixelColor(10, 10).red() > 200
+
+
+def test_image_for_export_when_exceeding_allocation_limit(qapp):
+    img = QtGui.QImage(1000, 600, QtGui.QImage.Format.Format_RGB32)
+    img.fill(QtGui.QColor(255, 0, 0))
+    item = BeeTiledPixmapItem(image_to_bytes(img, 'jpg'))
+    item.crop = QtCore.QRectF(0, 0, 900, 600)
+    limit = QtGui.QImageReader.allocationLimit()
+    QtGui.QImageReader.setAllocationLimit(1)
+    try:
+        exported, imgformat = item.image_for_export(apply_crop=True)
+    finally:
+        QtGui.QImageReader.setAllocationLimit(limit)
+    assert exported.isNull() is False
+    assert exported.width() * exported.height() * 4 <= 1024 * 1024
+    assert exported.width() / exported.height() == approx(1.5, rel=0.01)
+
+
+def test_image_for_export(qapp, tiled_item):
+    tiled_item.crop = QtCore.QRectF(290, 20, 50, 60)
+    img, imgformat = tiled_item.image_for_export(apply_crop=True)
+    assert img.size() == QtCore.QSize(50, 60)
+    assert img.pixelColor(2, 2).red() > 200
+    assert img.pixelColor(45, 2).blue() > 200
+
+
+def test_image_for_export_grayscale(qapp, tiled_item):
+    tiled_item.grayscale = True
+    img, imgformat = tiled_item.image_for_export(apply_grayscale=True)
+    assert img.size() == QtCore.QSize(600, 400)
+    assert img.isGrayscale()
+
+
+def test_get_source_data_ignores_storage_format(
+        qapp, tiled_item, settings, jpgdata600x400):
+    settings.setValue('Items/image_storage_format', 'png')
+    assert tiled_item.get_source_data() == (jpgdata600x400, 'jpg')
+
+
+def test_sample_color_at_keeps_sample_buffer(view, tiled_item):
+    view.scene.addItem(tiled_item)
+    tiled_item.set_tile((1, 0, 0), tiled_item.tile_source((1, 0, 0))())
+    assert tiled_item.sample_color_at(QtCore.QPointF(10, 10)).red() > 200
+    assert list(tiled_item._sample_image) == [(1, 0, 0)]
+    color = tiled_item.sample_color_at(QtCore.QPointF(10, 10), size=5)
+    assert color.red() > 200
+    tiled_item.release_sample_buffer()
+    assert tiled_item._sample_image is None
+
+
+def test_gamut_image(qapp, tiled_item):
+    tiled_item.GAMUT_MAX_PIXELS = 20000
+    img = tiled_item.gamut_image()
+    assert img.size() == QtCore.QSize(150, 100)
+    gamut = tiled_item.color_gamut
+    # Mostly red and blue, apart from compression artifacts:
+    assert sorted(gamut, key=gamut.get)[-2:] in (
+        [(0, 255), (240, 255)], [(240, 255), (0, 255)])
+
+
+def test_create_copy(qapp, tiled_item):
+    tiled_item.tiles[(8, 0, 0)] = QtGui.QPixmap(75, 50)
+    tiled_item.crop = QtCore.QRectF(10, 20, 50, 60)
+    tiled_item.grayscale = True
+    tiled_item.setPos(20, 30)
+    copy = tiled_item.create_copy()
+    assert isinstance(copy, BeeTiledPixmapItem)
+    assert copy.source_data == tiled_item.source_data
+    assert copy.filename == 'big.jpg'
+    assert copy.crop == QtCore.QRectF(10, 20, 50, 60)
+    assert copy.grayscale is True
+    assert copy.pos() == QtCore.QPointF(20, 30)
+    assert copy.tiles == tiled_item.tiles
+    assert copy.tiles is not tiled_item.tiles
@@ -1,10 +1,12 @@
 from unittest.mock import patch, MagicMock
 
+from pytest import approx
+
 from PyQt6 import QtCore, QtGui
 from PyQt6.QtCore import Qt
 
 from beeref.items import BeePixmapItem
-from beeref.selection import MultiSelectItem
+from beeref.selection import MultiSelectItem, TransformGroupItem
 
 
 @patch('beeref.selection.SelectableMixin.init_selectable')
@@ -125,3 +127,70 @@ def test_mouse_press_event_when_leftclick(mouse_mock):
     item.mousePressEvent(event)
     event.ignore.assert_not_called()
     mouse_mock.assert_called_once_with(event)
+
+
+def multi_select_scale(view, scene_pos):
+    item1 = BeePixmapItem(
+        QtGui.QImage(100, 80, QtGui.QImage.Format.Format_RGB32))
+    view.scene.addItem(item1)
+    item1.setSelected(True)
+    item2 = BeePixmapItem(
+        QtGui.QImage(100, 80, QtGui.QImage.Format.Format_RGB32))
+    item2.setPos(200, 0)
+    view.scene.addItem(item2)
+    item2.setSelected(True)
+    multi = view.scene.multi_select_item
+    event = MagicMock(
+        pos=MagicMock(return_value=QtCore.QPointF(299, 79)),
+        scenePos=MagicMock(return_value=QtCore.QPointF(299, 79)),
+        button=MagicMock(return_value=Qt.MouseButton.LeftButton))
+    multi.mousePressEvent(event)
+    assert multi.active_mode == multi.SCALE_MODE
+    event.scenePos.return_value = scene_pos
+    return item1, item2, multi, event
+
+
+def test_mouse_press_event_scale_groups_items(view):
+    item1, item2, multi, event = multi_select_scale(
+        view, QtCore.QPointF(599, 159))
+    assert multi.transform_group is not None
+    assert item1.parentItem() == multi.transform_group
+    assert item2.parentItem() == multi.transform_group
+    assert multi.parentItem() is None
+
+
+def test_mouse_move_event_scale_transforms_group(view):
+    item1, item2, multi, event = multi_select_scale(
+        view, QtCore.QPointF(599, 159))
+    with patch.object(item1, 'setScale') as scale_mock:
+        multi.mouseMoveEvent(event)
+        scale_mock.assert_not_called()
+    factor = multi.get_scale_factor(event)
+    anchor = multi.event_anchor
+    assert item2.mapToScene(0, 0).x() == approx(
+        anchor.x() + (200 - anchor.x()) * factor)
+    assert item2.sceneTransform().m11() == approx(factor)
+
+
+def test_mouse_release_event_scale_ungroups_items(view):
+    item1, item2, multi, event = multi_select_scale(
+        view, QtCore.QPointF(599, 159))
+    multi.mouseMoveEvent(event)
+    factor = multi.get_scale_factor(event)
+    multi.mouseReleaseEvent(event)
+    assert multi.transform_group is None
+    assert item1.parentItem() is None
+    assert item2.parentItem() is None
+    assert item1.scale() == approx(factor)
+    assert item2.scale() == approx(factor)
+    anchor = multi.event_anchor
+    assert item1.pos().x() == approx(anchor.x() * (1 - factor))
+    assert item2.pos().x() == approx(
+        anchor.x() + (200 - anchor.x()) * factor)
+    assert len([i for i in view.scene.items()
+                if isinstance(i, TransformGroupItem)]) == 0
+
+    view.scene.undo_stack.undo()
+    assert item1.scale() == approx(1)
+    assert item2.scale() == approx(1)
+    assert item2.pos().x() == approx(200)
@@ -47,6 +47,76 @@ def test_fixed_length_for_viewport_when_no_scene(view, item):
     assert item.fixed_length_for_viewport(100) == 200
 
 
+def test_get_view_scale_cached(view, item):
+    view.scene.addItem(item)
+    view.get_scale = MagicMock(return_value=2)
+    assert item.get_view_scale() == 2
+    view.get_scale.return_value = 3
+    assert item.get_view_scale() == 2
+    item.on_view_scale_change()
+    assert item.get_view_scale() == 3
+
+
+def test_geometry_cached(view, item):
+    view.scene.addItem(item)
+    item.setSelected(True)
+    shape = item.shape()
+    with patch.object(item, '_shape') as shape_mock:
+        assert item.shape() is shape
+        assert item.get_flip_bounds() is item.get_flip_bounds()
+        shape_mock.assert_not_called()
+
+
+def test_geometry_cache_cleared_on_view_scale_change(view, item):
+    view.scene.addItem(item)
+    item.setSelected(True)
+    rect = item.boundingRect()
+    view.scale(2, 2)
+    assert item.boundingRect().width() < rect.width()
+
+
+def test_geometry_cache_cleared_on_item_scale_change(view, item):
+    view.scene.addItem(item)
+    item.setSelected(True)
+    corner = item.corners[0]
+    bounds = item.get_scale_bounds(corner).boundingRect()
+    item.setScale(2)
+    assert item.get_scale_bounds(corner).boundingRect().width() == approx(
+        bounds.width() / 2)
+
+
+def test_geometry_cache_cleared_on_crop_change(view, item):
+    view.scene.addItem(item)
+    item.setSelected(True)
+    assert item.corners[2] == QtCore.QPointF(10, 10)
+    width = item.shape().boundingRect().width()
+    item.crop = QtCore.QRectF(0, 0, 5, 6)
+    assert item.corners[2] == QtCore.QPointF(5, 6)
+    assert item.shape().boundingRect().width() == width - 5
+
+
+def test_geometry_cache_doesnt_query_scene_selection(view, item):
+    view.scene.addItem(item)
+    item.setSelected(True)
+    item.shape()
+    with patch.object(view.scene, 'get_user_selection') as selection_mock:
+        item.shape()
+        item.boundingRect()
+        selection_mock.assert_not_called()
+
+
+def test_geometry_cache_cleared_when_handles_disappear(view, item):
+    view.scene.addItem(item)
+    item.setSelected(True)
+    width = item.shape().boundingRect().width()
+    item2 = BeePixmapItem(QtGui.QImage())
+    view.scene.addItem(item2)
+    item2.setSelected(True)
+    assert item.shape().boundingRect().width() < width
+    item2.setSelected(False)
+    assert item.shape().boundingRect().width() == width
+
+
 def test_resize_size_when_scaled(view, item):
     view.scene.addItem(item)
     view.scale(2, 2)
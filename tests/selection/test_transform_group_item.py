@@ -0,0 +1,130 @@
+from pytest import approx
+
+from PyQt6 import QtCore, QtGui
+
+from beeref.items import BeePixmapItem
+from beeref.selection import TransformGroupItem
+
+
+def create_items(view):
+    item1 = BeePixmapItem(
+        QtGui.QImage(100, 80, QtGui.QImage.Format.Format_RGB32))
+    item1.setPos(10, 20)
+    item1.setZValue(2)
+    view.scene.addItem(item1)
+    item2 = BeePixmapItem(
+        QtGui.QImage(50, 50, QtGui.QImage.Format.Format_RGB32))
+    item2.setPos(-100, 40)
+    item2.setRotation(30)
+    item2.setScale(2)
+    item2.do_flip()
+    item2.setZValue(5)
+    view.scene.addItem(item2)
+    return [item1, item2]
+
+
+def corners_in_scene(item):
+    rect = item.bounding_rect_unselected()
+    return [item.mapToScene(point) for point in (
+        rect.topLeft(), rect.topRight(), rect.bottomLeft())]
+
+
+def assert_points_equal(points1, points2):
+    for p1, p2 in zip(points1, points2):
+        assert p1.x() == approx(p2.x())
+        assert p1.y() == approx(p2.y())
+
+
+def test_group(view):
+    items = create_items(view)
+    group = TransformGroupItem(items)
+    view.scene.addItem(group)
+    group.group()
+    assert group.zValue() == 5
+    assert items[0].parentItem() == group
+    assert items[1].parentItem() == group
+    assert items[0].pos() == QtCore.QPointF(10, 20)
+    assert items[1].pos() == QtCore.QPointF(-100, 40)
+
+
+def test_scale_around_and_ungroup(view):
+    items = create_items(view)
+    anchor = QtCore.QPointF(30, -10)
+    expected = []
+    for item in items:
+        orig = (item.pos(), item.scale(), item.rotation())
+        item.setScale(item.scale() * 1.5, item.mapFromScene(anchor))
+        expected.append(corners_in_scene(item))
+        item.setPos(orig[0])
+        item.setScale(orig[1])
+
+    group = TransformGroupItem(items)
+    view.scene.addItem(group)
+    group.group()
+    group.scale_around(2, anchor)
+    group.scale_around(1.5, anchor)
+    for item, corners in zip(items, expected):
+        assert_points_equal(corners_in_scene(item), corners)
+    assert items[0].scale() == 1
+
+    group.ungroup()
+    assert items[0].parentItem() is None
+    assert items[0].scale() == approx(1.5)
+    assert items[1].scale() == approx(3)
+    for item, corners in zip(items, expected):
+        assert_points_equal(corners_in_scene(item), corners)
+
+
+def test_rotate_around_and_ungroup(view):
+    items = create_items(view)
+    anchor = QtCore.QPointF(30, -10)
+    expected = []
+    for item in items:
+        orig = (item.pos(), item.rotation())
+        item.setRotation(item.rotation() + 40 * item.flip(),
+                         item.mapFromScene(anchor))
+        expected.append(corners_in_scene(item))
+        item.setPos(orig[0])
+        item.setRotation(orig[1])
+
+    group = TransformGroupItem(items)
+    view.scene.addItem(group)
+    group.group()
+    group.rotate_around(40, anchor)
+    for item, corners in zip(items, expected):
+        assert_points_equal(corners_in_scene(item), corners)
+    assert items[0].rotation() == 0
+
+    group.ungroup()
+    assert items[1].parentItem() is None
+    assert items[0].rotation() == approx(40)
+    assert items[1].rotation() == approx(350)
+    for item, corners in zip(items, expected):
+        assert_points_equal(corners_in_scene(item), corners)
+
+
+def test_ungroup_when_unchanged(view):
+    items = create_items(view)
+    group = TransformGroupItem(items)
+    view.scene.addItem(group)
+    group.group()
+    group.ungroup()
+    assert items[0].parentItem() is None
+    assert items[0].pos() == QtCore.QPointF(10, 20)
+    assert items[1].pos() == QtCore.QPointF(-100, 40)
+    assert items[1].scale() == 2
+    assert items[1].rotation() == 30
+
+
+def test_ungroup_updates_scene_bounding_rect(view):
+    items = create_items(view)
+    before = view.scene.itemsBoundingRect()
+    group = TransformGroupItem(items)
+    view.scene.addItem(group)
+    group.group()
+    group.scale_around(2, QtCore.QPointF(0, 0))
+    group.ungroup()
+    view.scene.removeItem(group)
+    rect = view.scene.itemsBoundingRect()
+    assert rect.width() == approx(before.width() * 2)
+    assert rect.height() == approx(before.height() * 2)
@@ -85,6 +85,39 @@ def test_delete_items(view):
     assert item2.isSelected() is True
 
 
+def test_insert_items_handles_selection_once(view):
+    items = [BeePixmapItem(QtGui.QImage()) for i in range(3)]
+    with patch.object(view.scene, 'on_selection_change') as change_mock:
+        view.scene.selectionChanged.disconnect()
+        view.scene.selectionChanged.connect(change_mock)
+        command = commands.InsertItems(view.scene, items)
+        command.redo()
+        change_mock.assert_called_once_with()
+        assert set(view.scene.selectedItems(user_only=True)) == set(items)
+        change_mock.reset_mock()
+        command.undo()
+        change_mock.assert_called_once_with()
+        assert view.scene.selectedItems(user_only=True) == []
+
+
+def test_delete_items_handles_selection_once(view):
+    items = [BeePixmapItem(QtGui.QImage()) for i in range(3)]
+    for item in items:
+        view.scene.addItem(item)
+        item.setSelected(True)
+    with patch.object(view.scene, 'on_selection_change') as change_mock:
+        view.scene.selectionChanged.disconnect()
+        view.scene.selectionChanged.connect(change_mock)
+        command = commands.DeleteItems(view.scene, items)
+        command.redo()
+        change_mock.assert_called_once_with()
+        assert list(view.scene.items_for_save()) == []
+        change_mock.reset_mock()
+        command.undo()
+        change_mock.assert_called_once_with()
+        assert set(view.scene.selectedItems(user_only=True)) == set(items)
+
+
 def test_move_items_by(qapp):
     item1 = BeePixmapItem(QtGui.QImage())
     item1.setPos(0, 0)
@@ -1,4 +1,5 @@
 import math
+import threading
 from unittest.mock import patch, MagicMock
 
 import pytest
@@ -604,6 +605,26 @@ def test_sample_color_at_when_pixmap_item(view):
     assert view.scene.sample_color_at(QtCore.QPointF(2, 2)) == color
 
 
+def test_sample_color_at_averages(view):
+    img = QtGui.QImage(10, 10, QtGui.QImage.Format.Format_ARGB32)
+    img.fill(QtGui.QColor(255, 0, 0))
+    img.setPixelColor(2, 2, QtGui.QColor(0, 0, 255))
+    item = BeePixmapItem(img, 'foo.png')
+    view.scene.addItem(item)
+    color = view.scene.sample_color_at(QtCore.QPointF(2, 2), 3)
+    assert color == QtGui.QColor(227, 0, 28)
+
+
+def test_release_sample_buffers(view, item):
+    view.scene.addItem(item)
+    item.release_sample_buffer = MagicMock()
+    view.scene.sample_color_at(QtCore.QPointF(2, 2))
+    assert view.scene.sampled_items == {item}
+    view.scene.release_sample_buffers()
+    item.release_sample_buffer.assert_called_once_with()
+    assert view.scene.sampled_items == set()
+
+
 def test_sample_color_at_when_text_item(view):
     item = BeeTextItem('foo bar baz')
     view.scene.addItem(item)
@@ -722,6 +743,22 @@ def test_has_single_image_selection_when_no_selection(view, item):
     assert view.scene.has_single_image_selection() is False
 
 
+def test_has_image_selection(view, item):
+    view.scene.addItem(item)
+    item.setSelected(True)
+    text = BeeTextItem('foo')
+    view.scene.addItem(text)
+    text.setSelected(True)
+    assert view.scene.has_image_selection() is True
+
+
+def test_has_image_selection_when_no_images(view):
+    item = BeeTextItem('foo')
+    view.scene.addItem(item)
+    item.setSelected(True)
+    assert view.scene.has_image_selection() is False
+
+
 def test_has_single_image_selection_when_multi_selection(view, item):
     view.scene.addItem(item)
     item.setSelected(True)
@@ -1036,6 +1073,89 @@ def test_mouse_move_event_when_no_rubberband(mouse_mock, view, imgfilename3x3):
     mouse_mock.assert_called_once_with(event)
 
 
+def rubberband_items(view, count):
+    items = []
+    for i in range(count):
+        item = BeePixmapItem(
+            QtGui.QImage(10, 10, QtGui.QImage.Format.Format_RGB32))
+        item.setPos(20 * i, 0)
+        view.scene.addItem(item)
+        items.append(item)
+    view.scene.active_mode = view.scene.RUBBERBAND_MODE
+    view.scene.event_start = QtCore.QPointF(-5, -5)
+    return items
+
+
+def rubberband_move(view, x, y):
+    event = MagicMock(scenePos=MagicMock(return_value=QtCore.QPointF(x, y)))
+    with patch('PyQt6.QtWidgets.QGraphicsScene.mouseMoveEvent'):
+        view.scene.mouseMoveEvent(event)
+
+
+def test_mouse_move_event_when_rubberband_coalesces_moves(view):
+    items = rubberband_items(view, 3)
+    rubberband_move(view, 5, 5)
+    assert view.scene.selectedItems(user_only=True) == [items[0]]
+    rubberband_move(view, 25, 5)
+    rubberband_move(view, 45, 5)
+    # Further moves within the same frame are applied later
+    assert view.scene.selectedItems(user_only=True) == [items[0]]
+    view.scene.on_rubberband_timer()
+    assert set(view.scene.selectedItems(user_only=True)) == set(items)
+
+
+def test_mouse_move_event_when_rubberband_deselects(view):
+    items = rubberband_items(view, 3)
+    rubberband_move(view, 45, 5)
+    assert set(view.scene.selectedItems(user_only=True)) == set(items)
+    view.scene.rubberband_timer.stop()
+    rubberband_move(view, 5, 5)
+    assert view.scene.selectedItems(user_only=True) == [items[0]]
+
+
+def test_mouse_move_event_when_rubberband_only_queries_delta(view):
+    items = rubberband_items(view, 3)
+    rubberband_move(view, 25, 5)
+    view.scene.rubberband_timer.stop()
+    with patch('PyQt6.QtWidgets.QGraphicsScene.items',
+               return_value=[items[2]]) as items_mock:
+        rubberband_move(view, 45, 5)
+        items_mock.assert_called_once()
+        assert items_mock.call_args[0][0] == QtCore.QRectF(25, -5, 20, 10)
+    assert set(view.scene.selectedItems(user_only=True)) == set(items)
+
+
+def test_mouse_move_event_when_rubberband_emits_selection_change_once(view):
+    rubberband_items(view, 3)
+    with patch.object(view.scene, 'on_selection_change') as change_mock:
+        view.scene.selectionChanged.disconnect()
+        view.scene.selectionChanged.connect(change_mock)
+        rubberband_move(view, 45, 5)
+        change_mock.assert_called_once_with()
+
+
+def test_mouse_move_event_when_rubberband_defers_outline(view):
+    rubberband_items(view, 3)
+    view.scene.multi_select_item.fit_selection_area = MagicMock()
+    rubberband_move(view, 45, 5)
+    view.scene.multi_select_item.fit_selection_area.assert_not_called()
+    assert view.scene.selection_outline_timer.isActive() is True
+    view.scene.update_selection_outline()
+    view.scene.multi_select_item.fit_selection_area.assert_called_once_with(
+        QtCore.QRectF(0, 0, 50, 10))
+
+
+def test_end_rubberband_mode_applies_pending_moves(view):
+    items = rubberband_items(view, 3)
+    rubberband_move(view, 5, 5)
+    rubberband_move(view, 45, 5)
+    view.scene.end_rubberband_mode()
+    assert set(view.scene.selectedItems(user_only=True)) == set(items)
+    assert view.scene.rubberband_timer.isActive() is False
+    assert view.scene.selection_outline_timer.isActive() is False
+    assert view.scene.multi_select_item.scene() == view.scene
+
+
 @patch('PyQt6.QtWidgets.QGraphicsScene.mouseReleaseEvent')
 def test_mouse_release_event_when_rubberband_active(mouse_mock, view):
     event = MagicMock()
@@ -1158,6 +1278,88 @@ def test_selected_items_user_only(view):
     assert item2 in selected
 
 
+def test_selected_items_user_only_cached(view):
+    item1 = BeePixmapItem(QtGui.QImage())
+    view.scene.addItem(item1)
+    item2 = BeeTextItem('foo')
+    view.scene.addItem(item2)
+    item1.setSelected(True)
+    item2.setSelected(True)
+    view.scene.invalidate_selection()
+    with patch('PyQt6.QtWidgets.QGraphicsScene.selectedItems',
+               return_value=[item1, item2]) as selected_mock:
+        assert view.scene.has_selection() is True
+        assert view.scene.has_multi_selection() is True
+        assert view.scene.has_image_selection() is True
+        assert set(view.scene.selectedItems(user_only=True)) == {
+            item1, item2}
+        selected_mock.assert_called_once_with()
+
+
+def test_selected_items_user_only_follows_selection_changes(view):
+    item1 = BeePixmapItem(QtGui.QImage())
+    view.scene.addItem(item1)
+    item2 = BeeTextItem('foo')
+    view.scene.addItem(item2)
+    item1.setSelected(True)
+    assert view.scene.has_single_image_selection() is True
+    item2.setSelected(True)
+    assert view.scene.has_multi_selection() is True
+    item1.setSelected(False)
+    assert view.scene.selectedItems(user_only=True) == [item2]
+    assert view.scene.has_image_selection() is False
+
+
+def test_selected_items_user_only_updated_incrementally(view):
+    items = [BeePixmapItem(QtGui.QImage()) for i in range(3)]
+    for item in items:
+        view.scene.addItem(item)
+    text = BeeTextItem('foo')
+    view.scene.addItem(text)
+    assert view.scene.has_selection() is False
+    with patch('PyQt6.QtWidgets.QGraphicsScene.selectedItems') as qt_mock:
+        items[0].setSelected(True)
+        text.setSelected(True)
+        assert view.scene.has_multi_selection() is True
+        assert view.scene.has_image_selection() is True
+        items[0].setSelected(False)
+        assert view.scene.get_user_selection() == (text,)
+        assert view.scene.has_image_selection() is False
+        view.scene.removeItem(text)
+        assert view.scene.has_selection() is False
+        view.scene.addItem(text)
+        assert view.scene.get_user_selection() == (text,)
+        qt_mock.assert_not_called()
+
+
+def test_selected_items_user_only_when_signals_blocked(view):
+    item = BeePixmapItem(QtGui.QImage())
+    view.scene.addItem(item)
+    assert view.scene.has_selection() is False
+    view.scene.blockSignals(True)
+    item.setSelected(True)
+    view.scene.blockSignals(False)
+    assert view.scene.selectedItems(user_only=True) == [item]
+
+
+def test_selected_items_user_only_after_remove(view):
+    item = BeePixmapItem(QtGui.QImage())
+    view.scene.addItem(item)
+    item.setSelected(True)
+    assert view.scene.has_selection() is True
+    view.scene.removeItem(item)
+    assert view.scene.has_selection() is False
+
+
+def test_selected_items_user_only_after_clear(view):
+    item = BeePixmapItem(QtGui.QImage())
+    view.scene.addItem(item)
+    item.setSelected(True)
+    assert view.scene.has_selection() is True
+    view.scene.clear()
+    assert view.scene.has_selection() is False
+
+
 def test_items_by_tpe(view):
     item1 = BeePixmapItem(QtGui.QImage())
     view.scene.addItem(item1)
@@ -1245,6 +1447,8 @@ def test_items_bounding_rect_two_items_selection_only(view):
                       return_value=QtCore.QRectF(0, 0, 100, 100)):
         with patch.object(item2, 'bounding_rect_unselected',
                           return_value=QtCore.QRectF(0, 0, 100, 100)):
+            item1.notify_geometry_change()
+            item2.notify_geometry_change()
             rect = view.scene.itemsBoundingRect(selection_only=True)
 
     assert rect.topLeft().x() == -33
@@ -1286,6 +1490,63 @@ def test_items_bounding_rect_when_no_items(view):
     assert rect == QtCore.QRectF(0, 0, 0, 0)
 
 
+def test_items_bounding_rect_follows_changes(view):
+    item1 = BeePixmapItem(
+        QtGui.QImage(100, 100, QtGui.QImage.Format.Format_RGB32))
+    view.scene.addItem(item1)
+    item2 = BeePixmapItem(
+        QtGui.QImage(100, 100, QtGui.QImage.Format.Format_RGB32))
+    view.scene.addItem(item2)
+    item2.setPos(50, 50)
+    assert view.scene.itemsBoundingRect() == QtCore.QRectF(0, 0, 150, 150)
+    item2.setScale(2)
+    assert view.scene.itemsBoundingRect() == QtCore.QRectF(0, 0, 250, 250)
+    item2.crop = QtCore.QRectF(0, 0, 10, 10)
+    assert view.scene.itemsBoundingRect() == QtCore.QRectF(0, 0, 100, 100)
+    item1.setRotation(90)
+    assert view.scene.itemsBoundingRect() == QtCore.QRectF(-100, 0, 170, 100)
+    view.scene.removeItem(item1)
+    assert view.scene.itemsBoundingRect() == QtCore.QRectF(50, 50, 20, 20)
+
+
+def test_items_bounding_rect_text_item_changes(view):
+    item = BeeTextItem('foo')
+    view.scene.addItem(item)
+    width = view.scene.itemsBoundingRect().width()
+    item.setPlainText('foo bar baz')
+    assert view.scene.itemsBoundingRect().width() > width
+
+
+def test_items_bounding_rect_cached(view, item):
+    view.scene.addItem(item)
+    view.scene.itemsBoundingRect()
+    with patch.object(view.scene, 'item_rect_to_scene') as rect_mock:
+        view.scene.itemsBoundingRect()
+        view.scene.itemsBoundingRect(selection_only=True)
+        rect_mock.assert_not_called()
+
+
+def test_items_bounding_rect_extends_without_recalculating(view, item):
+    view.scene.addItem(item)
+    view.scene.itemsBoundingRect()
+    item2 = BeePixmapItem(
+        QtGui.QImage(10, 10, QtGui.QImage.Format.Format_RGB32))
+    view.scene.addItem(item2)
+    item2.setPos(50, 50)
+    with patch.object(view.scene, 'item_rect_to_scene',
+                      wraps=view.scene.item_rect_to_scene) as rect_mock:
+        rect = view.scene.itemsBoundingRect()
+        rect_mock.assert_called_once_with(item2)
+    assert rect == QtCore.QRectF(0, 0, 60, 60)
+
+
+def test_items_bounding_rect_after_clear(view, item):
+    view.scene.addItem(item)
+    view.scene.itemsBoundingRect()
+    view.scene.clear()
+    assert view.scene.itemsBoundingRect() == QtCore.QRectF(0, 0, 0, 0)
+
+
 def test_get_selection_center(view):
     with patch('beeref.scene.BeeGraphicsScene.itemsBoundingRect',
                return_value=QtCore.QRectF(10, 20, 100, 60)):
@@ -1375,6 +1636,163 @@ def test_on_change_when_no_multi_select(view):
     view.scene.multi_select_item.fit_selection_area.assert_not_called()
 
 
+def test_decode_pending_items(view, item):
+    view.scene.addItem(item)
+    item.setPos(10, 10)
+    item.set_lazy_source(MagicMock())
+    other = BeePixmapItem(QtGui.QImage())
+    other.set_lazy_source(MagicMock())
+    other.crop = QtCore.QRectF(0, 0, 10, 10)
+    other.setPos(500, 500)
+    view.scene.addItem(other)
+    view.scene.addItem(BeeTextItem('foo'))
+    view.scene.lazy_decoder.decode_later = MagicMock()
+    view.scene.decode_pending_items(QtCore.QRectF(0, 0, 100, 100))
+    view.scene.lazy_decoder.decode_later.assert_called_once_with(item, 1)
+
+
+def test_decode_pending_items_when_zoomed_out(view, item):
+    view.scene.addItem(item)
+    item.set_lazy_source(MagicMock())
+    item.set_preview_sources({4: MagicMock(), 16: MagicMock()})
+    item.setScale(0.5)
+    view.scene.lazy_decoder.decode_later = MagicMock()
+    view.scene.decode_pending_items(QtCore.QRectF(0, 0, 100, 100), 0.1)
+    view.scene.lazy_decoder.decode_later.assert_called_once_with(item, 16)
+
+
+def test_free_pixmap_memory(view, settings, imgdata3x3):
+    settings.setValue('Items/pixmap_memory_budget', 1)
+    items = []
+    for i in range(3):
+        item = BeePixmapItem(
+            QtGui.QImage(300, 300, QtGui.QImage.Format.Format_RGB32))
+        item.source_data = imgdata3x3
+        item.setPos(1000 * i, 0)
+        item.last_painted = 3 - i
+        view.scene.addItem(item)
+        items.append(item)
+    view.scene.free_pixmap_memory(QtCore.QRectF(0, 0, 100, 100))
+    # The visible item is kept although it has been painted first
+    assert items[0].pixmap_pending is False
+    assert items[1].pixmap_pending is False
+    assert items[2].pixmap_pending is True
+
+
+def test_free_pixmap_memory_trims_tiled_items(view, settings, tiled_item):
+    settings.setValue('Items/pixmap_memory_budget', 1)
+    img = QtGui.QImage(1000, 1000, QtGui.QImage.Format.Format_RGB32)
+    tiled_item.set_tile((8, 0, 0), img)
+    tiled_item.set_tile((1, 0, 0), img)
+    tiled_item.setPos(1000, 0)
+    view.scene.addItem(tiled_item)
+    view.scene.free_pixmap_memory(QtCore.QRectF(0, 0, 100, 100))
+    assert list(tiled_item.tiles) == [(8, 0, 0)]
+
+
+def test_free_pixmap_memory_when_within_budget(view, settings, item):
+    settings.setValue('Items/pixmap_memory_budget', 1)
+    item.drop_pixmap = MagicMock()
+    view.scene.addItem(item)
+    view.scene.free_pixmap_memory(QtCore.QRectF(500, 500, 10, 10))
+    item.drop_pixmap.assert_not_called()
+
+
+def test_free_pixmap_memory_when_no_budget(view, settings):
+    settings.setValue('Items/pixmap_memory_budget', 0)
+    item = BeePixmapItem(
+        QtGui.QImage(1000, 1000, QtGui.QImage.Format.Format_RGB32))
+    item.drop_pixmap = MagicMock()
+    view.scene.addItem(item)
+    view.scene.free_pixmap_memory(QtCore.QRectF(5000, 5000, 10, 10))
+    item.drop_pixmap.assert_not_called()
+
+
+def test_batch_emits_selection_change_once(view):
+    view.scene.selectionChanged = MagicMock()
+    items = [BeeTextItem('foo') for i in range(3)]
+    with view.scene.batch():
+        for item in items:
+            view.scene.addItem(item)
+            item.setSelected(True)
+        assert view.scene.signalsBlocked() is True
+    assert view.scene.signalsBlocked() is False
+    assert set(view.scene.selectedItems(user_only=True)) == set(items)
+    view.scene.selectionChanged.emit.assert_called_once_with()
+
+
+def test_batch_no_selection_change_when_selection_unchanged(view):
+    view.scene.selectionChanged = MagicMock()
+    with view.scene.batch():
+        view.scene.addItem(BeeTextItem('foo'))
+    view.scene.selectionChanged.emit.assert_not_called()
+
+
+def test_batch_when_nested(view):
+    view.scene.selectionChanged = MagicMock()
+    item = BeeTextItem('foo')
+    with view.scene.batch():
+        with view.scene.batch():
+            view.scene.addItem(item)
+            item.setSelected(True)
+        assert view.scene.signalsBlocked() is True
+        view.scene.selectionChanged.emit.assert_not_called()
+    view.scene.selectionChanged.emit.assert_called_once_with()
+
+
+def test_batch_updates_multi_select_item(view):
+    items = [BeeTextItem('foo') for i in range(3)]
+    with view.scene.batch():
+        for item in items:
+            view.scene.addItem(item)
+            item.setSelected(True)
+        assert view.scene.multi_select_item.scene() is None
+    assert view.scene.multi_select_item.scene() == view.scene
+
+
+def test_batch_skips_selection_handling_per_item(view):
+    item = BeePixmapItem(QtGui.QImage())
+    view.scene.addItem(item)
+    view.scene.active_mode = view.scene.MOVE_MODE
+    with patch.object(view.scene, 'has_selection') as has_selection_mock:
+        with view.scene.batch():
+            assert view.scene.batch_ongoing() is True
+            item.setSelected(True)
+            has_selection_mock.assert_not_called()
+    assert view.scene.batch_ongoing() is False
+    assert view.scene.selectedItems(user_only=True) == [item]
+
+
+@pytest.mark.parametrize('command_cls', [commands.InsertItems,
+                                         commands.DeleteItems])
+def test_batch_selection_handling_doesnt_scale_with_items(view, command_cls):
+    qt_selected_items = QtWidgets.QGraphicsScene.selectedItems
+
+    def count_calls(number):
+        view.scene.clear()
+        items = [BeePixmapItem(QtGui.QImage()) for i in range(number)]
+        if command_cls is commands.DeleteItems:
+            for item in items:
+                view.scene.addItem(item)
+        command = command_cls(view.scene, items)
+        with patch.object(view.scene, 'has_selection',
+                          wraps=view.scene.has_selection) as has_mock, \
+                patch('PyQt6.QtWidgets.QGraphicsScene.selectedItems',
+                      wraps=lambda: qt_selected_items(view.scene)) as qt_mock:
+            command.redo()
+            command.undo()
+            return has_mock.call_count + qt_mock.call_count
+
+    assert count_calls(5) == count_calls(50)
+
+
+def test_batch_restores_signals_on_error(view):
+    with pytest.raises(ValueError):
+        with view.scene.batch():
+            raise ValueError()
+    assert view.scene.signalsBlocked() is False
+
+
 def test_add_queued_items_unselected(view):
     data = {'type': 'text', 'z': 0.33, 'data': {'text': 'foo'}}
     view.scene.add_item_later(data, selected=False)
@@ -1402,6 +1820,92 @@ def test_add_queued_items_when_no_items(view):
     assert view.scene.items() == []
 
 
+def test_add_queued_items_emits_selection_change_once(view):
+    view.scene.selectionChanged = MagicMock()
+    for i in range(3):
+        data = {'type': 'text', 'z': 0.33, 'data': {'text': 'foo'}}
+        view.scene.add_item_later(data, selected=True)
+    view.scene.add_queued_items()
+    assert len(view.scene.selectedItems()) == 3
+    view.scene.selectionChanged.emit.assert_called_once_with()
+
+
+def test_add_queued_items_no_selection_change_when_unselected(view):
+    view.scene.selectionChanged = MagicMock()
+    data = {'type': 'text', 'z': 0.33, 'data': {'text': 'foo'}}
+    view.scene.add_item_later(data, selected=False)
+    view.scene.add_queued_items()
+    view.scene.selectionChanged.emit.assert_not_called()
+
+
+def test_add_queued_items_adds_multi_select_item(view):
+    for i in range(2):
+        data = {'type': 'text', 'z': 0.33, 'data': {'text': 'foo'}}
+        view.scene.add_item_later(data, selected=True)
+    view.scene.add_queued_items()
+    assert view.scene.multi_select_item.scene() == view.scene
+
+
+def test_add_item_later_on_main_thread_adds_queued_items_when_full(view):
+    view.scene.MAX_QUEUED_ITEMS = 2
+    view.scene.items_to_add.maxsize = 2
+    for i in range(5):
+        data = {'type': 'text', 'z': 0.33, 'data': {'text': 'foo'}}
+        assert view.scene.add_item_later(data) is True
+    assert len(view.scene.items()) == 4
+    assert view.scene.items_to_add.qsize() == 1
+
+
+def test_add_item_later_with_worker_waits_until_caught_up(view):
+    view.scene.items_to_add.maxsize = 1
+    data = {'type': 'text', 'z': 0.33, 'data': {'text': 'foo'}}
+    view.scene.add_item_later(data)
+    worker = MagicMock(canceled=False)
+    catch_up = threading.Timer(0.1, view.scene.items_to_add.get)
+    catch_up.start()
+    assert view.scene.add_item_later(data, worker=worker) is True
+    assert catch_up.finished.is_set()
+    assert view.scene.items_to_add.qsize() == 1
+    assert len(view.scene.items()) == 0
+
+
+def test_add_item_later_with_worker_returns_when_canceled(view):
+    view.scene.items_to_add.maxsize = 1
+    data = {'type': 'text', 'z': 0.33, 'data': {'text': 'foo'}}
+    view.scene.add_item_later(data)
+    worker = MagicMock(canceled=True)
+    with patch.object(view.scene, 'QUEUE_CANCEL_CHECK', 0.001):
+        assert view.scene.add_item_later(data, worker=worker) is False
+    assert view.scene.items_to_add.qsize() == 1
+    assert len(view.scene.items()) == 0
+
+
+def test_add_queued_items_with_budget_continues_later(view, qtbot):
+    for i in range(3):
+        data = {'type': 'text', 'z': 0.33, 'data': {'text': 'foo'}}
+        view.scene.add_item_later(data)
+    view.scene.add_queued_items(budget=0)
+    assert len(view.scene.items()) == 1
+    assert view.scene.add_queued_timer.isActive()
+    qtbot.waitUntil(lambda: len(view.scene.items()) == 3)
+    assert view.scene.items_to_add.empty()
+
+
+def test_add_queued_items_with_budget_adds_all_when_in_time(view):
+    for i in range(3):
+        data = {'type': 'text', 'z': 0.33, 'data': {'text': 'foo'}}
+        view.scene.add_item_later(data)
+    view.scene.add_queued_items(budget=10000)
+    assert len(view.scene.items()) == 3
+    assert view.scene.add_queued_timer.isActive() is False
+
+
+def test_add_queued_items_without_budget_stops_timer(view):
+    view.scene.add_queued_timer.start()
+    view.scene.add_queued_items()
+    assert view.scene.add_queued_timer.isActive() is False
+
+
 def test_add_queued_items_ignores_unknown_type(view):
     data = {'type': 'foo', 'z': 0.33, 'data': {'bar': 'baz'}}
     view.scene.add_item_later(data, selected=False)
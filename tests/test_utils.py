@@ -57,6 +57,38 @@ def test_get_rect_from_points_given_topright_bottomleft():
     assert rect.bottomRight().y() == 40
 
 
+def test_subtract_rect_when_no_overlap():
+    rect1 = QtCore.QRectF(0, 0, 10, 10)
+    rect2 = QtCore.QRectF(20, 20, 10, 10)
+    assert utils.subtract_rect(rect1, rect2) == [rect1]
+
+
+def test_subtract_rect_when_contained():
+    rect1 = QtCore.QRectF(5, 5, 10, 10)
+    rect2 = QtCore.QRectF(0, 0, 20, 20)
+    assert utils.subtract_rect(rect1, rect2) == []
+
+
+def test_subtract_rect_when_sharing_corner():
+    rect1 = QtCore.QRectF(0, 0, 30, 20)
+    rect2 = QtCore.QRectF(0, 0, 10, 10)
+    assert utils.subtract_rect(rect1, rect2) == [
+        QtCore.QRectF(0, 10, 30, 10),
+        QtCore.QRectF(10, 0, 20, 10),
+    ]
+
+
+def test_subtract_rect_when_inside():
+    rect1 = QtCore.QRectF(0, 0, 30, 30)
+    rect2 = QtCore.QRectF(10, 10, 10, 10)
+    assert utils.subtract_rect(rect1, rect2) == [
+        QtCore.QRectF(0, 0, 30, 10),
+        QtCore.QRectF(0, 20, 30, 10),
+        QtCore.QRectF(0, 10, 10, 10),
+        QtCore.QRectF(20, 10, 10, 10),
+    ]
+
+
 @pytest.mark.parametrize('number,base,expected',
                          [(33, 5, 35),
                           (-33, 5, -35),
@@ -95,3 +127,108 @@ def test_actionlist_acts_as_list():
     actionlist = utils.ActionList([action1, action2])
     actionlist[0] == action1
     actionlist[1] == action2
+
+
+def test_image_to_bytes(qapp):
+    img = QtGui.QImage(3, 3, QtGui.QImage.Format.Format_RGB32)
+    data = utils.image_to_bytes(img, 'png')
+    assert data.startswith(b'\x89PNG')
+    assert QtGui.QImage.fromData(data).size() == QtCore.QSize(3, 3)
+
+
+def test_image_reader(imgdata3x3):
+    reader = utils.image_reader(imgdata3x3)
+    assert reader.size() == QtCore.QSize(3, 3)
+    assert reader.read().size() == QtCore.QSize(3, 3)
+
+
+def test_image_format_png(imgdata3x3):
+    assert utils.image_format(imgdata3x3) == 'png'
+
+
+def test_image_format_jpg(qapp):
+    img = QtGui.QImage(3, 3, QtGui.QImage.Format.Format_RGB32)
+    assert utils.image_format(utils.image_to_bytes(img, 'jpg')) == 'jpeg'
+
+
+def test_image_format_unknown(qapp):
+    assert utils.image_format(b'foo') == ''
+
+
+def test_to_grayscale(qapp):
+    img = QtGui.QImage(2, 1, QtGui.QImage.Format.Format_RGB32)
+    img.setPixelColor(0, 0, QtGui.QColor(255, 0, 0))
+    img.setPixelColor(1, 0, QtGui.QColor(0, 0, 255))
+    result = utils.to_grayscale(img)
+    assert result.isGrayscale() is True
+    assert result.hasAlphaChannel() is False
+    assert result.pixelColor(0, 0) != result.pixelColor(1, 0)
+
+
+def test_to_grayscale_keeps_alpha(qapp):
+    img = QtGui.QImage(2, 1, QtGui.QImage.Format.Format_ARGB32)
+    img.setPixelColor(0, 0, QtGui.QColor(255, 0, 0, 255))
+    img.setPixelColor(1, 0, QtGui.QColor(255, 0, 0, 0))
+    result = utils.to_grayscale(img)
+    color = result.pixelColor(0, 0)
+    assert color.red() == color.green() == color.blue()
+    assert color.alpha() == 255
+    assert result.pixelColor(1, 0).alpha() == 0
+
+
+def test_sample_image(qapp):
+    img = QtGui.QImage(4, 4, QtGui.QImage.Format.Format_ARGB32)
+    img.fill(QtGui.QColor(255, 0, 0))
+    img.setPixelColor(1, 1, QtGui.QColor(0, 0, 255))
+    assert utils.sample_image(img, 1, 1) == QtGui.QColor(0, 0, 255)
+    assert utils.sample_image(img, 2, 2) == QtGui.QColor(255, 0, 0)
+
+
+def test_sample_image_averages(qapp):
+    img = QtGui.QImage(4, 4, QtGui.QImage.Format.Format_ARGB32)
+    img.fill(QtGui.QColor(0, 0, 0, 0))
+    img.setPixelColor(0, 0, QtGui.QColor(255, 0, 0))
+    img.setPixelColor(1, 0, QtGui.QColor(0, 0, 255))
+    # Transparent pixels don't contribute colour, only transparency:
+    color = utils.sample_image(img, 0, 0, size=3)
+    assert color == QtGui.QColor(128, 0, 128, 128)
+
+
+def test_sample_image_when_transparent(qapp):
+    img = QtGui.QImage(4, 4, QtGui.QImage.Format.Format_ARGB32)
+    img.fill(QtGui.QColor(0, 0, 0, 0))
+    assert utils.sample_image(img, 1, 1) is None
+    assert utils.sample_image(img, 1, 1, size=3) is None
+
+
+def test_sample_image_when_outside(qapp):
+    img = QtGui.QImage(4, 4, QtGui.QImage.Format.Format_ARGB32)
+    img.fill(QtGui.QColor(255, 0, 0))
+    assert utils.sample_image(img, 10, 1) is None
+
+
+def test_parallel_map_keeps_order():
+    result = utils.parallel_map(lambda x: x * 2, range(50), max_workers=3)
+    assert list(result) == [x * 2 for x in range(50)]
+
+
+def test_parallel_map_limits_calls_in_flight():
+    called = []
+
+    def func(x):
+        called.append(x)
+        return x
+
+    result = utils.parallel_map(func, range(50), max_workers=2)
+    assert next(result) == 0
+    assert len(called) <= 5
+    result.close()
+    assert len(called) <= 5
+
+
+def test_parallel_map_propagates_exceptions():
+    def func(x):
+        raise ValueError(x)
+
+    with pytest.raises(ValueError):
+        list(utils.parallel_map(func, [1, 2]))
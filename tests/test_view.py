@@ -2,12 +2,12 @@ import os.path
 from pathlib import Path
 import shutil
 import sqlite3
-from unittest.mock import MagicMock, patch, mock_open
+from unittest.mock import MagicMock, PropertyMock, patch, mock_open
 
 from PyQt6 import QtCore, QtGui, QtWidgets
 from PyQt6.QtCore import Qt
 
-from beeref import commands, widgets
+from beeref import commands, fileio, widgets
 from beeref.actions import actions
 from beeref.config import logfile_name
 from beeref.items import BeePixmapItem, BeeTextItem
@@ -260,6 +260,13 @@ def test_open_from_file(clear_mock, view, qtbot):
     view.on_loading_finished.assert_called_once_with(filename, [])
 
 
+def test_on_items_loaded_adds_items_with_budget(view):
+    view.scene.add_queued_items = MagicMock()
+    view.on_items_loaded(3)
+    view.scene.add_queued_items.assert_called_once_with(
+        budget=view.scene.ADD_ITEMS_BUDGET)
+
+
 def test_open_from_file_when_error(view, qtbot):
     view.on_loading_finished = MagicMock()
     view.open_from_file('uieauiae')
@@ -327,6 +334,16 @@ def test_on_action_save_as(dialog_mock, view, imgfilename3x3, tmpdir):
     view.cancel_active_modes.assert_called_once_with()
 
 
+def test_do_save_applies_snapshot_when_finished(view, qtbot, item, tmpdir):
+    view.scene.addItem(item)
+    filename = os.path.join(tmpdir, 'test.bee')
+    view.do_save(filename, create_new=True)
+    view.worker.wait()
+    qtbot.waitUntil(lambda: view.filename == filename)
+    assert item.save_id == 1
+    assert item.saved_row is not None
+
+
 @patch('PyQt6.QtWidgets.QFileDialog.getSaveFileName')
 @patch('beeref.view.BeeGraphicsView.do_save')
 def test_on_action_save_as_when_no_filename(
@@ -401,6 +418,226 @@ def test_on_action_save_when_no_filename(save_as_mock, view, imgfilename3x3):
     view.cancel_active_modes.assert_called_once_with()
 
 
+@patch('beeref.view.BeeGraphicsView.recovery_filename',
+       new_callable=PropertyMock)
+def test_autosave_untitled_saves_to_recovery_file(
+        recovery_mock, view, qtbot, item, tmpdir):
+    recovery_mock.return_value = os.path.join(tmpdir, 'recovery.bee')
+    view.scene.addItem(item)
+    view.undo_stack.push(commands.InsertItems(view.scene, [item]))
+    view.on_autosave_finished = MagicMock()
+    view.on_autosave_timer()
+    qtbot.waitUntil(lambda: view.on_autosave_finished.called is True)
+    view.on_autosave_finished.assert_called_once_with(
+        recovery_mock.return_value, [])
+    assert os.path.exists(recovery_mock.return_value)
+    assert view.filename is None
+    view.on_close()
+    assert not os.path.exists(recovery_mock.return_value)
+
+
+@patch('beeref.view.BeeGraphicsView.recovery_filename',
+       new_callable=PropertyMock)
+def test_autosave_untitled_keeps_source_data(
+        recovery_mock, view, qtbot, item, tmpdir, settings):
+    settings.setValue('Items/image_storage_format', 'best')
+    recovery_mock.return_value = os.path.join(tmpdir, 'recovery.bee')
+    item.source_data = item.pixmap_to_bytes()[0]
+    view.scene.addItem(item)
+    view.undo_stack.push(commands.InsertItems(view.scene, [item]))
+    view.on_autosave_timer()
+    qtbot.waitUntil(lambda: view.autosave_worker.isFinished() is True)
+    view.wait_for_autosave()
+    assert item.save_id
+    # The recovery file gets removed again:
+    assert item.source_data is not None
+    view.on_close()
+
+
+def test_autosave_titled_saves_to_file(view, qtbot, item, tmpdir):
+    view.filename = os.path.join(tmpdir, 'test.bee')
+    view.scene.addItem(item)
+    view.undo_stack.push(commands.InsertItems(view.scene, [item]))
+    view.on_autosave_timer()
+    qtbot.waitUntil(lambda: view.undo_stack.isClean() is True)
+    assert os.path.exists(view.filename)
+    assert not os.path.exists(f'{view.filename}-wal')
+    assert item.save_id
+
+
+def test_autosave_when_clean(view, item):
+    view.do_autosave = MagicMock()
+    view.on_autosave_timer()
+    view.do_autosave.assert_not_called()
+
+
+def test_autosave_when_disabled(view, item, settings):
+    settings.setValue('Save/autosave_interval', 0)
+    view.undo_stack.push(commands.InsertItems(view.scene, [item]))
+    view.do_autosave = MagicMock()
+    view.on_autosave_timer()
+    view.do_autosave.assert_not_called()
+    assert view.autosave_timer.interval() == 60000
+
+
+def test_autosave_updates_interval(view, settings):
+    settings.setValue('Save/autosave_interval', 3)
+    view.on_autosave_timer()
+    assert view.autosave_timer.interval() == 180000
+
+
+def test_autosave_skips_when_worker_running(view, item, tmpdir):
+    view.filename = os.path.join(tmpdir, 'test.bee')
+    view.worker = MagicMock()
+    view.worker.isRunning.return_value = True
+    view.do_autosave()
+    assert view.autosave_worker is None
+
+
+def test_on_autosave_finished_when_changed_meanwhile(view, item, tmpdir):
+    view.autosave_snapshot = MagicMock()
+    view.filename = os.path.join(tmpdir, 'test.bee')
+    view.autosave_index = 0
+    view.undo_stack.push(commands.InsertItems(view.scene, [item]))
+    view.on_autosave_finished(view.filename, [])
+    assert view.undo_stack.isClean() is False
+
+
+def test_on_autosave_finished_when_error(view, item, tmpdir):
+    view.autosave_snapshot = MagicMock()
+    view.filename = os.path.join(tmpdir, 'test.bee')
+    view.undo_stack.push(commands.InsertItems(view.scene, [item]))
+    view.autosave_index = view.undo_stack.index()
+    view.on_autosave_finished(view.filename, ['foo'])
+    assert view.undo_stack.isClean() is False
+    view.autosave_snapshot.apply.assert_called_once_with()
+
+
+def test_wait_for_autosave_when_running(view):
+    view.autosave_snapshot = MagicMock()
+    view.autosave_worker = fileio.ThreadedIO(
+        lambda worker: QtCore.QThread.msleep(100))
+    view.autosave_worker.start()
+    with patch.object(view.autosave_worker, 'wait') as wait_mock:
+        view.wait_for_autosave()
+        wait_mock.assert_not_called()
+    assert view.autosave_worker.isFinished() is True
+    view.autosave_snapshot.apply.assert_called_once_with()
+
+
+def test_wait_for_autosave_when_no_autosave(view):
+    view.autosave_snapshot = MagicMock()
+    view.wait_for_autosave()
+    view.autosave_snapshot.apply.assert_not_called()
+
+
+@patch('beeref.view.BeeGraphicsView.recovery_filename',
+       new_callable=PropertyMock)
+def test_acquire_recovery_file_when_used_by_other_instance(
+        recovery_mock, view, tmpdir):
+    recovery_mock.return_value = os.path.join(tmpdir, 'recovery.bee')
+    lock = QtCore.QLockFile(f'{recovery_mock.return_value}.lock')
+    lock.tryLock(0)
+    assert view.acquire_recovery_file() is False
+    lock.unlock()
+    assert view.acquire_recovery_file() is True
+    view.recovery_lock.unlock()
+
+
+@patch('PyQt6.QtWidgets.QMessageBox.question',
+       return_value=QtWidgets.QMessageBox.StandardButton.Yes)
+@patch('beeref.view.BeeGraphicsView.recovery_filename',
+       new_callable=PropertyMock)
+def test_offer_recovery_when_accepted(
+        recovery_mock, msg_mock, view, qtbot, tmpdir):
+    recovery_mock.return_value = os.path.join(tmpdir, 'recovery.bee')
+    root = os.path.dirname(__file__)
+    shutil.copyfile(os.path.join(root, 'assets', 'test1item.bee'),
+                    recovery_mock.return_value)
+    view.offer_recovery()
+    msg_mock.assert_called_once()
+    qtbot.waitUntil(lambda: len(view.scene.items()) == 1)
+    view.worker.wait()
+    qtbot.waitUntil(lambda: view.undo_stack.isClean() is False)
+    item = view.scene.items()[0]
+    assert item.pixmap_pending is False
+    assert view.filename is None
+    view.recovery_lock.unlock()
+
+
+@patch('PyQt6.QtWidgets.QMessageBox.question',
+       return_value=QtWidgets.QMessageBox.StandardButton.No)
+@patch('beeref.view.BeeGraphicsView.recovery_filename',
+       new_callable=PropertyMock)
+def test_offer_recovery_when_declined(recovery_mock, msg_mock, view, tmpdir):
+    recovery_mock.return_value = os.path.join(tmpdir, 'recovery.bee')
+    root = os.path.dirname(__file__)
+    shutil.copyfile(os.path.join(root, 'assets', 'test1item.bee'),
+                    recovery_mock.return_value)
+    view.offer_recovery()
+    msg_mock.assert_called_once()
+    assert not os.path.exists(recovery_mock.return_value)
+    assert view.scene.items() == []
+    view.recovery_lock.unlock()
+
+
+@patch('PyQt6.QtWidgets.QMessageBox.question')
+@patch('beeref.view.BeeGraphicsView.recovery_filename',
+       new_callable=PropertyMock)
+def test_offer_recovery_when_filenames_given(
+        recovery_mock, msg_mock, view, tmpdir, commandline_args):
+    recovery_mock.return_value = os.path.join(tmpdir, 'recovery.bee')
+    root = os.path.dirname(__file__)
+    shutil.copyfile(os.path.join(root, 'assets', 'test1item.bee'),
+                    recovery_mock.return_value)
+    commandline_args.filenames = ['test.bee']
+    view.offer_recovery()
+    msg_mock.assert_not_called()
+    assert os.path.exists(recovery_mock.return_value)
+    assert view.recovery_lock is None
+
+
+@patch('PyQt6.QtWidgets.QMessageBox.question')
+@patch('beeref.view.BeeGraphicsView.recovery_filename',
+       new_callable=PropertyMock)
+def test_offer_recovery_when_worker_running(
+        recovery_mock, msg_mock, view, tmpdir):
+    recovery_mock.return_value = os.path.join(tmpdir, 'recovery.bee')
+    root = os.path.dirname(__file__)
+    shutil.copyfile(os.path.join(root, 'assets', 'test1item.bee'),
+                    recovery_mock.return_value)
+    view.worker = MagicMock()
+    view.worker.isRunning.return_value = True
+    view.offer_recovery()
+    msg_mock.assert_not_called()
+    assert os.path.exists(recovery_mock.return_value)
+    assert view.recovery_lock is None
+
+
+@patch('PyQt6.QtWidgets.QMessageBox.question')
+@patch('beeref.view.BeeGraphicsView.recovery_filename',
+       new_callable=PropertyMock)
+def test_offer_recovery_when_no_recovery_file(
+        recovery_mock, msg_mock, view, tmpdir):
+    recovery_mock.return_value = os.path.join(tmpdir, 'recovery.bee')
+    view.offer_recovery()
+    msg_mock.assert_not_called()
+    assert view.recovery_lock is None
+
+
+@patch('beeref.view.BeeGraphicsView.recovery_filename',
+       new_callable=PropertyMock)
+def test_on_saving_finished_discards_recovery_file(
+        recovery_mock, view, tmpdir):
+    recovery_mock.return_value = os.path.join(tmpdir, 'recovery.bee')
+    Path(recovery_mock.return_value).touch()
+    view.save_snapshot = MagicMock()
+    view.acquire_recovery_file()
+    view.on_saving_finished(os.path.join(tmpdir, 'test.bee'), [])
+    assert not os.path.exists(recovery_mock.return_value)
+    view.recovery_lock.unlock()
+
+
 @patch('beeref.widgets.SceneToPixmapExporterDialog.exec')
 @patch('beeref.widgets.SceneToPixmapExporterDialog.value')
 @patch('PyQt6.QtWidgets.QFileDialog.getSaveFileName')
@@ -744,6 +981,19 @@ def test_on_action_paste_external_existing_scene(
     view.cancel_active_modes.assert_called_once_with()
 
 
+@patch('PyQt6.QtGui.QClipboard.mimeData')
+@patch('PyQt6.QtGui.QClipboard.image')
+def test_on_action_paste_external_keeps_encoded_data(
+        clipboard_mock, mimedata_mock, view, imgfilename3x3, imgdata3x3):
+    clipboard_mock.return_value = QtGui.QImage(imgfilename3x3)
+    mimedata = QtCore.QMimeData()
+    mimedata.setData('image/png', imgdata3x3)
+    mimedata_mock.return_value = mimedata
+    view.on_action_paste()
+    assert len(view.scene.items()) == 1
+    assert view.scene.items()[0].source_data == imgdata3x3
+
+
 @patch('beeref.scene.BeeGraphicsScene.clearSelection')
 @patch('PyQt6.QtGui.QClipboard.mimeData')
 def test_on_action_paste_internal(mimedata_mock, clear_mock, view):
@@ -820,6 +1070,17 @@ def test_on_selection_changed_grayscale_action_ignores_textitem(view):
     assert actions.actions['grayscale'].qaction.isChecked() is False
 
 
+@patch('beeref.widgets.color_gamut.GamutDialog')
+def test_on_action_show_color_gamut(dialog_mock, view, item):
+    view.scene.addItem(item)
+    item.setSelected(True)
+    text = BeeTextItem('foo')
+    view.scene.addItem(text)
+    text.setSelected(True)
+    view.on_action_show_color_gamut()
+    dialog_mock.assert_called_once_with(view, [item])
+
+
 def test_on_action_reset_scale(view, item):
     view.scene.addItem(item)
     item.setScale(2)
@@ -1064,6 +1325,21 @@ def test_on_action_grayscale(view):
     assert pixmapitem2.grayscale is False
 
 
+def test_cancel_sample_color_mode_releases_sample_buffers(view):
+    view.scene.release_sample_buffers = MagicMock()
+    view.active_mode = view.SAMPLE_COLOR_MODE
+    view.cancel_sample_color_mode()
+    view.scene.release_sample_buffers.assert_called_once_with()
+
+
+def test_sample_color_at_uses_sample_size(view, settings):
+    settings.setValue('Items/color_sample_size', 5)
+    view.scene.sample_color_at = MagicMock(return_value='foo')
+    assert view.sample_color_at(QtCore.QPoint(10, 20)) == 'foo'
+    view.scene.sample_color_at.assert_called_once_with(
+        view.mapToScene(QtCore.QPoint(10, 20)), 5)
+
+
 def test_cancel_active_modes_when_sample_color_mode(view):
     view.active_mode = view.SAMPLE_COLOR_MODE
     view.sample_color_widget = widgets.SampleColorWidget(
@@ -1133,6 +1409,24 @@ def test_scale(view_scale_mock, recalc_mock, view):
     assert view.get_scale() == 3.3
 
 
+def test_scale_schedules_decode(view):
+    view.decode_timer.start = MagicMock()
+    view.scale(3.3, 3.3)
+    view.decode_timer.start.assert_called_once_with()
+
+
+def test_decode_visible_items(view):
+    view.scene.decode_pending_items = MagicMock()
+    view.scene.free_pixmap_memory = MagicMock()
+    view.decode_visible_items()
+    view.scene.free_pixmap_memory.assert_called_once()
+    view.scene.decode_pending_items.assert_called_once()
+    rect = view.scene.decode_pending_items.call_args[0][0]
+    visible = view.mapToScene(view.viewport().rect()).boundingRect()
+    assert rect.contains(visible)
+    assert rect.width() > visible.width()
+
+
 @patch('PyQt6.QtWidgets.QScrollBar.setValue')
 def test_pan(scroll_value_mock, view, item):
     view.scene.addItem(item)
@@ -1675,3 +1969,16 @@ def test_drop_when_img(view, imgfilename3x3):
     view.dropEvent(event)
     assert len(view.scene.items()) == 1
     assert view.scene.items()[0].isSelected() is True
+
+
+def test_drop_when_img_keeps_encoded_data(view, imgfilename3x3, imgdata3x3):
+    mimedata = QtCore.QMimeData()
+    mimedata.setImageData(QtGui.QImage(imgfilename3x3))
+    mimedata.setData('image/png', imgdata3x3)
+    event = MagicMock()
+    event.mimeData.return_value = mimedata
+    event.position.return_value = QtCore.QPointF(10.0, 20.0)
+
+    view.dropEvent(event)
+    assert len(view.scene.items()) == 1
+    assert view.scene.items()[0].source_data == imgdata3x3
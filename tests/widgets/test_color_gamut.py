@@ -13,10 +13,10 @@ from beeref.widgets.color_gamut import (
 def test_gamut_painter_thread_generates_image(view, imgfilename3x3):
     item = BeePixmapItem(QtGui.QImage(imgfilename3x3))
     view.scene.addItem(item)
-    dialog = GamutDialog(view, item)
+    dialog = GamutDialog(view, [item])
     dialog.threshold_input.setValue(0)
-    widget = GamutWidget(dialog, item)
-    worker = GamutPainterThread(widget, item)
+    widget = GamutWidget(dialog, [item])
+    worker = GamutPainterThread(widget, [item])
     mock = MagicMock()
     worker.finished.connect(mock)
     worker.run()
@@ -32,10 +32,10 @@ def test_gamut_painter_thread_generates_image_below_threshold(
         view, imgfilename3x3):
     item = BeePixmapItem(QtGui.QImage(imgfilename3x3))
     view.scene.addItem(item)
-    dialog = GamutDialog(view, item)
+    dialog = GamutDialog(view, [item])
     dialog.threshold_input.setValue(20)
-    widget = GamutWidget(dialog, item)
-    worker = GamutPainterThread(widget, item)
+    widget = GamutWidget(dialog, [item])
+    worker = GamutPainterThread(widget, [item])
     mock = MagicMock()
     worker.finished.connect(mock)
     worker.run()
@@ -47,15 +47,137 @@ def test_gamut_painter_thread_generates_image_below_threshold(
     assert image.allGray() is True
 
 
+def test_gamut_painter_thread_uses_cached_gamut(view, item):
+    item.set_color_gamut({(0, 255): 30})
+    item.gamut_image_source = MagicMock()
+    dialog = GamutDialog(view, [item])
+    dialog.threshold_input.setValue(0)
+    worker = GamutPainterThread(dialog.gamut_widget, [item])
+    mock = MagicMock()
+    worker.gamut_calculated.connect(mock)
+    worker.run()
+    mock.assert_not_called()
+    item.gamut_image_source.assert_not_called()
+
+
 def test_gamut_widget_generates_image(view, imgfilename3x3, qtbot):
     item = BeePixmapItem(QtGui.QImage(imgfilename3x3))
     view.scene.addItem(item)
-    dialog = GamutDialog(view, item)
+    dialog = GamutDialog(view, [item])
     dialog.threshold_input.setValue(0)
-    widget = GamutWidget(dialog, item)
+    widget = GamutWidget(dialog, [item])
     assert widget.image is None
     widget.show()
     qtbot.waitUntil(lambda: widget.image is not None)
     assert widget.image.size().width() == 500
     assert widget.image.size().height() == 500
     assert widget.image.allGray() is False
+    qtbot.waitUntil(lambda: item.has_color_gamut())
+
+
+def test_gamut_painter_thread_merges_gamuts(view, item):
+    item.set_color_gamut({(0, 255): 30, (120, 255): 5})
+    item2 = BeePixmapItem(QtGui.QImage())
+    item2.set_color_gamut({(120, 255): 20})
+    dialog = GamutDialog(view, [item, item2])
+    worker = GamutPainterThread(dialog.gamut_widget, [item, item2])
+    worker.calculate_bins()
+    assert worker.bins == [(30, 0, 255), (25, 120, 255)]
+    assert dialog.windowTitle() == 'Color Gamut (2 Images)'
+
+
+def test_gamut_painter_thread_calculates_missing_gamuts(view, item):
+    item.set_color_gamut({(0, 255): 30})
+    img = QtGui.QImage(10, 10, QtGui.QImage.Format.Format_RGB32)
+    img.fill(QtGui.QColor(0, 0, 255))
+    item2 = BeePixmapItem(img)
+    dialog = GamutDialog(view, [item])
+    worker = GamutPainterThread(dialog.gamut_widget, [item, item2])
+    mock = MagicMock()
+    worker.gamut_calculated.connect(mock)
+    worker.calculate_bins()
+    mock.assert_called_once_with(item2, {(240, 255): 100})
+    assert worker.bins == [(100, 240, 255), (30, 0, 255)]
+
+
+def test_gamut_painter_thread_decodes_pending_images_in_worker(
+        view, imgdata3x3):
+    item = BeePixmapItem(QtGui.QImage())
+    item.set_lazy_source(MagicMock(return_value=imgdata3x3))
+    dialog = GamutDialog(view, [])
+    worker = GamutPainterThread(dialog.gamut_widget, [item])
+    item.blob_source.assert_not_called()
+    worker.calculate_bins()
+    item.blob_source.assert_called_once_with()
+    assert item.pixmap_pending is True
+    assert len(worker.bins) > 0
+
+
+def test_gamut_painter_thread_calculate_bins_when_interrupted(view, item):
+    dialog = GamutDialog(view, [])
+    worker = GamutPainterThread(dialog.gamut_widget, [item])
+    worker.isInterruptionRequested = MagicMock(return_value=True)
+    mock = MagicMock()
+    worker.finished.connect(mock)
+    worker.run()
+    assert worker.bins is None
+    assert item in worker.image_sources
+    mock.assert_not_called()
+
+
+def test_gamut_painter_thread_draws_incrementally(view, item):
+    item.set_color_gamut({(0, 255): 30, (120, 255): 5})
+    dialog = GamutDialog(view, [item])
+    dialog.threshold_input.setValue(20)
+    worker = GamutPainterThread(dialog.gamut_widget, [item])
+    worker.run()
+    image = worker.image
+    assert worker.drawn_bins == 1
+    dialog.threshold_input.setValue(0)
+    worker.run()
+    assert worker.image is image
+    assert worker.drawn_bins == 2
+    dialog.threshold_input.setValue(40)
+    worker.run()
+    assert worker.image is not image
+    assert worker.drawn_bins == 0
+
+
+def test_gamut_widget_update_values_restarts_worker(view, item):
+    item.set_color_gamut({(0, 255): 30})
+    dialog = GamutDialog(view, [item])
+    worker = dialog.gamut_widget.worker
+    worker.wait()
+    worker.requestInterruption = MagicMock()
+    worker.wait = MagicMock()
+    worker.start = MagicMock()
+    dialog.gamut_widget.update_values()
+    worker.requestInterruption.assert_called_once_with()
+    worker.wait.assert_called_once_with()
+    worker.start.assert_called_once_with()
+
+
+def test_gamut_widget_update_values_while_calculating(view, item):
+    item.set_color_gamut({(0, 255): 30})
+    dialog = GamutDialog(view, [item])
+    worker = dialog.gamut_widget.worker
+    worker.wait()
+    worker.bins = None
+    worker.isRunning = MagicMock(return_value=True)
+    worker.requestInterruption = MagicMock()
+    worker.wait = MagicMock()
+    worker.start = MagicMock()
+    dialog.gamut_widget.update_values()
+    worker.requestInterruption.assert_not_called()
+    worker.wait.assert_not_called()
+    worker.start.assert_not_called()
+
+
+def test_gamut_dialog_close_interrupts_worker(view, item):
+    item.set_color_gamut({(0, 255): 30})
+    dialog = GamutDialog(view, [item])
+    worker = dialog.gamut_widget.worker
+    worker.wait()
+    worker.requestInterruption = MagicMock()
+    dialog.reject()
+    worker.requestInterruption.assert_called_once_with()
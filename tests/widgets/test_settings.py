@@ -4,8 +4,11 @@ from PyQt6 import QtWidgets
 
 from beeref.widgets.settings import (
     ArrangeGapWidget,
+    AutosaveIntervalWidget,
+    ColorSampleSizeWidget,
     ConfirmCloseUnsavedWidget,
     ImageStorageFormatWidget,
+    PixmapMemoryBudgetWidget,
     SettingsDialog,
 )
 
@@ -119,6 +122,41 @@ def test_confirm_closed_on_restore_defaults(settings, view):
     assert widget.title() == 'Confirm when closing an unsaved file:'
 
 
+def test_autosave_interval_initialises_input_from_settings(settings, view):
+    settings.setValue('Save/autosave_interval', 10)
+    widget = AutosaveIntervalWidget()
+    assert widget.input.value() == 10
+
+
+def test_autosave_interval_saves_change(settings, view):
+    widget = AutosaveIntervalWidget()
+    widget.set_value(0)
+    assert settings.valueOrDefault('Save/autosave_interval') == 0
+    assert widget.title() == 'Autosave Interval: ✎'
+
+
+def test_pixmap_memory_budget_initialises_input_from_settings(
+        settings, view):
+    settings.setValue('Items/pixmap_memory_budget', 500)
+    widget = PixmapMemoryBudgetWidget()
+    assert widget.input.value() == 500
+
+
+def test_pixmap_memory_budget_saves_change(settings, view):
+    widget = PixmapMemoryBudgetWidget()
+    widget.set_value(0)
+    assert settings.valueOrDefault('Items/pixmap_memory_budget') == 0
+    assert widget.title() == 'Image Memory Budget: ✎'
+
+
+def test_color_sample_size_saves_change(settings, view):
+    widget = ColorSampleSizeWidget()
+    assert widget.input.value() == 1
+    widget.set_value(5)
+    assert settings.valueOrDefault('Items/color_sample_size') == 5
+    assert widget.title() == 'Color Sample Size: ✎'
+
+
 @patch('PyQt6.QtWidgets.QMessageBox.question',
        return_value=QtWidgets.QMessageBox.StandardButton.Yes)
 def test_settings_dialog_on_restore_defaults(msg_mock, settings, view):